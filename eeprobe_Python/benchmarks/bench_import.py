@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Import-time benchmark of embrace_eep.
+
+Imports each module in a fresh interpreter with 'python -X importtime',
+reports the slowest imports and checks that the total import time is within
+the budget and that the heavy dependencies (MNE, pandas) are not imported.
+Exits with an error if any check fails.
+
+Run from this folder (with the package installed or in the path):
+    python bench_import.py [--budget seconds] [--repeat n]
+
+"""
+
+import re
+import sys
+import argparse
+import subprocess
+
+
+# Lists the modules to import and the modules that must not be imported.
+modules  = ( 'embrace_eep.eep', 'embrace_eep.cli' )
+deferred = ( 'mne', 'pandas' )
+
+
+# Function to import a module in a fresh interpreter and get the import
+# time of each module, as {module: (self, cumulative)} in seconds.
+def measure ( module ):
+    
+    
+    # Imports the module with the import profiler.
+    result   = subprocess.run (
+        [ sys.executable, '-X', 'importtime', '-c', 'import %s' % module ],
+        capture_output = True, text = True, check = True )
+    
+    # Parses the profile: "import time: self [us] | cumulative | imported package".
+    times    = {}
+    for line in result.stderr.splitlines ():
+        hits     = re.match ( r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)', line )
+        if hits:
+            times [ hits [4] ] = ( int ( hits [1] ) / 1e6, int ( hits [2] ) / 1e6 )
+    
+    
+    # Returns the import times.
+    return times
+
+
+
+# Main function.
+def main ():
+    
+    
+    # Parses the arguments.
+    parser   = argparse.ArgumentParser ( description = 'Import-time benchmark of embrace_eep.' )
+    parser.add_argument ( '--budget', type = float, default = 0.5, help = 'maximum import time, in seconds (default: 0.5)' )
+    parser.add_argument ( '--repeat', type = int, default = 5, help = 'number of imports, keeping the fastest (default: 5)' )
+    args     = parser.parse_args ()
+    
+    # Goes through each module.
+    failed   = False
+    for module in modules:
+        
+        # Keeps the fastest import (the first one may warm the disk cache).
+        runs     = [ measure ( module ) for _ in range ( args.repeat ) ]
+        times    = min ( runs, key = lambda times: times [ module ] [1] )
+        total    = times [ module ] [1]
+        
+        # Reports the total time and the slowest imports.
+        print ( '%s: %.3f s (budget %.3f s)' % ( module, total, args.budget ) )
+        for name, ( self, _ ) in sorted ( times.items (), key = lambda item: -item [1] [0] ) [ :5 ]:
+            print ( '    %-40s %.3f s' % ( name, self ) )
+        
+        # Checks the budget and the deferred imports.
+        loaded   = [ name for name in deferred if name in times ]
+        if total > args.budget:
+            print ( '    FAILED: over budget.' )
+            failed   = True
+        if loaded:
+            print ( '    FAILED: imports %s.' % ', '.join ( loaded ) )
+            failed   = True
+    
+    
+    # Returns the status.
+    return 1 if failed else 0
+
+
+
+if __name__ == '__main__':
+    sys.exit ( main () )
@@ -0,0 +1,310 @@
+/*  Microbenchmark of the raw3 decoder in raweep.h.
+ *
+ *  Encodes a synthetic multichannel signal with each compression method
+ *  (0/1/2/3 and 8/9/10/11) and reports the decoding speed, in MB/s of
+ *  decoded (int32) samples, of:
+ *  * read_block, which reconstructs the samples while decoding.
+ *  * A two-pass decoder: the same bit reader followed by apply_residuals.
+ *  * The original decoder: bin2int32 with a pow() per sample, plus
+ *    apply_residuals.
+ *
+ *  Build and run from this folder:
+ *      cc -O2 -I../src/embrace_eep/src bench_raweep.c -o bench_raweep -lm
+ *      ./bench_raweep [samples per epoch] [channels] [repetitions]
+ */
+
+#include <stdlib.h>
+#include <math.h>
+#include <time.h>
+#include "raweep.h"
+
+
+/* Minimal big-endian bit writer (the buffer must be zeroed). */
+typedef struct {
+    uint8_t * byte;
+    uint64_t pos;
+} bitwriter;
+
+
+static void bw_write ( bitwriter *bw, uint32_t value, uint32_t length ) {
+
+    uint32_t index;
+
+    for ( index = length; index-- > 0; bw->pos ++ ) {
+        if ( ( value >> index ) & 1 )
+            bw->byte [ bw->pos / 8 ] |= 0x80 >> ( bw->pos % 8 );
+    }
+}
+
+
+/* Gets the number of bits of a signed residual (the lowest value is reserved). */
+static uint32_t residual_bits ( int32_t value ) {
+
+    uint32_t length = 1;
+
+    while ( length < 32 && ! ( -( ( int64_t ) 1 << ( length - 1 ) ) < value && value < ( ( int64_t ) 1 << ( length - 1 ) ) ) )
+        length ++;
+
+    return length;
+}
+
+
+/* Encodes one channel with the given method. */
+static void encode_channel ( bitwriter *bw, const int32_t *data, const int32_t *prev, uint64_t nsamp, uint32_t method ) {
+
+    uint32_t mbit, dbit, nbit, xbit, length, count [33] = { 0 };
+    uint64_t index, size, best;
+    int32_t * res;
+
+
+    mbit   =  4 + ( ( method & 8 ) >> 2 );
+    dbit   = 16 + ( ( method & 8 ) << 1 );
+
+    bw_write ( bw, method, 4 );
+
+    /* Writes the samples as they are. */
+    if ( ( method & 7 ) == 0 ) {
+        bw_write ( bw, 0, 4 );
+        for ( index = 0; index < nsamp; index ++ )
+            bw_write ( bw, data [ index ], dbit );
+        bw->pos = 8 * ( ( bw->pos + 7 ) / 8 );
+        return;
+    }
+
+
+    /* Calculates the residuals. */
+    res    = calloc ( nsamp, sizeof ( *res ) );
+    for ( index = 1; index < nsamp; index ++ ) {
+        switch ( method & 7 ) {
+            case 1: res [ index ] = data [ index ] - data [ index - 1 ]; break;
+            case 2: res [ index ] = index == 1 ? data [1] - data [0] : data [ index ] - 2 * data [ index - 1 ] + data [ index - 2 ]; break;
+            case 3: res [ index ] = data [ index ] - data [ index - 1 ] - ( prev [ index ] - prev [ index - 1 ] ); break;
+        }
+        count [ residual_bits ( res [ index ] ) ] ++;
+    }
+
+    /* Selects the residual lengths that minimize the size. */
+    for ( xbit = 32; xbit > 1 && count [ xbit ] == 0; xbit -- );
+    nbit   = xbit;
+    best   = ( uint64_t ) -1;
+    for ( length = 2; length <= xbit; length ++ ) {
+        size   = 0;
+        for ( index = 1; index <= 32; index ++ )
+            size  += count [ index ] * ( length + ( index > length ? xbit : 0 ) );
+        if ( size < best ) {
+            best   = size;
+            nbit   = length;
+        }
+    }
+
+
+    /* Writes the header, the first sample, and the residuals. */
+    bw_write ( bw, nbit, mbit );
+    bw_write ( bw, xbit, mbit );
+    bw_write ( bw, data [0], dbit );
+    for ( index = 1; index < nsamp; index ++ ) {
+        if ( nbit != xbit && residual_bits ( res [ index ] ) > nbit ) {
+            bw_write ( bw, ( uint32_t ) ( - ( ( int64_t ) 1 << ( nbit - 1 ) ) ), nbit );
+            bw_write ( bw, res [ index ], xbit );
+        } else {
+            bw_write ( bw, res [ index ], nbit );
+        }
+    }
+    bw->pos = 8 * ( ( bw->pos + 7 ) / 8 );
+
+    free ( res );
+}
+
+
+/* Original decoder: re-derives the byte position and calls pow() per sample. */
+static int64_t legacy_read_channel ( int32_t *data, const uint8_t *byte, int64_t off, uint64_t nsamp, uint32_t method ) {
+
+    uint32_t mbit, dbit, nbit, xbit;
+    uint64_t index;
+    int32_t datum;
+
+    mbit   =  4 + ( ( method & 8 ) >> 2 );
+    dbit   = 16 + ( ( method & 8 ) << 1 );
+
+    if ( ( method & 7 ) == 0 ) {
+        nbit   = dbit;
+        xbit   = 0;
+        off   += 4;
+    } else {
+        nbit   = bin2uint32 ( byte, off, mbit );
+        off   += mbit;
+        xbit   = bin2uint32 ( byte, off, mbit );
+        off   += mbit;
+        if ( xbit == nbit ) xbit = 0;
+    }
+
+    data [0] = bin2int32 ( byte, off, dbit );
+    off   += dbit;
+
+    for ( index = 1; index < nsamp; index ++ ) {
+        datum  = bin2int32 ( byte, off, nbit );
+        off   += nbit;
+        if ( xbit && ( datum == -pow ( 2, nbit - 1 ) ) ) {
+            datum  = bin2int32 ( byte, off, xbit );
+            off   += xbit;
+        }
+        data [ index ] = datum;
+    }
+
+    return 8 * ( ( off - 1 ) / 8 + 1 );
+}
+
+
+static int64_t legacy_read_block ( int32_t *data, const uint8_t *byte, int64_t off, uint64_t nsamp, uint64_t nchan ) {
+
+    uint64_t index;
+    uint32_t method;
+
+    for ( index = 0; index < nchan; index ++ ) {
+        method = bin2uint32 ( byte, off, 4 );
+        off   += 4;
+        off    = legacy_read_channel ( data + ( index * nsamp ), byte, off, nsamp, method );
+        apply_residuals ( data + ( index * nsamp ), nsamp, method );
+    }
+
+    return off;
+}
+
+
+/* Two-pass decoder: reads the residuals, then expands them with apply_residuals. */
+static int64_t twopass_read_block ( int32_t *data, const uint8_t *byte, uint64_t size, int64_t off, uint64_t nsamp, uint64_t nchan ) {
+
+    uint64_t index, cindex;
+    uint32_t method, mbit, dbit, nbit, xbit;
+    int32_t * chan, datum, escape;
+    bitreader br;
+
+    br_init ( &br, byte, size, off );
+
+    for ( cindex = 0; cindex < nchan; cindex ++ ) {
+        chan   = data + cindex * nsamp;
+        method = br_read_uint ( &br, 4 );
+        mbit   =  4 + ( ( method & 8 ) >> 2 );
+        dbit   = 16 + ( ( method & 8 ) << 1 );
+
+        if ( ( method & 7 ) == 0 ) {
+            br_read_uint ( &br, 4 );
+            for ( index = 0; index < nsamp; index ++ )
+                chan [ index ] = br_read_int ( &br, dbit );
+        } else {
+            nbit   = br_read_uint ( &br, mbit );
+            xbit   = br_read_uint ( &br, mbit );
+            escape = ( int32_t ) ( - ( ( int64_t ) 1 << ( nbit - 1 ) ) );
+            chan [0] = br_read_int ( &br, dbit );
+            for ( index = 1; index < nsamp; index ++ ) {
+                datum  = br_read_int ( &br, nbit );
+                if ( xbit != nbit && datum == escape )
+                    datum  = br_read_int ( &br, xbit );
+                chan [ index ] = datum;
+            }
+            apply_residuals ( chan, nsamp, method );
+        }
+
+        br_align ( &br );
+    }
+
+    return br_offset ( &br );
+}
+
+
+static double now ( void ) {
+
+    struct timespec ts;
+
+    timespec_get ( &ts, TIME_UTC );
+    return ts.tv_sec + 1e-9 * ts.tv_nsec;
+}
+
+
+int main ( int argc, char *argv [] ) {
+
+    static const uint32_t methods [] = { 0, 1, 2, 3, 8, 9, 10, 11 };
+    uint64_t nsamp  = argc > 1 ? strtoull ( argv [1], NULL, 10 ) : 2048;
+    uint64_t nchan  = argc > 2 ? strtoull ( argv [2], NULL, 10 ) : 64;
+    uint64_t nrep   = argc > 3 ? strtoull ( argv [3], NULL, 10 ) : 200;
+    uint64_t index, cindex, rep, mindex;
+    int32_t * signal, * data, * check, * twopass;
+    bitwriter bw;
+    double amp, tic, tnew, ttwo, told, mbytes;
+    int64_t off;
+
+
+    signal = malloc ( nsamp * nchan * sizeof ( *signal ) );
+    data   = malloc ( nsamp * nchan * sizeof ( *data ) );
+    check  = malloc ( nsamp * nchan * sizeof ( *check ) );
+    twopass = malloc ( nsamp * nchan * sizeof ( *twopass ) );
+
+    printf ( "%llu samples x %llu channels per epoch, %llu repetitions.\n\n",
+        ( unsigned long long ) nsamp, ( unsigned long long ) nchan, ( unsigned long long ) nrep );
+    printf ( "method  bits/sample  read_block MB/s  two-pass MB/s  original MB/s  vs two-pass  vs original\n" );
+
+    for ( mindex = 0; mindex < sizeof ( methods ) / sizeof ( *methods ); mindex ++ ) {
+
+        /* Builds an EEG-like signal: slow oscillations plus noise and a
+         * few spikes, with a larger amplitude for the 32-bit methods. */
+        srand ( 1 );
+        amp    = methods [ mindex ] & 8 ? 200000 : 2000;
+        for ( cindex = 0; cindex < nchan; cindex ++ ) {
+            for ( index = 0; index < nsamp; index ++ ) {
+                signal [ cindex * nsamp + index ] = ( int32_t ) (
+                    amp * sin ( 2 * 3.14159265 * index / ( 200.0 + cindex ) ) +
+                    amp / 100 * ( rand () / ( double ) RAND_MAX - 0.5 ) +
+                    ( rand () % 500 == 0 ? amp / 4 : 0 ) );
+            }
+        }
+
+        /* Encodes the epoch (the first channel cannot use method 3/11). */
+        bw.byte = calloc ( 8 * nsamp * nchan + 64, 1 );
+        bw.pos  = 0;
+        for ( cindex = 0; cindex < nchan; cindex ++ ) {
+            encode_channel ( &bw, signal + cindex * nsamp, signal + ( cindex - ( cindex > 0 ) ) * nsamp, nsamp,
+                cindex == 0 && ( methods [ mindex ] & 7 ) == 3 ? methods [ mindex ] - 2 : methods [ mindex ] );
+        }
+
+
+        /* Checks both decoders. */
+        off    = read_block ( data, bw.byte, bw.pos / 8, 0, nsamp, nchan );
+        legacy_read_block ( check, bw.byte, 0, nsamp, nchan );
+        twopass_read_block ( twopass, bw.byte, bw.pos / 8, 0, nsamp, nchan );
+        if ( off != ( int64_t ) bw.pos || memcmp ( data, signal, nsamp * nchan * sizeof ( *data ) ) ||
+                memcmp ( check, signal, nsamp * nchan * sizeof ( *data ) ) || memcmp ( twopass, signal, nsamp * nchan * sizeof ( *data ) ) ) {
+            printf ( "%6u  decoding error!\n", methods [ mindex ] );
+            return 1;
+        }
+
+        /* Times both decoders. */
+        tic    = now ();
+        for ( rep = 0; rep < nrep; rep ++ )
+            read_block ( data, bw.byte, bw.pos / 8, 0, nsamp, nchan );
+        tnew   = now () - tic;
+
+        tic    = now ();
+        for ( rep = 0; rep < nrep; rep ++ )
+            twopass_read_block ( twopass, bw.byte, bw.pos / 8, 0, nsamp, nchan );
+        ttwo   = now () - tic;
+
+        tic    = now ();
+        for ( rep = 0; rep < nrep; rep ++ )
+            legacy_read_block ( check, bw.byte, 0, nsamp, nchan );
+        told   = now () - tic;
+
+        mbytes = nrep * nsamp * nchan * sizeof ( *data ) / 1e6;
+        printf ( "%6u  %11.2f  %15.1f  %13.1f  %13.1f  %10.2fx  %10.2fx\n",
+            methods [ mindex ], ( double ) bw.pos / ( nsamp * nchan ),
+            mbytes / tnew, mbytes / ttwo, mbytes / told, ttwo / tnew, told / tnew );
+
+        free ( bw.byte );
+    }
+
+    free ( signal );
+    free ( data );
+    free ( check );
+    free ( twopass );
+
+    return 0;
+}
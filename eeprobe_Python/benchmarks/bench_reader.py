@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the reader hot paths on synthetic CNT files.
+
+Generates synthetic CNT files (see synthetic.py) for each combination of
+channels, duration, segments and event rate, and times each stage of the
+reader separately:
+* riff.read_file: full read of the RIFF tree.
+* read_info:      header and sidecar files (without the memo).
+* read_evt:       sidecar event file.
+* read_block:     raweep.read_block over all the epochs, one by one.
+* read_data:      calibrated data, all the channels.
+* read_mne:       MNE Raw object, preloaded.
+
+Each stage runs in a fresh process, so the peak resident memory (RSS) is
+measured per stage. The best wall time over the repetitions is reported,
+with the throughput in MB/s of the input (parsers) or of the decoded int32
+samples (decoders). The results are stored as JSON, and can be compared
+with a previous run to spot regressions.
+
+Run from this folder (with the package installed or in the path):
+    python bench_reader.py [--channels 32 64 256] [--output results.json]
+    python bench_reader.py --compare old.json new.json
+
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+
+# Lists the stages, in order.
+stages   = ( 'riff.read_file', 'read_info', 'read_evt', 'read_block', 'read_data', 'read_mne' )
+
+
+
+"""
+Code for running one stage (in a child process).
+"""
+
+# Function to get the peak resident memory of this process, in MB.
+def peak_rss ():
+    
+    
+    # In Linux, reads the high water mark of this process (ru_maxrss is
+    # inherited from the parent process through exec).
+    try:
+        with open ( '/proc/self/status' ) as fid:
+            for line in fid:
+                if line.startswith ( 'VmHWM:' ):
+                    return int ( line.split () [1] ) / 2 ** 10
+    except OSError:
+        pass
+    
+    # Otherwise uses the resource module, if available (bytes in macOS).
+    try:
+        import resource
+    except ImportError:
+        return float ( 'nan' )
+    
+    peak     = resource.getrusage ( resource.RUSAGE_SELF ).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+
+# Function to time one stage on one file.
+def run_stage ( stage, filename, repeat ):
+    
+    
+    # Imports all the modules, so they do not count as part of the stage.
+    from embrace_eep import eep
+    from embrace_eep import raweep
+    from embrace_eep.tools import mnetools
+    from embrace_eep.tools import riff
+    
+    # Gets the file information and the size of the decoded data.
+    info     = eep.read_info ( filename )
+    rawdata  = eep.read_rawdata ( filename )
+    decoded  = 4 * info [ 'sample_count' ] * info [ 'channel_count' ]
+    evtfile  = filename [ :-4 ] + '.evt'
+    sidecars = sum ( os.path.getsize ( name ) for name in eep.list_sidecars ( filename ) )
+    
+    
+    # Function to decode all the epochs with read_block.
+    def read_blocks ():
+        nepoch   = rawdata [ 'epoch_count' ]
+        nsamp    = info [ 'sample_count' ]
+        for eindex, start in enumerate ( rawdata [ 'epoch_start' ] ):
+            length   = min ( rawdata [ 'epoch_length' ], nsamp - eindex * rawdata [ 'epoch_length' ] )
+            raweep.read_block ( rawdata [ 'data' ], length, info [ 'channel_count' ], 8 * start )
+        return nepoch
+    
+    # Function to read the header without the memo.
+    def read_info ():
+        eep.clear_memo ()
+        return eep.read_info ( filename )
+    
+    
+    # Defines each stage as (function, bytes processed).
+    functions = {
+        'riff.read_file': ( lambda: riff.read_file ( filename ),           os.path.getsize ( filename ) ),
+        'read_info':      ( read_info,                                     sidecars ),
+        'read_evt':       ( lambda: eep.read_evt ( evtfile ),              os.path.getsize ( evtfile ) ),
+        'read_block':     ( read_blocks,                                   decoded ),
+        'read_data':      ( lambda: eep.read_data ( filename ),            decoded ),
+        'read_mne':       ( lambda: eep.read_mne ( filename ),             decoded ) }
+    function, nbytes = functions [ stage ]
+    
+    # Gets the memory use before running the stage.
+    baseline = peak_rss ()
+    
+    
+    # Runs the stage several times, keeping the best time.
+    times    = []
+    for _ in range ( repeat ):
+        tstart   = time.perf_counter ()
+        result   = function ()
+        times.append ( time.perf_counter () - tstart )
+        del result
+    
+    
+    # Returns the results.
+    return {
+        'seconds':      min ( times ),
+        'bytes':        nbytes,
+        'mb_per_s':     nbytes / 1e6 / min ( times ),
+        'peak_rss_mb':  peak_rss (),
+        'base_rss_mb':  baseline }
+
+
+
+"""
+Code for running the whole benchmark.
+"""
+
+# Function to get the current commit, if any.
+def get_commit ():
+    
+    try:
+        return subprocess.run (
+            [ 'git', 'rev-parse', '--short', 'HEAD' ],
+            capture_output = True, text = True, check = True,
+            cwd = os.path.dirname ( os.path.abspath ( __file__ ) ) ).stdout.strip ()
+    except ( OSError, subprocess.CalledProcessError ):
+        return None
+
+
+
+# Function to run the benchmark over all the configurations.
+def run ( args ):
+    
+    
+    # Imports the generator.
+    import numpy
+    import synthetic
+    
+    
+    # Initializes the results.
+    results  = {
+        'commit':    get_commit (),
+        'python':    platform.python_version (),
+        'numpy':     numpy.__version__,
+        'platform':  platform.platform (),
+        'cpu_count': os.cpu_count (),
+        'results':   [] }
+    
+    # Goes through each configuration.
+    with tempfile.TemporaryDirectory () as folder:
+        for nchan in args.channels:
+            for duration in args.duration:
+                for nsegment in args.segments:
+                    for event_rate in args.events:
+                        
+                        # Generates the file.
+                        config   = {
+                            'channels':   nchan,
+                            'duration':   duration,
+                            'segments':   nsegment,
+                            'event_rate': event_rate }
+                        filename = os.path.join ( folder, 'bench.cnt' )
+                        synthetic.make_cnt ( filename, nchan = nchan, duration = duration, nsegment = nsegment, event_rate = event_rate, methods = args.methods )
+                        
+                        # Runs each stage in a fresh process.
+                        for stage in args.stages:
+                            output   = subprocess.run (
+                                [ sys.executable, os.path.abspath ( __file__ ), '--run-stage', stage, filename, '--repeat', str ( args.repeat ) ],
+                                capture_output = True, text = True, check = True )
+                            result   = dict ( config, stage = stage, **json.loads ( output.stdout ) )
+                            results [ 'results' ].append ( result )
+                            
+                            print ( '%4i ch %6.0f s %3i seg %5.1f ev/s  %-15s %9.4f s %9.1f MB/s %8.1f MB' % (
+                                nchan, duration, nsegment, event_rate, stage,
+                                result [ 'seconds' ], result [ 'mb_per_s' ], result [ 'peak_rss_mb' ] ) )
+    
+    
+    # Writes the results.
+    with open ( args.output, 'w' ) as fid:
+        json.dump ( results, fid, indent = 2 )
+    print ( 'Results written to %s.' % args.output )
+
+
+
+# Function to compare two result files.
+def compare ( oldfile, newfile ):
+    
+    
+    # Reads the results.
+    with open ( oldfile ) as fid:
+        old      = json.load ( fid )
+    with open ( newfile ) as fid:
+        new      = json.load ( fid )
+    
+    # Indexes the old results by configuration and stage.
+    keys     = ( 'channels', 'duration', 'segments', 'event_rate', 'stage' )
+    previous = { tuple ( result [ key ] for key in keys ): result for result in old [ 'results' ] }
+    
+    
+    # Prints the ratio of the times (above 1 is slower).
+    print ( 'Time ratio %s / %s (above 1 is slower):' % ( new.get ( 'commit' ), old.get ( 'commit' ) ) )
+    for result in new [ 'results' ]:
+        key      = tuple ( result [ key ] for key in keys )
+        if key in previous:
+            print ( '%4i ch %6.0f s %3i seg %5.1f ev/s  %-15s %6.2f' % ( key + ( result [ 'seconds' ] / previous [ key ] [ 'seconds' ], ) ) )
+
+
+
+# Main function.
+def main ():
+    
+    
+    # Parses the arguments.
+    parser   = argparse.ArgumentParser ( description = 'Benchmark of the reader hot paths on synthetic CNT files.' )
+    parser.add_argument ( '--channels', type = int, nargs = '+', default = [ 32, 64, 256 ], help = 'number of channels (default: 32 64 256)' )
+    parser.add_argument ( '--duration', type = float, nargs = '+', default = [ 60.0 ], help = 'durations, in seconds (default: 60)' )
+    parser.add_argument ( '--segments', type = int, nargs = '+', default = [ 1 ], help = 'number of segments (default: 1)' )
+    parser.add_argument ( '--events', type = float, nargs = '+', default = [ 1.0 ], help = 'events per second (default: 1)' )
+    parser.add_argument ( '--methods', type = int, nargs = '+', default = [ 0, 1, 2, 3, 8, 9, 10, 11 ], help = 'raw3 compression methods (default: all)' )
+    parser.add_argument ( '--stages', nargs = '+', choices = stages, default = list ( stages ), help = 'stages to time (default: all)' )
+    parser.add_argument ( '--repeat', type = int, default = 3, help = 'repetitions of each stage (default: 3)' )
+    parser.add_argument ( '--output', default = 'bench_reader.json', help = 'JSON file for the results' )
+    parser.add_argument ( '--compare', nargs = 2, metavar = ( 'OLD', 'NEW' ), help = 'compare two result files' )
+    parser.add_argument ( '--run-stage', nargs = 2, metavar = ( 'STAGE', 'FILE' ), help = argparse.SUPPRESS )
+    args     = parser.parse_args ()
+    
+    
+    # Runs one stage, in a child process.
+    if args.run_stage:
+        print ( json.dumps ( run_stage ( args.run_stage [0], args.run_stage [1], args.repeat ) ) )
+    
+    # Compares two result files.
+    elif args.compare:
+        compare ( *args.compare )
+    
+    # Runs the benchmark.
+    else:
+        run ( args )
+
+
+
+if __name__ == '__main__':
+    main ()
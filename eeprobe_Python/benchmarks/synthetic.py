@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Generator of synthetic EEProbe (CNT) files for the benchmarks.
+
+Writes RIFF or RF64 CNT files with a raw3 data stream compressed with the
+requested methods (0-3, 16 bits, and 8-11, 32 bits), cycling through them
+by channel and epoch, plus the sidecar segment (*.seg) and event (*.evt)
+files. The encoder is written with NumPy, independently of the decoder.
+
+"""
+
+import struct
+
+import numpy
+
+
+# Lists the standard 10-05 labels used for the first channels.
+labels   = (
+    'Fp1', 'Fpz', 'Fp2', 'F7', 'F3', 'Fz', 'F4', 'F8', 'FC5', 'FC1', 'FC2',
+    'FC6', 'M1', 'T7', 'C3', 'Cz', 'C4', 'T8', 'M2', 'CP5', 'CP1', 'CP2',
+    'CP6', 'P7', 'P3', 'Pz', 'P4', 'P8', 'POz', 'O1', 'Oz', 'O2' )
+
+# Offset, in days, of the Unix epoch in the (OLE) dates of the files.
+unixday  = 2209161600 / ( 60 * 60 * 24 )
+
+
+
+"""
+Code for encoding the raw3 data stream.
+"""
+
+# Function to get the number of bits needed to store each (signed) value,
+# keeping the most negative value free, as it marks the escaped residuals.
+def count_bits ( values ):
+    return numpy.frexp ( numpy.abs ( values ).astype ( 'float64' ) ) [1] + 1
+
+
+
+# Function to pack a list of (value, length) bit fields, MSB first.
+def pack_fields ( values, lengths ):
+    
+    
+    # Gets the field and the bit (MSB first) of each output bit.
+    lengths  = numpy.asarray ( lengths, dtype = 'int64' )
+    field    = numpy.repeat ( numpy.arange ( len ( lengths ) ), lengths )
+    bit      = numpy.arange ( len ( field ) ) - numpy.repeat ( numpy.cumsum ( lengths ) - lengths, lengths )
+    shift    = ( lengths [ field ] - 1 - bit ).astype ( 'uint64' )
+    
+    # Gets the bits.
+    values   = numpy.asarray ( values, dtype = 'int64' ).astype ( 'uint64' )
+    bits     = ( values [ field ] >> shift ) & numpy.uint64 ( 1 )
+    
+    
+    # Returns the packed bytes.
+    return numpy.packbits ( bits.astype ( 'uint8' ) ).tobytes ()
+
+
+
+# Function to get the bit fields of a channel, ending at a byte boundary.
+def encode_channel ( samples, method, previous = None ):
+    
+    
+    # Gets the sizes of the fields for the method.
+    dbit     = 32 if method & 8 else 16
+    mbit     = 6 if method & 8 else 4
+    samples  = numpy.asarray ( samples, dtype = 'int64' )
+    
+    # Initializes the fields with the method.
+    values   = [ numpy.array ( [ method ] ) ]
+    lengths  = [ numpy.array ( [ 4 ] ) ]
+    
+    
+    # Method 0 stores the samples after four padding bits.
+    if method & 7 == 0:
+        values  += [ numpy.array ( [ 0 ] ), samples ]
+        lengths += [ numpy.array ( [ 4 ] ), numpy.full ( len ( samples ), dbit ) ]
+    
+    # Other methods store the residuals of a prediction.
+    else:
+        
+        # Gets the residuals: first derivative, second derivative or first
+        # derivative respect to the previous channel.
+        residual = numpy.diff ( samples )
+        if method & 7 == 2:
+            residual [ 1: ] = numpy.diff ( samples, 2 )
+        if method & 7 == 3:
+            residual = residual - numpy.diff ( previous )
+        
+        # Selects the shortest encoding: residuals stored with nbit bits,
+        # escaping the rest with a marker followed by xbit bits.
+        need     = count_bits ( residual ) if len ( residual ) else numpy.array ( [ 2 ] )
+        xbit     = int ( max ( need.max (), 2 ) )
+        
+        # If the residuals do not fit, stores the samples instead.
+        if xbit >= 2 ** mbit:
+            return encode_channel ( samples, method & 8 )
+        
+        sizes    = numpy.arange ( 2, xbit + 1 )
+        cost     = [ len ( need ) * nbit + numpy.count_nonzero ( need > nbit ) * xbit for nbit in sizes ]
+        nbit     = int ( sizes [ numpy.argmin ( cost ) ] )
+        escape   = need > nbit
+        
+        # Builds the residual fields, adding the escape markers.
+        nfield   = len ( residual ) + numpy.count_nonzero ( escape )
+        where    = numpy.arange ( len ( residual ) ) + numpy.cumsum ( escape )
+        rvalues  = numpy.empty ( nfield, dtype = 'int64' )
+        rlengths = numpy.full ( nfield, nbit )
+        rvalues [ where ]  = residual
+        rlengths [ where [ escape ] ] = xbit
+        rvalues [ where [ escape ] - 1 ] = -2 ** ( nbit - 1 )
+        
+        values  += [ numpy.array ( [ nbit, xbit, samples [0] ] ), rvalues ]
+        lengths += [ numpy.array ( [ mbit, mbit, dbit ] ), rlengths ]
+    
+    
+    # Pads the channel to a byte boundary.
+    total    = sum ( int ( length.sum () ) for length in lengths )
+    values  += [ numpy.array ( [ 0 ] ) ]
+    lengths += [ numpy.array ( [ -total % 8 ] ) ]
+    
+    
+    # Returns the fields.
+    return numpy.concatenate ( values ), numpy.concatenate ( lengths )
+
+
+
+# Function to encode one epoch of (channels x samples) data in stream order.
+def encode_epoch ( block, methods ):
+    
+    
+    # Goes through each channel.
+    values   = []
+    lengths  = []
+    for cindex, method in enumerate ( methods ):
+        
+        # The first channel cannot be predicted from the previous one.
+        if cindex == 0 and method & 7 == 3:
+            method  -= 2
+        
+        fields   = encode_channel ( block [ cindex ], method, block [ cindex - 1 ] if cindex else None )
+        values.append ( fields [0] )
+        lengths.append ( fields [1] )
+    
+    
+    # Returns the packed epoch.
+    return pack_fields ( numpy.concatenate ( values ), numpy.concatenate ( lengths ) )
+
+
+
+"""
+Code for writing the files.
+"""
+
+# Function to get the channel labels: the standard ones first, followed by
+# the other 10-05 positions (if MNE is available) or by numbered channels.
+def get_labels ( nchan ):
+    
+    
+    # Starts with the standard labels.
+    labelset = list ( labels )
+    
+    # Adds the other 10-05 positions, if MNE is available.
+    try:
+        import mne
+        extra    = mne.channels.make_standard_montage ( 'standard_1005' ).ch_names
+        labelset += [ label for label in extra if label not in labelset ]
+    except ImportError:
+        pass
+    
+    # Adds numbered channels, if required.
+    labelset += [ 'E%i' % cindex for cindex in range ( len ( labelset ), nchan ) ]
+    
+    
+    # Returns the labels.
+    return labelset [ :nchan ]
+
+
+
+# Function to build a RIFF chunk (with 4 or 8 bytes for the size).
+def build_chunk ( label, payload, psize ):
+    
+    # Pads the chunk to an even size.
+    padding  = b'\0' * ( len ( payload ) % 2 )
+    return label.encode () + len ( payload ).to_bytes ( psize, 'little' ) + payload + padding
+
+
+
+# Function to build a sidecar event file with markers at the given times.
+# 'classes' sets the class of each event (by default, all markers), and
+# 'version' and 'flags' the file version and the display flags of the
+# markers (amplitude and duration), stored depending on the version.
+def build_evt ( times, names, classes = None, version = 103, flags = ( 0, 0 ) ):
+    
+    
+    # Function to build a string and a class name.
+    def string ( text ):
+        text     = text.encode ()
+        return struct.pack ( '<B', len ( text ) ) + text
+    
+    def cname ( text ):
+        return struct.pack ( '<i', -1 ) + string ( text )
+    
+    
+    # Builds the header and the library.
+    parts    = [
+        struct.pack ( '<3Iiii', 0, 0, 0, version, 0, 0 ),
+        cname ( 'class dcEventsLibrary_c' ), string ( 'Synthetic' ),
+        struct.pack ( '<I', len ( times ) ) ]
+    
+    # Builds each event.
+    classes  = [ 'class dcEventMarker_c' ] * len ( times ) if classes is None else classes
+    for eindex, ( time, name, eclass ) in enumerate ( zip ( times, names, classes ) ):
+        day, fraction = divmod ( time, 60 * 60 * 24 )
+        parts += [
+            cname ( eclass ),
+            struct.pack ( '<i16x', eindex ),
+            cname ( eclass ), string ( name ), string ( name ),
+            struct.pack ( '<iibdddd', 1, eindex % 256, 0, 0.0, 0.0, day + unixday, fraction ),
+            struct.pack ( '<i', 0 ) ]
+        
+        # The epoch events have no marker fields.
+        if eclass == 'class dcEpochEvent_c':
+            continue
+        
+        # Adds the channels, the description and the display flags.
+        parts += [ string ( '' ), string ( '' ), string ( name ) ]
+        if version >= 103:
+            parts.append ( struct.pack ( '<ib', *flags ) )
+        elif version >= 35:
+            parts.append ( struct.pack ( '<bb', *flags ) )
+    
+    
+    # Returns the file contents.
+    return b''.join ( parts )
+
+
+
+# Function to write a synthetic CNT file and its sidecar files.
+# Returns the (samples x channels) int32 data written.
+def make_cnt ( filename, nchan = 32, duration = 60.0, sample_rate = 500.0,
+               methods = ( 0, 1, 2, 3, 8, 9, 10, 11 ), nsegment = 1,
+               event_rate = 1.0, epoch_length = None, rf64 = True, seed = 0 ):
+    
+    
+    # Gets the dimensions of the data.
+    nsamp    = int ( duration * sample_rate )
+    sepoch   = int ( epoch_length or sample_rate )
+    rng      = numpy.random.default_rng ( seed )
+    
+    # Generates smooth signals (integrated noise) with some spikes, which
+    # fit in 16 bits and exercise the escaped residuals.
+    noise    = rng.normal ( 0, 40, ( nsamp, nchan ) )
+    data     = numpy.cumsum ( noise, axis = 0 )
+    data    -= data.mean ( axis = 0 )
+    data     = 2000 * data / max ( numpy.abs ( data ).max (), 1 )
+    data    += 500 * ( rng.random ( data.shape ) < 1e-3 )
+    data     = numpy.clip ( data, -32000, 32000 ).astype ( 'int32' )
+    
+    
+    # Encodes each epoch, cycling through the methods.
+    blobs    = []
+    starts   = []
+    position = 0
+    for eindex, first in enumerate ( range ( 0, nsamp, sepoch ) ):
+        emethods = [ methods [ ( cindex + eindex ) % len ( methods ) ] for cindex in range ( nchan ) ]
+        blob     = encode_epoch ( data [ first: first + sepoch ].T, emethods )
+        starts.append ( position )
+        blobs.append ( blob )
+        position += len ( blob )
+    
+    
+    # Builds the headers.
+    labelset = get_labels ( nchan )
+    channels = '\n'.join ( '%-10s %e %e uV REF' % ( label, 1.0, 0.0238 ) for label in labelset )
+    eeph     = ( '[File Version]\n4.0\n[Sampling Rate]\n%f\n[Samples]\n%i\n[Channels]\n%i\n'
+                 '[Basic Channel Data]\n;label    calibration factor\n%s\n' % ( sample_rate, nsamp, nchan, channels ) )
+    start    = 45000.25
+    info     = '[StartDate]\n%.10f\n[StartFraction]\n0.0\n[MachineMake]\nSynthetic\n' % start
+    
+    # Builds the RIFF tree.
+    psize    = 8 if rf64 else 4
+    raw3     = b'raw3' + b''.join ( [
+        build_chunk ( 'ep  ', struct.pack ( '<%iQ' % ( len ( starts ) + 1 ), sepoch, *starts ), psize ),
+        build_chunk ( 'chan', struct.pack ( '<%iH' % nchan, *range ( nchan ) ), psize ),
+        build_chunk ( 'data', b''.join ( blobs ) + b'\0' * 8, psize ) ] )
+    body     = b'CNT ' + b''.join ( [
+        build_chunk ( 'eeph', eeph.encode (), psize ),
+        build_chunk ( 'info', info.encode (), psize ) ] ) + b'LIST' + len ( raw3 ).to_bytes ( psize, 'little' ) + raw3
+    
+    # Writes the file.
+    with open ( filename, 'wb' ) as fid:
+        fid.write ( ( b'RF64' if rf64 else b'RIFF' ) + len ( body ).to_bytes ( psize, 'little' ) + body )
+    
+    
+    # Writes the segments (the first one is implicit), of equal length.
+    tstart   = ( start - unixday ) * 60 * 60 * 24
+    bounds   = numpy.linspace ( 0, nsamp, nsegment + 1 ).astype ( int )
+    with open ( filename [ :-4 ] + '.seg', 'w' ) as fid:
+        fid.write ( 'NumberSegments=%i\n' % nsegment )
+        for sindex in range ( 1, nsegment ):
+            stime    = tstart + bounds [ sindex ] / sample_rate + 10 * sindex
+            fid.write ( '%r %r %i\n' % ( float ( stime // 86400 + unixday ), float ( stime % 86400 ), bounds [ sindex + 1 ] - bounds [ sindex ] ) )
+        if nsegment == 1:
+            fid.write ( 'NaN NaN NaN\n' )
+    
+    # Writes the events, randomly spread over the recording (and segments).
+    samples  = numpy.sort ( rng.uniform ( 0, nsamp, int ( event_rate * duration ) ) )
+    sindex   = numpy.searchsorted ( bounds, samples, side = 'right' ) - 1
+    times    = tstart + samples / sample_rate + 10 * sindex
+    with open ( filename [ :-4 ] + '.evt', 'wb' ) as fid:
+        fid.write ( build_evt ( times, [ 'T%i' % ( eindex % 8 ) for eindex in range ( len ( times ) ) ] ) )
+    
+    
+    # Returns the data.
+    return data
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+
+@author: Ricardo Bruña
+
+Command line interface.
+
+embrace-eep convert converts all the EEProbe (*.cnt) files in a directory
+tree into MNE FIF, NumPy (.npy) or HDF5 files, using a pool of processes.
+Each file is converted in chunks, so the memory used by each worker does not
+depend on the length of the recording.
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import concurrent.futures
+
+import numpy
+
+
+# Lists the output formats and the suffix of each one.
+formats  = {
+    'fif':  '_raw.fif',
+    'npy':  '.npy',
+    'hdf5': '.h5' }
+
+
+
+"""
+Code for converting one file.
+"""
+
+# Function to convert one file. Returns the size of the input, in bytes.
+def convert_file ( source, target, fmt, dtype = 'float32', chunk = 60.0 ):
+    
+    # Imported here so the command line starts fast.
+    from . import eep
+    
+    
+    # Opens the file.
+    cntfile  = eep.CntFile ( source )
+    nsamp    = cntfile.info [ 'sample_count' ]
+    nchan    = cntfile.info [ 'channel_count' ]
+    
+    # Gets the size of the chunks, in samples.
+    nchunk   = max ( 1, int ( chunk * cntfile.info [ 'sample_rate' ] ) )
+    
+    # Writes into a temporary file, so an interrupted conversion is never
+    # taken as an up to date output.
+    tmpfile  = re_suffix ( target, fmt, '.tmp' )
+    
+    
+    # Writes the MNE FIF file, decoding the data on demand with one thread
+    # (the files are converted in parallel). MNE splits large files and names
+    # the parts after the file, so writes them with their final names into
+    # a temporary folder, and moves all the parts.
+    if fmt == 'fif':
+        mneraw   = cntfile.get_mne ( preload = False, nthreads = 1 )
+        tmpdir   = tempfile.mkdtemp ( prefix = '.convert-', dir = os.path.dirname ( os.path.abspath ( target ) ) )
+        try:
+            tmpfile  = os.path.join ( tmpdir, os.path.basename ( target ) )
+            mneraw.save ( tmpfile, buffer_size_sec = chunk, fmt = 'single' if dtype == 'float32' else 'double', overwrite = True )
+            
+            # Moves the split parts, if any, and then the main file.
+            for name in os.listdir ( tmpdir ):
+                if name != os.path.basename ( target ):
+                    os.replace ( os.path.join ( tmpdir, name ), os.path.join ( os.path.dirname ( os.path.abspath ( target ) ), name ) )
+            os.replace ( tmpfile, target )
+        finally:
+            shutil.rmtree ( tmpdir, ignore_errors = True )
+    
+    # Writes the (samples x channels) data, in volts, into a NumPy file.
+    elif fmt == 'npy':
+        data     = numpy.lib.format.open_memmap ( tmpfile, mode = 'w+', dtype = dtype, shape = ( nsamp, nchan ) )
+        for onset, chunkdata in cntfile.iter_chunks ( nchunk, nthreads = 1, dtype = dtype, units = 'V' ):
+            data [ onset: onset + len ( chunkdata ) ] = chunkdata
+        data.flush ()
+        del data
+    
+    # Writes the (samples x channels) data, in volts, and the channel
+    # labels and sampling rate into an HDF5 file.
+    elif fmt == 'hdf5':
+        import h5py
+        with h5py.File ( tmpfile, 'w' ) as fid:
+            data     = fid.create_dataset ( 'data', shape = ( nsamp, nchan ), dtype = dtype, chunks = ( min ( nchunk, max ( nsamp, 1 ) ), nchan ) )
+            for onset, chunkdata in cntfile.iter_chunks ( nchunk, nthreads = 1, dtype = dtype, units = 'V' ):
+                data [ onset: onset + len ( chunkdata ) ] = chunkdata
+            data.attrs [ 'sample_rate' ] = cntfile.info [ 'sample_rate' ]
+            data.attrs [ 'channels' ]    = list ( cntfile.info [ 'channels' ] [ 'label' ] )
+            data.attrs [ 'units' ]       = 'V'
+    
+    else:
+        raise ValueError ( 'Unknown output format \'%s\'.' % fmt )
+    
+    
+    # Moves the output into place (the FIF files are already in place).
+    if fmt != 'fif':
+        os.replace ( tmpfile, target )
+    
+    # Returns the size of the input.
+    return os.path.getsize ( source )
+
+
+
+# Function to add a tag before the suffix of an output file.
+def re_suffix ( target, fmt, tag ):
+    return target [ :-len ( formats [ fmt ] ) ] + tag + formats [ fmt ]
+
+
+
+"""
+Code for converting a directory tree.
+"""
+
+# Function to list the files to convert as (input, output) pairs.
+def list_jobs ( source, outdir, fmt ):
+    
+    
+    # If the source is a file, converts only that file.
+    if os.path.isfile ( source ):
+        base     = os.path.dirname ( source )
+        sources  = [ source ]
+    
+    # Otherwise, looks for all the EEProbe files in the tree.
+    else:
+        base     = source
+        sources  = []
+        for root, dirs, files in os.walk ( source ):
+            dirs.sort ()
+            sources += [ os.path.join ( root, name ) for name in sorted ( files ) if name.endswith ( '.cnt' ) ]
+    
+    
+    # Builds the output file names, mirroring the input tree.
+    jobs     = []
+    for filename in sources:
+        relname  = os.path.relpath ( filename, base )
+        target   = os.path.join ( outdir or base, relname [ :-4 ] + formats [ fmt ] )
+        jobs.append ( ( filename, target ) )
+    
+    # Returns the list of jobs.
+    return jobs
+
+
+
+# Function to check if an output is newer than its input and sidecar files.
+def is_up_to_date ( source, target ):
+    
+    
+    # If no output, it must be written.
+    if not os.path.exists ( target ):
+        return False
+    
+    # Gets the last modification of the input files.
+    stem     = source [ :-4 ]
+    mtimes   = [ os.path.getmtime ( filename ) for filename in ( source, stem + '.evt', stem + '.seg' ) if os.path.exists ( filename ) ]
+    
+    # Compares it with the output.
+    return os.path.getmtime ( target ) >= max ( mtimes )
+
+
+
+# Function to convert a directory tree.
+def convert ( args ):
+    
+    
+    # Checks that HDF5 files can be written.
+    if args.format == 'hdf5':
+        try:
+            import h5py
+        except ImportError:
+            raise SystemExit ( 'Writing HDF5 files requires h5py.' )
+    
+    
+    # Lists the files to convert and skips the outputs up to date.
+    jobs     = list_jobs ( args.input, args.output, args.format )
+    todo     = [ ( source, target ) for source, target in jobs if args.force or not is_up_to_date ( source, target ) ]
+    nskip    = len ( jobs ) - len ( todo )
+    
+    # Creates the output folders.
+    for _, target in todo:
+        os.makedirs ( os.path.dirname ( os.path.abspath ( target ) ), exist_ok = True )
+    
+    
+    # Converts the files in parallel.
+    tstart   = time.perf_counter ()
+    nbytes   = 0
+    ndone    = 0
+    failed   = []
+    
+    with concurrent.futures.ProcessPoolExecutor ( max_workers = args.jobs, max_tasks_per_child = args.max_tasks ) as pool:
+        
+        # Submits the conversions.
+        futures  = {
+            pool.submit ( convert_file, source, target, args.format, args.dtype, args.chunk ): source
+            for source, target in todo }
+        
+        # Collects the results as they finish.
+        for future in concurrent.futures.as_completed ( futures ):
+            source   = futures [ future ]
+            try:
+                nbytes  += future.result ()
+                ndone   += 1
+                if not args.quiet:
+                    print ( 'Converted %s' % source )
+            except Exception as error:
+                failed.append ( source )
+                print ( 'Failed %s: %s' % ( source, error ), file = sys.stderr )
+    
+    elapsed  = time.perf_counter () - tstart
+    
+    
+    # Prints the summary.
+    print ( '%i converted, %i up to date, %i failed in %.1f s (%.2f files/s, %.1f MB/s).' % (
+        ndone, nskip, len ( failed ), elapsed,
+        ndone / elapsed if elapsed > 0 else 0,
+        nbytes / 1e6 / elapsed if elapsed > 0 else 0 ) )
+    
+    # Returns an error status if any conversion failed.
+    return 1 if failed else 0
+
+
+
+"""
+Code for parsing the command line.
+"""
+
+# Function to build the argument parser.
+def build_parser ():
+    
+    
+    # Creates the main parser.
+    parser   = argparse.ArgumentParser ( prog = 'embrace-eep', description = 'EMBRACE tools for eeprobe CNT files.' )
+    commands = parser.add_subparsers ( dest = 'command', required = True )
+    
+    
+    # Defines the conversion command.
+    subparser = commands.add_parser ( 'convert', help = 'convert CNT files into FIF, NumPy or HDF5 files' )
+    subparser.add_argument ( 'input', help = 'CNT file or directory to search for CNT files' )
+    subparser.add_argument ( '-o', '--output', help = 'output directory (by default, next to the inputs)' )
+    subparser.add_argument ( '-f', '--format', choices = list ( formats ), default = 'fif', help = 'output format (default: fif)' )
+    subparser.add_argument ( '-j', '--jobs', type = int, default = os.cpu_count (), help = 'number of worker processes (default: one per core)' )
+    subparser.add_argument ( '--dtype', choices = [ 'float32', 'float64' ], default = 'float32', help = 'output data type (default: float32)' )
+    subparser.add_argument ( '--chunk', type = float, default = 60.0, help = 'seconds of data decoded at once by each worker (default: 60)' )
+    subparser.add_argument ( '--max-tasks', type = int, default = None, help = 'files converted by each worker before it is replaced' )
+    subparser.add_argument ( '--force', action = 'store_true', help = 'convert also the files with up to date outputs' )
+    subparser.add_argument ( '-q', '--quiet', action = 'store_true', help = 'print only the summary and the errors' )
+    subparser.set_defaults ( function = convert )
+    
+    
+    # Returns the parser.
+    return parser
+
+
+
+# Main entry point.
+def main ( argv = None ):
+    
+    # Parses the arguments and runs the command.
+    args     = build_parser ().parse_args ( argv )
+    return args.function ( args )
+
+
+
+if __name__ == '__main__':
+    sys.exit ( main () )
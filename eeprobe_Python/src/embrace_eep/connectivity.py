@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+
+@author: Ricardo Bruña
+
+Phase synchronization between all the pairs of channels.
+
+Computes the phase locking value (PLV), the corrected imaginary PLV (ciPLV)
+and the weighted phase lag index (wPLI) from analytic (band-pass filtered
+and Hilbert transformed) signals. The statistics are accumulated window by
+window, so the memory used depends only on the number of channels and bands,
+not on the length of the recordings. All the pairs are computed at once as
+complex matrix products (the absolute value of the wPLI in blocks of
+channels), and the bands in a pool of threads kept by the accumulator.
+
+For z_i the analytic signal of channel i, u_i = z_i / |z_i| its phase and
+X_ij = z_i * conj ( z_j ) the cross-spectrum, over all the samples:
+* PLV   = | mean ( u_i * conj ( u_j ) ) |
+* ciPLV = | imag ( PLVc ) | / sqrt ( 1 - real ( PLVc ) ^ 2 ), with PLVc the
+          complex PLV (Bruña et al. 2018, J Neural Eng 15:056011).
+* wPLI  = | sum ( imag ( X_ij ) ) | / sum ( | imag ( X_ij ) | )
+
+Connectivity between recordings (e.g. between brains) is computed passing
+the time-locked windows of all the recordings (see eep.CntGroup), which are
+concatenated along the channels.
+
+"""
+
+import os
+import concurrent.futures
+
+import numpy
+
+
+# Lists the available metrics.
+syncmetrics = ( 'plv', 'ciplv', 'wpli' )
+
+
+
+# Class to accumulate the phase synchronization across windows.
+class PhaseSync:
+    
+    
+    def __init__ ( self, nchan, nband = 1, metrics = syncmetrics, nthreads = None, pool = None ):
+        
+        # Checks the metrics.
+        unknown  = [ metric for metric in metrics if metric not in syncmetrics ]
+        if unknown:
+            raise ValueError ( 'Unknown metric(s): %s.' % ', '.join ( unknown ) )
+        
+        # Stores the definition.
+        self.nchan    = int ( nchan )
+        self.nband    = int ( nband )
+        self.metrics  = tuple ( metrics )
+        self.nthreads = nthreads or os.cpu_count () or 1
+        
+        # Stores the pool of threads for the bands, if provided. Otherwise it
+        # is created on the first update and released by close ().
+        self.pool     = pool
+        self.ownpool  = False
+        
+        # Initializes the accumulators, for each band: the number of samples,
+        # the sum of the phase differences (for the PLV and ciPLV) and the
+        # sums of the imaginary cross-spectrum and of its absolute value (for
+        # the wPLI).
+        self.count    = 0
+        shape    = ( self.nband, self.nchan, self.nchan )
+        self.phase    = numpy.zeros ( shape, dtype = 'complex128' ) if { 'plv', 'ciplv' } & set ( metrics ) else None
+        self.imag     = numpy.zeros ( shape, dtype = 'float64' ) if 'wpli' in metrics else None
+        self.absimag  = numpy.zeros ( shape, dtype = 'float64' ) if 'wpli' in metrics else None
+    
+    
+    
+    # Function to add a window of analytic signals to the statistics. The
+    # window is a (bands x samples x channels) complex array, a (samples x
+    # channels) array for a single band, or a list of them (one for each
+    # recording, with the same samples), concatenated along the channels.
+    def update ( self, window ):
+        
+        
+        # Concatenates the recordings, if required.
+        if isinstance ( window, ( list, tuple ) ):
+            window   = numpy.concatenate ( window, axis = -1 )
+        
+        # Adds the band dimension, if required.
+        window   = numpy.asarray ( window )
+        if window.ndim == 2:
+            window   = window [ None ]
+        
+        # Checks the window.
+        if window.ndim != 3 or window.shape [0] != self.nband or window.shape [2] != self.nchan:
+            raise ValueError ( 'The window must be a (%i bands x samples x %i channels) array.' % ( self.nband, self.nchan ) )
+        if not numpy.iscomplexobj ( window ):
+            raise ValueError ( 'The window must contain analytic (complex) signals.' )
+        
+        
+        # Accumulates each band, in parallel (the matrix products release the GIL).
+        if self.nband > 1 and self.nthreads > 1:
+            if self.pool is None:
+                self.pool     = concurrent.futures.ThreadPoolExecutor ( max_workers = min ( self.nthreads, self.nband ) )
+                self.ownpool  = True
+            list ( self.pool.map ( self.update_band, range ( self.nband ), window ) )
+        else:
+            for bindex in range ( self.nband ):
+                self.update_band ( bindex, window [ bindex ] )
+        
+        # Updates the number of samples.
+        self.count   += window.shape [1]
+        
+        # Returns the accumulator.
+        return self
+    
+    
+    
+    # Function to add a (samples x channels) window of one band.
+    def update_band ( self, bindex, signal ):
+        
+        
+        # Adds the sum of the phase differences of all the pairs.
+        if self.phase is not None:
+            
+            # Normalizes the signals (null samples are ignored).
+            amplitude = numpy.abs ( signal )
+            phasor   = numpy.divide ( signal, amplitude, out = numpy.zeros_like ( signal ), where = amplitude > 0 )
+            
+            # Sums u_i * conj ( u_j ) over samples, for all the pairs at once.
+            self.phase [ bindex ] += phasor.T @ phasor.conj ()
+        
+        
+        # Adds the sums of the imaginary cross-spectrum and of its absolute value.
+        if self.imag is not None:
+            
+            # The sum of the cross-spectrum is a matrix product.
+            self.imag [ bindex ] += ( signal.T @ signal.conj () ).imag
+            
+            # The absolute value requires each sample, so goes through blocks
+            # of channels with all the following ones (the matrix is symmetric):
+            # imag ( z_i * conj ( z_j ) ) = imag ( z_i ) real ( z_j ) - real ( z_i ) imag ( z_j ).
+            # The blocks (a sixteenth of the channels, up to 2^22 values) are
+            # small, so little is computed twice around the diagonal.
+            real     = numpy.ascontiguousarray ( signal.real.T )
+            imag     = numpy.ascontiguousarray ( signal.imag.T )
+            absimag  = numpy.zeros ( ( self.nchan, self.nchan ) )
+            nblock   = max ( 1, min ( -( -self.nchan // 16 ), 2 ** 22 // max ( self.nchan * signal.shape [0], 1 ) ) )
+            for first in range ( 0, self.nchan - 1, nblock ):
+                last     = min ( first + nblock, self.nchan )
+                cross    = numpy.einsum ( 'is,js->ijs', imag [ first: last ], real [ first: ] )
+                cross   -= numpy.einsum ( 'is,js->ijs', real [ first: last ], imag [ first: ] )
+                absimag [ first: last, first: ] = numpy.abs ( cross, out = cross ).sum ( axis = 2 )
+            
+            # Keeps the pairs above the diagonal and mirrors them.
+            absimag  = numpy.triu ( absimag, 1 )
+            self.absimag [ bindex ] += absimag + absimag.T
+    
+    
+    
+    # Function to get the (bands x channels x channels) matrix of a metric.
+    def get ( self, metric ):
+        
+        
+        # Checks the metric.
+        if metric not in self.metrics:
+            raise ValueError ( 'Metric \'%s\' not computed. Available metrics: %s.' % ( metric, ', '.join ( self.metrics ) ) )
+        if self.count == 0:
+            raise ValueError ( 'No data accumulated.' )
+        
+        
+        # Computes the PLV from the mean phase difference.
+        if metric == 'plv':
+            return numpy.abs ( self.phase / self.count )
+        
+        # Computes the ciPLV, zero where undefined (e.g. the diagonal).
+        if metric == 'ciplv':
+            cplv     = self.phase / self.count
+            denom    = numpy.sqrt ( numpy.maximum ( 1 - cplv.real ** 2, 0 ) )
+            return numpy.divide ( numpy.abs ( cplv.imag ), denom, out = numpy.zeros ( cplv.shape ), where = denom > 0 )
+        
+        # Computes the wPLI, zero where undefined (e.g. the diagonal).
+        if metric == 'wpli':
+            return numpy.divide ( numpy.abs ( self.imag ), self.absimag, out = numpy.zeros ( self.imag.shape ), where = self.absimag > 0 )
+    
+    
+    
+    # Function to get all the computed metrics, as a dictionary.
+    def get_all ( self ):
+        return { metric: self.get ( metric ) for metric in self.metrics }
+    
+    
+    
+    # Function to release the pool of threads, if created by the accumulator.
+    def close ( self ):
+        
+        if self.ownpool:
+            self.pool.shutdown ()
+            self.pool     = None
+            self.ownpool  = False
+
+
+
+# Function to compute the phase synchronization over an iterable of windows
+# of analytic signals (see PhaseSync.update). Returns a dictionary with a
+# (bands x channels x channels) matrix for each metric.
+def compute_sync ( windows, metrics = syncmetrics, nthreads = None ):
+    
+    
+    # Goes through each window, creating the accumulator with the first one.
+    sync     = None
+    try:
+        for window in windows:
+            
+            # Gets the dimensions from the first window.
+            if sync is None:
+                first    = numpy.concatenate ( window, axis = -1 ) if isinstance ( window, ( list, tuple ) ) else numpy.asarray ( window )
+                nband    = 1 if first.ndim == 2 else first.shape [0]
+                sync     = PhaseSync ( first.shape [ -1 ], nband, metrics, nthreads )
+            
+            sync.update ( window )
+    
+    # Releases the pool of threads of the accumulator.
+    finally:
+        if sync is not None:
+            sync.close ()
+    
+    if sync is None:
+        raise ValueError ( 'No windows to process.' )
+    
+    
+    # Returns the metrics.
+    return sync.get_all ()
@@ -8,23 +8,653 @@ Based on the description of the EEP 3.x file format in:
 
 """
 
+import os
 import re
-import pandas
+import copy
+import struct
+import functools
+import importlib
 import numpy
 
 from . import raweep
-from .tools import mnetools
+from .tools import cache
+from .tools import memo
+from .tools import profiling
 from .tools import riff
 
 
+# pandas (for the header tables) and the MNE tools are imported on first use,
+# so importing this module, e.g. in short-lived worker processes, is fast.
+def __getattr__ ( name ):
+    
+    # Imports the deferred modules when accessed as attributes.
+    if name == 'pandas':
+        return importlib.import_module ( 'pandas' )
+    if name == 'mnetools':
+        return importlib.import_module ( '.tools.mnetools', __package__ )
+    
+    raise AttributeError ( 'module %r has no attribute %r' % ( __name__, name ) )
+
+
+"""
+Code for opening the EEProbe file only once.
+"""
+
+# Class to hold the RIFF index, the header, and the sidecar files of a file.
+class CntFile:
+    
+    
+    # Opens the file and parses the header and the sidecar files.
+    def __init__ ( self, filename, info = None ):
+        
+        # Stores the file name.
+        self.filename = filename
+        
+        # Indexes the RIFF file tree, without reading the chunk contents.
+        self.rifftree = read_tree ( filename )
+        
+        # Looks for the decoded file in the on-disk cache, if enabled.
+        self.cached   = None
+        entry    = self.load_cache ()
+        if entry is not None:
+            self.cached, cachedinfo = entry
+            if info is None:
+                info     = cachedinfo
+        
+        # Parses the header and the sidecar files, if not provided.
+        if info is None:
+            info     = load_info ( filename )
+        
+        # Stores the file information.
+        self.info     = info
+    
+    
+    
+    # Pickles (and copies) only the file name and information. The file is
+    # memory-mapped again when unpickled.
+    def __getstate__ ( self ):
+        return { 'filename': self.filename, 'info': self.info }
+    
+    def __setstate__ ( self, state ):
+        self.__init__ ( state [ 'filename' ], state [ 'info' ] )
+    
+    
+    
+    # Function to get the key of the file in the on-disk cache, from the
+    # file, its sidecar files and its headers.
+    def get_cache_key ( self, store ):
+        
+        # Lists the file and its sidecar files.
+        filenames = [ self.filename ] + list_sidecars ( self.filename )
+        
+        # Gets the headers.
+        header   = b''.join ( bytes ( riff.get_subtree ( self.rifftree, [ label ] ) [ 'data' ] ) for label in ( 'eeph', 'info' ) )
+        
+        # Returns the key.
+        return store.get_key ( filenames, header )
+    
+    
+    
+    # Function to read the decoded file from the on-disk cache, if enabled.
+    def load_cache ( self ):
+        
+        # Gets the active cache, if any.
+        store    = cache.get_cache ()
+        if store is None:
+            return None
+        
+        # Reads the entry, if it exists.
+        return store.load ( self.get_cache_key ( store ) )
+    
+    
+    
+    # Function to get the decoded (uncalibrated) data of the whole file.
+    # Only used when the on-disk cache is enabled: the data is decoded once,
+    # in chunks of epochs, into a file of the cache, and then memory-mapped
+    # (read-only) for this and later uses.
+    def get_decoded ( self ):
+        
+        
+        # If already decoded, or in the cache, returns the data.
+        if self.cached is not None:
+            return self.cached
+        
+        # Gets the active cache, if any.
+        store    = cache.get_cache ()
+        if store is None:
+            return None
+        
+        # If the file does not fit in the cache, does not store it.
+        nsamp    = self.info [ 'sample_count' ]
+        picks    = self.get_picks ()
+        if store.max_size is not None and 4 * nsamp * len ( picks ) > store.max_size:
+            return None
+        
+        
+        # Function to decode the whole file as int32, in chunks of about
+        # 16 MiB, so the memory used does not depend on the file length.
+        sepoch   = self.rawdata [ 'epoch_length' ]
+        nchunk   = sepoch * max ( 1, 2 ** 22 // ( sepoch * len ( picks ) ) )
+        def fill ( out ):
+            for first in range ( 0, nsamp, nchunk ):
+                last     = min ( first + nchunk, nsamp )
+                self.decode ( first, last, picks, None, out [ first: last ], None )
+        
+        # Stores the data and the information in the cache.
+        key      = self.get_cache_key ( store )
+        store.store ( key, ( nsamp, len ( picks ) ), fill, self.info )
+        
+        
+        # Maps the stored data (None if already evicted).
+        entry    = store.load ( key )
+        self.cached   = entry [0] if entry is not None else None
+        return self.cached
+    
+    
+    
+    # Raw data definition, parsed only on first use.
+    @functools.cached_property
+    def rawdata ( self ):
+        return parse_rawdata ( self.rifftree )
+    
+    
+    
+    # Function to get the channel indexes from a list of labels or indexes.
+    def get_picks ( self, picks = None ):
+        
+        
+        # Lists the channels in the file.
+        labels   = list ( self.info [ 'channels' ] [ 'label' ] )
+        
+        # If no channels are selected, takes all of them.
+        if picks is None:
+            return numpy.arange ( len ( labels ) )
+        
+        # Makes sure that the selection is a list.
+        picks    = numpy.atleast_1d ( picks )
+        
+        # Converts the channel labels into indexes, if required.
+        if picks.dtype.kind in 'UO':
+            
+            missing  = [ pick for pick in picks if pick not in labels ]
+            if len ( missing ) > 0:
+                raise ValueError ( 'Channel(s) not found: %s.' % ', '.join ( map ( str, missing ) ) )
+            
+            picks    = numpy.array ( [ labels.index ( pick ) for pick in picks ] )
+        
+        # Checks the channel indexes.
+        picks    = picks.astype ( int )
+        if numpy.any ( picks < 0 ) or numpy.any ( picks >= len ( labels ) ):
+            raise ValueError ( 'Channel index out of range.' )
+        
+        
+        # Returns the channel indexes.
+        return picks
+    
+    
+    
+    # Function to get the limits of a window of samples.
+    def get_window ( self, start = None, stop = None ):
+        
+        # Gets the number of samples.
+        nsamp    = self.info [ 'sample_count' ]
+        
+        # Sets the default limits.
+        start    = 0 if start is None else int ( start )
+        stop     = nsamp if stop is None else int ( stop )
+        
+        # Checks the limits.
+        if start < 0 or stop > nsamp or start > stop:
+            raise ValueError ( 'The requested window [%i, %i) is outside the data [0, %i).' % ( start, stop, nsamp ) )
+        
+        # Returns the limits.
+        return start, stop
+    
+    
+    
+    # Function to get the scale of each channel (see get_scale).
+    def get_scale ( self, units = None ):
+        return get_scale ( self.info, units )
+    
+    
+    
+    # Function to decode the calibrated data.
+    # The data is decoded directly into the output, which can be provided as
+    # a (samples x channels) float array or a view of one (e.g. the transpose
+    # of a (channels x samples) array). The calibration and the conversion to
+    # 'units' are applied while decoding, in float64, and the result is
+    # stored as 'dtype' (float64 or float32).
+    # If raw_int32 is True, returns the integer data without calibration and
+    # the scale of each channel (data * scale gives the calibrated data).
+    def get_data ( self, start = None, stop = None, picks = None, nthreads = None, out = None, dtype = 'float64', units = None, raw_int32 = False ):
+        
+        
+        # Gets the window and the channels to return.
+        start, stop = self.get_window ( start, stop )
+        picks    = self.get_picks ( picks )
+        
+        # Gets the scale of the selected channels.
+        scale    = self.get_scale ( units ) [ picks ]
+        
+        
+        # Checks the output type.
+        dtype    = numpy.dtype ( 'int32' if raw_int32 else dtype )
+        if out is not None:
+            dtype    = out.dtype
+        
+        if raw_int32 and dtype != numpy.int32:
+            raise ValueError ( 'The raw output must be of type int32.' )
+        if not raw_int32 and dtype not in ( numpy.float32, numpy.float64 ):
+            raise ValueError ( 'The output must be of type float32 or float64.' )
+        
+        # Initializes the output, if not provided.
+        if out is None:
+            out      = numpy.empty ( ( stop - start, len ( picks ) ), dtype = dtype )
+            profiling.allocated ( out.nbytes )
+        
+        if out.shape != ( stop - start, len ( picks ) ):
+            raise ValueError ( 'The output must be an array of (samples x channels).' )
+        
+        
+        # Gets the data, if any.
+        if out.size > 0:
+            
+            # Gets the whole decoded file from the on-disk cache, if enabled.
+            decoded  = self.get_decoded ()
+            
+            # If cached, copies the selected data, applying the scale.
+            if decoded is not None and raw_int32:
+                out [:]  = decoded [ start: stop, picks ]
+            elif decoded is not None:
+                numpy.multiply ( decoded [ start: stop, picks ], scale, out = out )
+            
+            # Otherwise decodes the selected data.
+            else:
+                self.decode ( start, stop, picks, nthreads, out, None if raw_int32 else scale )
+        
+        
+        # Returns the data (and the scale, if not applied).
+        if raw_int32:
+            return out, scale
+        
+        return out
+    
+    
+    
+    # Function to decode the samples [start, stop) of the selected channels
+    # into the output, applying the scale (if any) of each channel.
+    @profiling.timed ( 'decode' )
+    def decode ( self, start, stop, picks, nthreads, out, scale ):
+        
+        
+        # Gets the information from the system-specific header.
+        nsamp    = self.info [ 'sample_count' ]
+        
+        # Gets the raw data information.
+        sepoch   = self.rawdata [ 'epoch_length' ]
+        starts   = self.rawdata [ 'epoch_start' ]
+        chorder  = numpy.array ( self.rawdata [ 'channel_order' ], dtype = 'int64' )
+        rawdata  = self.rawdata [ 'data' ]
+        
+        
+        # Gets the channels in the compressed stream.
+        chans    = chorder [ picks ]
+        
+        # The channels are stored sequentially, so decodes up to the last one.
+        nread    = int ( chans.max () ) + 1
+        
+        # Gets the epochs overlapping the window.
+        efirst   = start // sepoch
+        elast    = ( stop - 1 ) // sepoch + 1
+        
+        # Gets the bit offset of each epoch and the length of the last one.
+        offsets  = 8 * numpy.array ( starts [ efirst: elast ], dtype = 'uint64' )
+        nlast    = min ( sepoch, nsamp - ( elast - 1 ) * sepoch )
+        
+        
+        # Decodes all the epochs in parallel, reordering and scaling the
+        # channels while writing them into the output.
+        raweep.read_blocks (
+            rawdata, offsets, sepoch, nread, out,
+            nlast    = nlast,
+            nthreads = default_threads ( nthreads ),
+            chans    = chans,
+            scale    = scale,
+            first    = start - efirst * sepoch )
+        
+        # Counts the epochs and the samples decoded (of the channels read),
+        # and the compressed bits and samples (of all the channels) of the
+        # epochs touched.
+        if profiling.active is not None:
+            send     = starts [ elast ] if elast < len ( starts ) else len ( rawdata )
+            nepoch   = ( elast - efirst - 1 ) * sepoch + nlast
+            profiling.count ( 'raw3.epochs_decoded', elast - efirst )
+            profiling.count ( 'raw3.samples_decoded', nepoch * nread )
+            profiling.count ( 'raw3.epoch_samples', nepoch * self.info [ 'channel_count' ] )
+            profiling.count ( 'raw3.epoch_bits', 8 * ( send - starts [ efirst ] ) )
+    
+    
+    
+    # Function to iterate over the calibrated data in chunks of samples.
+    # Yields the first sample of each chunk and a (samples x channels) array.
+    # Consecutive chunks share 'overlap' samples, which are not decoded twice.
+    def iter_chunks ( self, chunk_samples = None, overlap = 0, start = None, stop = None, picks = None, nthreads = None, dtype = 'float64', units = None ):
+        
+        
+        # By default, uses chunks of ten seconds.
+        if chunk_samples is None:
+            chunk_samples = int ( 10 * self.info [ 'sample_rate' ] )
+        
+        # Checks the chunk definition.
+        chunk_samples = int ( chunk_samples )
+        overlap  = int ( overlap )
+        if chunk_samples < 1:
+            raise ValueError ( 'The chunks must have at least one sample.' )
+        if overlap < 0 or overlap >= chunk_samples:
+            raise ValueError ( 'The overlap must be non-negative and shorter than the chunks.' )
+        
+        
+        # Gets the window and the channels to return.
+        start, stop = self.get_window ( start, stop )
+        picks    = self.get_picks ( picks )
+        
+        # Gets the onset of the last chunk (at least one chunk, if any data).
+        last     = max ( stop - overlap, min ( start + 1, stop ) )
+        
+        # Initializes the previous chunk.
+        chunk    = None
+        
+        # Goes through each chunk.
+        for onset in range ( start, last, chunk_samples - overlap ):
+            
+            # Gets the end of the chunk.
+            offset   = min ( onset + chunk_samples, stop )
+            
+            # Reserves memory for the chunk.
+            data     = numpy.empty ( ( offset - onset, len ( picks ) ), dtype = dtype )
+            profiling.allocated ( data.nbytes )
+            
+            # Copies the overlap from the previous chunk, if any.
+            if chunk is None:
+                nkeep    = 0
+            else:
+                nkeep    = min ( overlap, offset - onset )
+                data [ :nkeep ] = chunk [ chunk.shape [0] - overlap: chunk.shape [0] - overlap + nkeep ]
+            
+            # Decodes the rest of the chunk.
+            self.get_data ( onset + nkeep, offset, picks, nthreads, out = data [ nkeep: ], units = units )
+            
+            # Returns the chunk.
+            yield onset, data
+            
+            # Keeps the current chunk for the next overlap.
+            chunk    = data
+    
+    
+    
+    # Function to decode the windows [onset + first, onset + last) of the
+    # selected channels around each onset, as a (trials x channels x samples)
+    # array. Only the epochs overlapping each window are decoded, and the
+    # windows are decoded in parallel, one per thread.
+    def get_epochs ( self, onsets, first, last, picks = None, nthreads = None, dtype = 'float64', units = None ):
+        
+        import concurrent.futures
+        
+        
+        # Gets the windows and the channels to return.
+        onsets   = numpy.asarray ( onsets, dtype = 'int64' ).reshape ( -1 )
+        picks    = self.get_picks ( picks )
+        nsamp    = self.info [ 'sample_count' ]
+        if last <= first:
+            raise ValueError ( 'The windows must have at least one sample.' )
+        if numpy.any ( onsets + first < 0 ) or numpy.any ( onsets + last > nsamp ):
+            raise ValueError ( 'Some windows are outside the data [0, %i).' % nsamp )
+        
+        # Reserves memory for the trials.
+        data     = numpy.empty ( ( len ( onsets ), len ( picks ), last - first ), dtype = dtype )
+        profiling.allocated ( data.nbytes )
+        
+        
+        # Function to decode one trial into its (channels x samples) slice.
+        def get_trial ( tindex ):
+            self.get_data ( onsets [ tindex ] + first, onsets [ tindex ] + last, picks, 1, out = data [ tindex ].T, units = units )
+        
+        # Decodes the trials, in parallel (the decoder releases the GIL).
+        nthreads = min ( default_threads ( nthreads ), max ( len ( onsets ), 1 ) )
+        if nthreads > 1:
+            with concurrent.futures.ThreadPoolExecutor ( max_workers = nthreads ) as pool:
+                list ( pool.map ( get_trial, range ( len ( onsets ) ) ) )
+        else:
+            for tindex in range ( len ( onsets ) ):
+                get_trial ( tindex )
+        
+        
+        # Returns the trials.
+        return data
+    
+    
+    
+    # Function to build an MNE Raw object.
+    # If preload is False the data is not loaded, but decoded on demand.
+    def get_mne ( self, preload = True, nthreads = None ):
+        
+        # Imports the MNE tools.
+        from .tools import mnetools
+        
+        
+        # Builds a lazy MNE Raw object, if requested.
+        if not preload:
+            return mnetools.build_lazy ( self, nthreads = nthreads )
+        
+        
+        # Decodes the data in SI units (volts) as (channels x samples).
+        data     = numpy.empty ( ( self.info [ 'channel_count' ], self.info [ 'sample_count' ] ) )
+        profiling.allocated ( data.nbytes )
+        self.get_data ( nthreads = nthreads, out = data.T, units = 'V' )
+        
+        
+        # Builds the MNE Raw object.
+        mneraw   = mnetools.build_raw ( self.info, data.T )
+        
+        
+        # Returns the MNE object.
+        return mneraw
+
+
+
+# Factors to convert the channel units into volts.
+unitscale = {
+    'V':  1e0,
+    'mV': 1e-3,
+    'uV': 1e-6,
+    'µV': 1e-6,
+    'nV': 1e-9 }
+
+
+
+# Function to get the scale of each channel: the calibration factor and,
+# if requested, the conversion from the channel units to 'units'.
+# Channels in unknown units cannot be converted and get a scale of zero.
+def get_scale ( info, units = None ):
+    
+    
+    # Gets the calibration factors.
+    scale    = numpy.array ( info [ 'channels' ].calibration, dtype = 'float64' )
+    
+    # If no units requested, keeps the units of the file.
+    if units is None:
+        return scale
+    
+    # Checks the units.
+    if units not in unitscale:
+        raise ValueError ( 'Unknown units \'%s\'. Valid units are: %s.' % ( units, ', '.join ( unitscale ) ) )
+    
+    
+    # Gets the conversion factor for each channel.
+    factor   = [ unitscale.get ( unit, 0 ) / unitscale [ units ] for unit in info [ 'channels' ] [ 'unit' ] ]
+    
+    # Returns the combined scale.
+    return scale * numpy.array ( factor )
+
+
+
+# Function to get the number of decoding threads (by default, one per core).
+def default_threads ( nthreads = None ):
+    
+    if nthreads is None:
+        nthreads = os.cpu_count () or 1
+    
+    return max ( int ( nthreads ), 1 )
+
+
+
+# Function to list the sidecar (events and segments) files of a file.
+def list_sidecars ( filename ):
+    return [ re.sub ( '.cnt$', ext, filename ) for ext in ( '.evt', '.seg' ) ]
+
+
+
+# Function to index the RIFF tree of a file, without reading the chunks.
+# Memoized: the index is reused while the file is not modified. It holds
+# only the positions and lengths of the chunks, not the file itself.
+@memo.file_memo ( maxsize = 256 )
+def read_index ( filename ):
+    return riff.read_file ( filename, index = True )
+
+
+
+# Function to get the RIFF tree of a file, with the chunks memory-mapped.
+# The file is mapped again in each call, and the mapping is released with
+# the tree, so no file is kept open by the memo.
+def read_tree ( filename ):
+    return riff.map_file ( filename, read_index ( filename ) )
+
+
+
+# Function to parse the header and the sidecar files of a file.
+# Memoized: the information is reused while no file is modified.
+@memo.file_memo ( maxsize = 256, related = list_sidecars )
+def load_info ( filename ):
+    return parse_info ( read_tree ( filename ), filename )
+
+
+
+# Function to forget the memoized trees and information of a file (or of
+# all the files, if None).
+def clear_memo ( filename = None ):
+    read_index.invalidate ( filename )
+    load_info.invalidate ( filename )
+
+
+
+# Function to get an open EEProbe file from a file name or an open file.
+def open_cnt ( filename, info = None ):
+    
+    # If the input is already an open file, returns it.
+    if isinstance ( filename, CntFile ):
+        return filename
+    
+    # Otherwise, opens the file.
+    return CntFile ( filename, info )
+
+
+
+
 """
 Code for reading and parsing the EEP header.
 """
 
+# Lists the columns of the parsed event table.
+evtfields = ( 'type', 'onset', 'sample', 'value', 'duration', 'description', 'timestamp' )
+
+
+# Lists the header fields as (section, key in the information, type).
+eephfields = (
+    ( 'File Version',       'file_version',  str ),
+    ( 'Sampling Rate',      'sample_rate',   float ),
+    ( 'Samples',            'sample_count',  int ),
+    ( 'Channels',           'channel_count', int ) )
+
+infofields = (
+    ( 'File Version',       'file_version',  str ),
+    ( 'MachineMake',        'software_id',   str ),
+    ( 'MachineModel',       'hardware_id',   str ),
+    ( 'SubjectName',        'subject_name',  str ),
+    ( 'SubjectDateOfBirth', 'subject_birth', str ) )
+
+
+# Function to split a header in one pass into a dictionary of sections.
+# Each '[Section]' tag is followed by its body, up to the next tag. If a
+# section is repeated, the first one is kept.
+def parse_sections ( text ):
+    
+    # Initializes the dictionary of sections.
+    sections = {}
+    
+    # Goes through each section.
+    for name, body in re.findall ( r'\[([^\]\[]*)\]([^\[]*)', text ):
+        sections.setdefault ( name, body.strip () )
+    
+    # Returns the sections.
+    return sections
+
+
+
+# Function to get typed fields from the header sections.
+def get_fields ( sections, fields ):
+    
+    # Converts each field present in the header.
+    return { key: ftype ( sections [ name ] ) for name, key, ftype in fields if name in sections }
+
+
+
+# Function to parse the channel table into a DataFrame of NumPy arrays.
+def parse_channels ( text ):
+    
+    import pandas
+    
+    
+    # Checks for the (mandatory) channel information header.
+    hits     = re.split ( r';label(?:[\s]+)calibration factor(.*)', text, 0, re.S )
+    assert len ( hits ) > 2, 'The channel information is not correct. Cannot continue.'
+    
+    # Splits the table into rows of (at least) five columns.
+    rows     = [ line.split () for line in hits [1].strip ().splitlines () ]
+    rows     = [ row + [ None ] * ( 5 - len ( row ) ) for row in rows ]
+    
+    
+    # Gets the label, combined calibration factor, unit and reference.
+    columns  = list ( zip ( *rows ) ) if rows else [ () ] * 5
+    chaninfo = pandas.DataFrame ( {
+        'label':       numpy.array ( columns [0], dtype = object ),
+        'calibration': numpy.array ( columns [1], dtype = 'float64' ) * numpy.array ( columns [2], dtype = 'float64' ),
+        'unit':        numpy.array ( columns [3], dtype = object ),
+        'reference':   numpy.array ( columns [4], dtype = object ) } )
+    
+    
+    # Returns the channel information.
+    return chaninfo
+
+
+
 # Function to read the header of the EEProbe file.
+@profiling.timed ( 'read_info' )
 def read_info ( filename ):
     
+    # Opens the file and returns a deep copy of its (memoized) information.
+    return copy.deepcopy ( open_cnt ( filename ).info )
+
+
+
+# Function to parse the header of the EEProbe file from its RIFF tree.
+@profiling.timed ( 'parse_info' )
+def parse_info ( rifftree, filename ):
+    
+    import pandas
+    
     # Function to parse the raw events intro comprehensible data.
+    # The events and the segment onsets are returned as a record array
+    # sorted by onset, with one field per column ('type', 'onset', etc.).
     def parse_events ( info ):
         
         
@@ -36,82 +666,54 @@ def read_info ( filename ):
         # Gets the raw event definition.
         rawevents = info [ 'rawevents' ]
         
+        # Gets the segment definition.
+        sfreq    = info [ 'sample_rate' ]
+        stimes   = info [ 'segments' ].start_time.to_numpy ( dtype = 'float64' )
+        ssamples = info [ 'segments' ].start_sample.to_numpy ( dtype = 'int64' )
+        scounts  = info [ 'segments' ].sample_count.to_numpy ( dtype = 'int64' )
         
-        # Initializes the list of events.
-        events = []
         
+        # Gets the event information.
+        etype    = rawevents [ 'uname' ].to_numpy ( dtype = object )
+        etime    = rawevents [ 'time' ].to_numpy ( dtype = 'float64' )
+        evalue   = rawevents [ 'state' ].to_numpy ( dtype = object )
+        elength  = rawevents [ 'duration' ].to_numpy ( dtype = 'float64' )
+        edesc    = rawevents [ 'description' ].to_numpy ( dtype = object )
+        erawdata = rawevents [ 'epoch_desc' ].to_numpy ( dtype = object )
         
-        # Goes through each event.
-        for rawevent in rawevents:
-            
-            # Gets the event information.
-            etype    = rawevent [ 'event' ] [ 'uname' ]
-            etime    = rawevent [ 'event' ] [ 'time' ]
-            evalue   = rawevent [ 'event' ] [ 'state' ]
-            elength  = rawevent [ 'event' ] [ 'duration' ]
-            edesc    = rawevent [ 'description' ]
-            erawdata = rawevent [ 'event' ] [ 'epoch_desc' ]
-            
-            # Parses the epoch events.
-            if rawevent [ 'description' ] == 'Epoch Event':
-                evalue   = erawdata [0] [ 'data']
-            
-            
-            # Estimates the event onset respect to the segment onset.
-            eonset   = etime - numpy.array ( info [ 'segments' ].start_time )
-            esegment = numpy.where ( eonset > -1 ) [0] [-1]
-            eonset   = min ( eonset [ eonset > -1 ] )
-            esample  = numpy.floor ( eonset * info [ 'sample_rate' ] )
-            sonset   = info [ 'segments' ].start_sample [ esegment ] / info [ 'sample_rate' ]
-            ssample  = info [ 'segments' ].start_sample [ esegment ]
-            
-            
-            # Builds the event structure.
-            event = {
-                'type':        etype,
-                'onset':       eonset + sonset,
-                'sample':      int ( esample + ssample ),
-                'value':       evalue,
-                'duration':    elength,
-                'description': edesc,
-                'rawdata':     erawdata,
-                'timestamp':   etime }
-            
-            # Stores the event information.
-            events.append ( event )
+        # Parses the epoch events.
+        for eindex in numpy.flatnonzero ( edesc == 'Epoch Event' ):
+            evalue [ eindex ] = erawdata [ eindex ] [0] [ 'data' ]
         
         
-        # Adds the information about the segments, if any.
-        for _, segment in info [ 'segments' ].iterrows ():
-            
-            # Gets the segment information.
-            etype    = 'Segment'
-            etime    = segment [ 'start_time' ]
-            evalue   = 0
-            elength  = segment [ 'sample_count' ] / info [ 'sample_rate' ]
-            edesc    = 'New segment'
-            eonset   = segment [ 'start_sample' ] / info [ 'sample_rate' ]
-            esample  = segment [ 'start_sample' ]
-            
-            # Builds the event structure.
-            event = {
-                'type':        etype,
-                'onset':       eonset,
-                'sample':      esample,
-                'value':       evalue,
-                'duration':    elength,
-                'description': edesc,
-                'rawdata':     None,
-                'timestamp':   etime }
-            
-            # Stores the segment information.
-            events.append ( event )
+        # Assigns each event to the last segment starting before it (with
+        # one second of tolerance), using the segment onsets in time.
+        esegment = numpy.searchsorted ( stimes, etime + 1, side = 'left' ) - 1
+        esegment = numpy.maximum ( esegment, 0 )
+        
+        # Estimates the event onset respect to the segment onset.
+        eonset   = etime - stimes [ esegment ]
+        esample  = numpy.floor ( eonset * sfreq ).astype ( 'int64' )
+        
+        
+        # Builds the event table, with the segments first so that they
+        # precede the events at the same onset.
+        events   = numpy.rec.fromarrays (
+            [
+                numpy.concatenate ( [ numpy.full ( len ( stimes ), 'Segment', dtype = object ), etype ] ),
+                numpy.concatenate ( [ ssamples / sfreq, eonset + ssamples [ esegment ] / sfreq ] ),
+                numpy.concatenate ( [ ssamples, esample + ssamples [ esegment ] ] ),
+                numpy.concatenate ( [ numpy.zeros ( len ( stimes ), dtype = object ), evalue ] ),
+                numpy.concatenate ( [ scounts / sfreq, elength ] ),
+                numpy.concatenate ( [ numpy.full ( len ( stimes ), 'New segment', dtype = object ), edesc ] ),
+                numpy.concatenate ( [ stimes, etime ] ),
+                numpy.concatenate ( [ numpy.full ( len ( stimes ), None, dtype = object ), erawdata ] ) ],
+            names = evtfields + ( 'rawdata', ) )
         
         
         # Sorts the events by onset.
-        onsets = [ event [ 'onset' ] for event in events ]
-        order  = numpy.argsort ( onsets )
-        events = [ events [ index ] for index in order ]
+        order    = numpy.argsort ( events.onset, kind = 'stable' )
+        events   = events [ order ]
         
         
         # Adds the events to the file information.
@@ -206,8 +808,8 @@ def read_info ( filename ):
                 
                 # Stores the video information.
                 videos.append ( video )
-            
-            
+        
+        
         # Adds the list of videos to the information.
         info [ 'videos' ] = videos
         
@@ -215,101 +817,39 @@ def read_info ( filename ):
         return info
     
     
-    # Reads the RIFF file tree, if required.
-    rifftree = riff.read_file ( filename )
-    
-    
     # Initializes the information dictionary.
     info     = {}
     
     
-    # Gets the EEP header.
+    # Gets the EEP header and splits it into sections.
     subtree  = riff.get_subtree ( rifftree, [ 'eeph' ] )
-    dummy    = bytes ( subtree [ 'data' ] ).decode ()
-    
-    # Looks for the file version.
-    hits     = re.split ( r'\[File Version\]([^\[]*)', dummy )
-    if len ( hits ) > 2:
-        info [ 'file_version' ] = hits [1].strip ()
-    
-    # Looks for the sampling rate.
-    hits     = re.split ( r'\[Sampling Rate\]([^\[]*)', dummy )
-    if len ( hits ) > 2:
-        info [ 'sample_rate' ] = float ( hits [1] )
-    
-    # Looks for the number of samples.
-    hits     = re.split ( r'\[Samples\]([^\[]*)', dummy )
-    if len ( hits ) > 2:
-        info [ 'sample_count' ] = int ( hits [1] )
+    sections = parse_sections ( bytes ( subtree [ 'data' ] ).decode () )
     
-    # Looks for the number of channels.
-    hits     = re.split ( r'\[Channels\]([^\[]*)', dummy )
-    if len ( hits ) > 2:
-        info [ 'channel_count' ] = int ( hits [1] )
+    # Gets the file version, sampling rate and number of samples and channels.
+    info.update ( get_fields ( sections, eephfields ) )
     
     
     # Looks for the channel information.
-    hits     = re.split ( r'\[Basic Channel Data\]([^\[]*)', dummy )
-    assert len ( hits ) > 2, 'No channel definition. Cannot continue.'
-    
-    # Checks for the (mandatory) channel information header.
-    chaninfo = hits [1].strip ()
-    hits     = re.split ( r';label(?:[\s]+)calibration factor(.*)', chaninfo, 0, re.S )
-    assert len ( hits ) > 2, 'The channel information is not correct. Cannot continue.'
-    
-    # Parses the channel definition.
-    chaninfo = hits [1].strip ()
-    chaninfo = [ x.split () for x in chaninfo.splitlines () ];
-    chaninfo = pandas.DataFrame ( chaninfo );
-    
-    # Combines the calibration factors.
-    chaninfo [1] = chaninfo [1].astype ( float ) * chaninfo [2].astype ( float )
-    chaninfo = chaninfo [ [ 0, 1, 3, 4 ] ]
-    
-    # Adds the labels.
-    chaninfo.columns = [ 'label', 'calibration', 'unit', 'reference' ]
+    assert 'Basic Channel Data' in sections, 'No channel definition. Cannot continue.'
     
     # Stores the channel information.
-    info [ 'channels' ] = chaninfo
+    info [ 'channels' ] = parse_channels ( sections [ 'Basic Channel Data' ] )
     
     
-    # Gets the EEP header.
+    # Gets the recording information header and splits it into sections.
     subtree  = riff.get_subtree ( rifftree, [ 'info' ] )
-    dummy    = bytes ( subtree [ 'data' ] ).decode ()
+    sections = parse_sections ( bytes ( subtree [ 'data' ] ).decode () )
     
     # Looks for the acquistion date and fraction.
-    hits     = re.split ( r'\[StartDate\]([^\[]*)[.]*\[StartFraction\]([^\[]*)', dummy )
-    if len ( hits ) > 3:
-        acqdate  = float ( hits [1] )
-        acqfrac  = float ( hits [2] )
+    if 'StartDate' in sections and 'StartFraction' in sections:
+        acqdate  = float ( sections [ 'StartDate' ] )
+        acqfrac  = float ( sections [ 'StartFraction' ] )
         
         # Converts the acquisition date into POSIX time format.
         info [ 'acquisition_time' ] = acqdate * ( 60 * 60 * 24 ) - 2209161600 + acqfrac
     
-    # Looks for the file version.
-    hits     = re.split ( r'\[File Version\]([^\[]*)', dummy )
-    if len ( hits ) > 2:
-        info [ 'file_version' ] = hits [1].strip ()
-    
-    # Looks for the software identification.
-    hits     = re.split ( r'\[MachineMake\]([^\[]*)', dummy )
-    if len ( hits ) > 2:
-        info [ 'software_id' ] = hits [1].strip ()
-    
-    # Looks for the amplifier identification.
-    hits     = re.split ( r'\[MachineModel\]([^\[]*)', dummy )
-    if len ( hits ) > 2:
-        info [ 'hardware_id' ] = hits [1].strip ()
-    
-    # Looks for the subject name.
-    hits     = re.split ( r'\[SubjectName\]([^\[]*)', dummy )
-    if len ( hits ) > 2:
-        info [ 'subject_name' ] = hits [1].strip ()
-    
-    # Looks for the subject birth date.
-    hits     = re.split ( r'\[SubjectDateOfBirth\]([^\[]*)', dummy )
-    if len ( hits ) > 2:
-        info [ 'subject_birth' ] = hits [1].strip ()
+    # Gets the file version and the software, amplifier and subject identification.
+    info.update ( get_fields ( sections, infofields ) )
     
     
     # # Gets the event definition.
@@ -358,8 +898,9 @@ def read_info ( filename ):
     info = parse_video ( info )
     
     # Removes the raw event data.
-    for event in info [ 'events' ]:
-        del event [ 'rawdata' ]
+    info [ 'events' ] = numpy.rec.fromarrays (
+        [ info [ 'events' ] [ field ] for field in evtfields ],
+        names = evtfields )
     
     
     # Returns the information dictionary.
@@ -379,18 +920,41 @@ Based on libeep 3.3.177 functions on:
 
 """
 
+# Lists the event classes and the name of each one in the event table.
+evtclasses = {
+    'class dcEpochEvent_c':    'epoch',
+    'class dcEventMarker_c':   'marker',
+    'class dcArtefactEvent_c': 'artefact',
+    'class dcSpikeEvent_c':    'spike',
+    'class dcSeizureEvent_c':  'seizure',
+    'class dcSleepEvent_c':    'sleep',
+    'class dcRPeakEvent_c':    'rpeak' }
+
+# Lists the columns of the event table.
+evtcolumns = (
+    'class', 'id', 'event_class', 'uname', 'name', 'type', 'state',
+    'original', 'duration', 'offset', 'time', 'epoch_desc', 'active',
+    'ref', 'description', 'show_amplitude', 'show_duration' )
+
+
 # Main function to read *.evt (event) files.
+# The file is read at once and parsed from memory. The events are returned
+# as a table (DataFrame) with one row per event, in file order.
+@profiling.timed ( 'read_evt' )
 def read_evt ( filename ):
     
+    import pandas
+    
+    
     # Function to read an event library from an *.evt file.
-    def read_library ( fid ):
+    def read_library ():
         
         
         # Reads the library name.
-        name      = read_string ( fid )
+        name      = read_string ()
         
         # Reads the number of events.
-        nevent    = numpy.fromfile ( fid, 'uint32', 1 ) [0]
+        nevent,   = unpack ( '<I' )
         
         # Initializes the list of events.
         events    = []
@@ -399,41 +963,33 @@ def read_evt ( filename ):
         for eindex in range ( nevent ):
             
             # Reads the event class.
-            cname    = read_class ( fid )
+            cname    = read_class ()
+            
+            if cname not in evtclasses:
+                raise ValueError ( 'Unknown event class.' )
             
             # Reads the event using the class-specific function.
             if cname == 'class dcEpochEvent_c':
-                event = read_epoch    ( fid )
-                
-            elif cname == 'class dcEventMarker_c':
-                event = read_marker   ( fid )
-                
-            elif cname == 'class dcArtefactEvent_c':
-                event = read_artefact ( fid )
-                
-            elif cname == 'class dcSpikeEvent_c':
-                event = read_spike    ( fid )
-                
-            elif cname == 'class dcSeizureEvent_c':
-                event = read_seizure  ( fid )
-                
-            elif cname == 'class dcSleepEvent_c':
-                event = read_sleep    ( fid )
-                
-            elif cname == 'class dcRPeakEvent_c':
-                event = read_rpeak    ( fid )
-                
+                event    = read_epoch  ()
+            
+            # The other classes are read as event markers. The clinical
+            # classes (artefact, spike, seizure, sleep and R-peak) are
+            # assumed to have the marker layout, with no extra fields, which
+            # is checked once the whole file is read.
             else:
-                raise ValueError ( 'Unknown event class.' )
-        
+                if cname != 'class dcEventMarker_c':
+                    clinical.add ( evtclasses [ cname ] )
+                event    = read_marker ()
+            
             # Stores the event.
-            events = events + [ event ];
+            event [ 'class' ] = evtclasses [ cname ]
+            events.append ( event )
         
         
         # Sets the ouput.
         library = {
             'name':    name,
-            'entries': events }
+            'entries': pandas.DataFrame.from_records ( events, columns = evtcolumns ) }
         
         # Returns the library.
         return library
@@ -441,132 +997,99 @@ def read_evt ( filename ):
     
     
     # Function to read event entries of type "epoch".
-    def read_epoch    ( fid ):
+    def read_epoch ():
         
         
         # Reads the event.
-        event    = read_event ( fid )
+        event    = read_event ()
         
         
         # if version < 33
-        #   numpy.fromfile ( fid, 'int32', 1 ) [0]
+        #   unpack ( '<i' )
         # end
         
         
-        # Sets the ouput.
-        marker      = {
-        'class':          'marker',
-        'event':          event,
-        'chaninfo':       [],
-        'description':    event [ 'uname' ],
-        'show_amplitude': 0,
-        'show_duration':  0 }
-        
-        # Returns the marker dictionary.
-        return marker
+        # Sets the marker fields.
+        event [ 'active' ]         = ''
+        event [ 'ref' ]            = ''
+        event [ 'description' ]    = event [ 'uname' ]
+        event [ 'show_amplitude' ] = 0
+        event [ 'show_duration' ]  = 0
         
+        # Returns the event.
+        return event
+    
     
     
     # Function to read event entries of type "marker".
-    def read_marker   ( fid ):
+    def read_marker ():
         
         
         # Reads the event.
-        event    = read_event ( fid )
+        event    = read_event ()
         
         # Reads the channel information.
-        chaninfo = read_chaninfo ( fid )
+        event [ 'active' ]      = read_string ()
+        event [ 'ref' ]         = read_string ()
         
         # Reads the marker description.
-        desc     = read_string ( fid )
+        event [ 'description' ] = read_string ()
         
         
-        # if version >= 35
-        #   if version >= 103
-        show_amplitude = numpy.fromfile ( fid, 'int32', 1 ) [0]
-        #   else
-        #     show_amplitude = fread ( fid, 1, '*int8' );
-        #   end
-        show_duration = numpy.fromfile ( fid, 'int8', 1 ) [0]
-        # end
+        # Reads the display flags, if present.
+        if version >= 103:
+            show_amplitude, show_duration = unpack ( '<ib' )
+        elif version >= 35:
+            show_amplitude, show_duration = unpack ( '<bb' )
+        else:
+            show_amplitude, show_duration = 0, 0
         
+        event [ 'show_amplitude' ] = show_amplitude
+        event [ 'show_duration' ]  = show_duration
         
-        # Sets the ouput.
-        marker      = {
-        'class':          'marker',
-        'event':          event,
-        'chaninfo':       chaninfo,
-        'description':    desc,
-        'show_amplitude': show_amplitude,
-        'show_duration':  show_duration }
         
-        # Returns the marker dictionary.
-        return marker
-        
-    
-    
-    # Funtions not yet defeloped to read other type of entries.
-    def read_artefact ( fid ): raise NotImplementedError ( 'Not yet coded.' )
-    def read_spike    ( fid ): raise NotImplementedError ( 'Not yet coded.' )
-    def read_seizure  ( fid ): raise NotImplementedError ( 'Not yet coded.' )
-    def read_sleep    ( fid ): raise NotImplementedError ( 'Not yet coded.' )
-    def read_rpeak    ( fid ): raise NotImplementedError ( 'Not yet coded.' )
+        # Returns the event.
+        return event
     
     
     
     # Function to read the basic event information.
-    def read_event ( fid ):
-        
-        
-        # Reads the event identifier.
-        ident = numpy.fromfile ( fid, 'int32', 1 ) [0]
+    def read_event ():
         
-        # Reads the event GUID.
-        numpy.fromfile ( fid, 'uint32', 1 )
-        numpy.fromfile ( fid, 'uint16', 1 )
-        numpy.fromfile ( fid, 'uint16', 1 )
-        numpy.fromfile ( fid, 'uint8', 8 )
         
+        # Reads the event identifier and skips the GUID.
+        ident,   = unpack ( '<i16x' )
         
         # Reads the event class.
-        cname    = read_class ( fid )
+        cname    = read_class ()
         
         # Reads the event name.
-        uname    = read_string ( fid )
-        ename    = read_string ( fid )
+        uname    = read_string ()
+        ename    = read_string ()
         
-        # Reads the event type and state.
-        etype    = numpy.fromfile ( fid, 'int32', 1 ) [0]
-        state    = numpy.fromfile ( fid, 'int32', 1 ) [0]
+        # Reads the event type, state, original tag, duration, offset and timestamp.
+        etype, state, original, duration, offset, days, fraction = unpack ( '<iibdddd' )
         
-        # Reads the original tag.
-        original = numpy.fromfile ( fid, 'int8', 1 ) [0]
+        # Converts the timestamp (days from 1899-12-30) to Unix time.
+        time     = days * ( 60 * 60 * 24 ) - 2209161600 + fraction
         
-        # Reads the event duration.
-        duration = numpy.fromfile ( fid, 'float64', 1 ) [0]
-        offset   = numpy.fromfile ( fid, 'float64', 1 ) [0]
-        
-        # Reads the timestamp.
-        time     = numpy.fromfile ( fid, 'float64', 2 )
-        time     = time [0] * ( 60 * 60 * 24 ) - 2209161600 + time [1]
-    
         # Reads the epoch descriptors.
-        epoch    = read_epoch_descriptors ( fid )
+        epoch    = read_epoch_descriptors ()
         
         
         # Sets the ouput.
         event     = {
-            'id':         ident,
-            'class':      cname,
-            'uname':      uname,
-            'name':       ename,
-            'type':       etype,
-            'state':      state,
-            'original':   original,
-            'duration':   duration,
-            'offset':     offset,
-            'time':       time,
-            'epoch_desc': epoch }
+            'id':          ident,
+            'event_class': cname,
+            'uname':       uname,
+            'name':        ename,
+            'type':        etype,
+            'state':       state,
+            'original':    original,
+            'duration':    duration,
+            'offset':      offset,
+            'time':        time,
+            'epoch_desc':  epoch }
         
         # Returns the event.
         return event
@@ -574,34 +1097,32 @@ def read_evt ( filename ):
     
     
     # Function to read the event descriptor(s).
-    def read_epoch_descriptors ( fid ):
+    def read_epoch_descriptors ():
         
         
         # Gets the number of epoch descriptors.
-        ndesc  = numpy.fromfile ( fid, 'int32', 1 ) [0]
+        ndesc,   = unpack ( '<i' )
         
         # Initializes the list of descriptors.
-        descs  = []
+        descs    = []
         
         # Goes through each descriptor.
         for dindex in range ( ndesc ):
             
             # Gets the name of the descriptor.
-            dname    = read_string ( fid )
+            dname    = read_string ()
             
             # Reads the data.
-            ddata    = read_data ( fid )
+            ddata    = read_data ()
             
             # Reads the descriptor unit.
-            dunit    = read_string ( fid )
+            dunit    = read_string ()
             
             # Stores the output.
-            desc     = {
+            descs.append ( {
                 'name': dname,
                 'data': ddata,
-                'unit': dunit }
-            
-            descs    = descs + [ desc ];
+                'unit': dunit } )
         
         
         # Returns the descriptors.
@@ -609,29 +1130,11 @@ def read_evt ( filename ):
     
     
     
-    # Function to read the channel affected by the event.
-    def read_chaninfo ( fid ):
-        
-        # Gets the active channel and the reference.
-        active  = read_string ( fid )
-        ref     = read_string ( fid )
-        
-        
-        # Prepares the output.
-        chaninfo = {
-            'active': active,
-            'ref':    ref }
-        
-        # Returns the channel information.
-        return chaninfo
-    
-    
-    
     # Helper function to read the entry class.
-    def read_class ( fid ):
+    def read_class ():
         
         # Reads the class tag.
-        tag   = numpy.fromfile ( fid, 'int32', 1 ) [0]
+        tag,     = unpack ( '<i' )
         
         # If no tag, exits.
         if tag == 0:
@@ -640,7 +1143,7 @@ def read_evt ( filename ):
         assert tag == -1, 'Unknown class tag.'
         
         # Reads the class name.
-        cname = read_string ( fid )
+        cname    = read_string ()
         
         # Returns the class name.
         return cname
@@ -648,45 +1151,35 @@ def read_evt ( filename ):
     
     
     # Helper function to read a data piece.
-    def read_data ( fid ):
+    def read_data ():
         
         
         # Gets the type of data.
-        datatype = numpy.fromfile ( fid, 'int16', 1 ) [0]
+        datatype, = unpack ( '<h' )
         
         # Reads the data.
-        if datatype == 0:
-            pass
+        data     = None
         
-        elif datatype == 1:
+        if datatype in ( 0, 1, 2 ** 10 ):
             pass
         
         elif datatype == 2:
-            data     = numpy.fromfile ( fid, 'int16', 1 ) [0]
+            data,    = unpack ( '<h' )
         
         elif datatype == 3:
-            data     = numpy.fromfile ( fid, 'int32', 1 ) [0]
+            data,    = unpack ( '<i' )
         
         elif datatype == 4:
-            data     = numpy.fromfile ( fid, 'float32', 1 ) [0]
+            data,    = unpack ( '<f' )
         
         elif datatype == 5:
-            data     = numpy.fromfile ( fid, 'float64', 1 ) [0]
+            data,    = unpack ( '<d' )
         
         elif datatype == 8:
-            data     = read_unicode ( fid )
+            data     = read_unicode ()
         
-        elif datatype == 11:
-            raise ValueError ( 'Data type not supported.' )
-        
-        elif datatype == 2 ** 9:
-            data     = read_array ( fid )
-        
-        elif datatype == 2 ** 10:
-            pass
-        
-        elif datatype & ( 2 ** 13 | 2 ** 14 ):
-            data     = read_array ( fid )
+        elif datatype == 2 ** 9 or datatype & ( 2 ** 13 | 2 ** 14 ):
+            data     = read_array ()
         
         else:
             raise ValueError ( 'Data type not supported.' )
@@ -698,28 +1191,23 @@ def read_evt ( filename ):
     
     
     # Helper function to read a data array.
-    def read_array ( fid ):
+    def read_array ():
         
-        # Gets the type of data.
-        datatype = numpy.fromfile ( fid, 'int16', 1 ) [0]
+        nonlocal cursor
         
-        # Reads a dummy element.
-        if datatype == 4:
-            numpy.fromfile ( fid, 'float32', 1 )
         
-        else:
-            raise ValueError ( 'Data type not supported.' )
+        # Gets the type of data and skips a dummy element.
+        datatype, = unpack ( '<h' )
         
+        if datatype != 4:
+            raise ValueError ( 'Data type not supported.' )
         
         # Gets the length of the array.
-        datalen  = numpy.fromfile ( fid, 'uint32', 1 ) [0]
+        datalen, = unpack ( '<4xI' )
         
         # Reads the data.
-        if datatype == 4:
-            data     = numpy.fromfile ( fid, 'float32', datalen )
-        
-        else:
-            raise ValueError ( 'Data type not supported.' )
+        data     = numpy.frombuffer ( buffer, '<f4', datalen, cursor ).copy ()
+        cursor  += 4 * datalen
         
         
         # Returns the array.
@@ -727,16 +1215,18 @@ def read_evt ( filename ):
     
     
     
-    # Helper function to read Unicode (utf-16) strings.
-    def read_string ( fid ):
+    # Helper function to read (utf-8) strings.
+    def read_string ():
+        
+        nonlocal cursor
         
         # Gets the length of the text.
-        length = numpy.fromfile ( fid, 'uint8', 1 ) [0]
+        length   = buffer [ cursor ]
         assert length < 255, 'Text too long'
         
         # Reads the text.
-        string = numpy.fromfile ( fid, 'uint8', length )
-        string = bytes ( string ).decode ()
+        string   = buffer [ cursor + 1: cursor + 1 + length ].decode ()
+        cursor  += 1 + length
         
         # Returns the string.
         return string
@@ -744,51 +1234,77 @@ def read_evt ( filename ):
     
     
     # Helper function to read Unicode (utf-16) strings.
-    def read_unicode ( fid ):
+    def read_unicode ():
+        
+        nonlocal cursor
         
         # Gets the length of the text.
-        length = numpy.fromfile ( fid, 'int32', 1 ) [0]
+        length,  = unpack ( '<i' )
         assert length < 255, 'Text too long'
         
         # Reads the text.
-        string = numpy.fromfile ( fid, 'uint8', length )
-        string = bytes ( string ).decode ( 'utf16' )
+        string   = buffer [ cursor: cursor + length ].decode ( 'utf16' )
+        cursor  += length
         
         # Returns the string.
         return string
     
     
     
-    # Opens the file to read.
-    with open ( filename, 'rb' ) as fid:
-        
-        # Reads the event header.
-        time     = numpy.fromfile ( fid, 'uint32', 3 )
-        version  = numpy.fromfile ( fid, 'int32', 1 ) [0]
-        compress = numpy.fromfile ( fid, 'int32', 1 ) [0]
-        encrpyt  = numpy.fromfile ( fid, 'int32', 1 ) [0]
+    # Helper function to read fixed-size fields and advance the cursor.
+    def unpack ( fmt ):
         
-        # Checks the file header.
-        assert compress == 0, 'This function only works with noncompressed event files.'
-        assert encrpyt == 0, 'This function only works with nonencrypted event files.'
+        nonlocal cursor
         
+        # Reads the fields.
+        fields   = struct.unpack_from ( fmt, buffer, cursor )
+        cursor  += struct.calcsize ( fmt )
         
-        # Gets the main class.
-        cname    = read_class ( fid )
-        assert cname == 'class dcEventsLibrary_c', 'Bad file.'
-        
-        # Reads the event library.
-        library  = read_library ( fid )
-        
-        # Adds the header.
-        library [ 'time ']     = time
-        library [ 'version ']  = version
-        library [ 'compress '] = compress
-        library [ 'encrpyt ']  = encrpyt
+        # Returns the fields.
+        return fields
+    
+    
+    
+    # Reads the whole file at once.
+    with open ( filename, 'rb' ) as fid:
+        buffer   = fid.read ()
+    
+    cursor   = 0
+    profiling.count ( 'evt.bytes_read', len ( buffer ) )
+    
+    
+    # Reads the event header.
+    time     = unpack ( '<3I' )
+    version, compress, encrpyt = unpack ( '<3i' )
+    
+    # Checks the file header.
+    assert compress == 0, 'This function only works with noncompressed event files.'
+    assert encrpyt == 0, 'This function only works with nonencrypted event files.'
+    
+    
+    # Gets the main class.
+    cname    = read_class ()
+    assert cname == 'class dcEventsLibrary_c', 'Bad file.'
+    
+    # Reads the event library.
+    clinical = set ()
+    try:
+        library  = read_library ()
+    
+    # With clinical events, a failure means that their layout is different.
+    except ( struct.error, UnicodeDecodeError, AssertionError, IndexError, ValueError ) as error:
+        if not clinical:
+            raise
+        raise ValueError ( 'Events of class %s with an unsupported layout.' % ', '.join ( sorted ( clinical ) ) ) from error
+    
+    # With clinical events, the events must fill the whole file.
+    if clinical and cursor != len ( buffer ):
+        raise ValueError ( 'Events of class %s with an unsupported layout.' % ', '.join ( sorted ( clinical ) ) )
     
     
     # Returns only the contents of the library.
     event    = library [ 'entries' ]
+    profiling.count ( 'evt.events', len ( event ) )
     return event
 
 
@@ -801,11 +1317,13 @@ Code for reading the sidecard segments file.
 # Function to read the EEProbe segment (*.seg) file.
 def read_seg ( filename ):
     
+    import pandas
+    
     
     # Opens the file to read.
     try:
         with open ( filename, 'rb' ) as fid:
-        
+            
             # Gets the total file length.
             fid.seek ( 0, 2 )
             flen = fid.tell ()
@@ -852,11 +1370,17 @@ Code for reading the data from the compressed data stream.
 """
 
 # Function to parse the raw data (raw3 field) of the EEProbe file.
+@profiling.timed ( 'read_rawdata' )
 def read_rawdata ( filename ):
     
-    
-    # Reads the RIFF file tree, if required.
-    rifftree = riff.read_file ( filename )
+    # Opens the file and returns its raw data definition.
+    return open_cnt ( filename ).rawdata
+
+
+
+# Function to parse the raw data (raw3 field) from the RIFF tree.
+@profiling.timed ( 'parse_rawdata' )
+def parse_rawdata ( rifftree ):
     
     
     # Gets the raw data epoch information.
@@ -893,104 +1417,711 @@ def read_rawdata ( filename ):
         'channel_order': chorder,
         'data':          data }
     
+    # Counts the compressed data.
+    profiling.count ( 'raw3.bytes', len ( data ) )
+    profiling.count ( 'raw3.epochs', nepoch )
+    
     # Returns the raw data dictionary.
     return rawdata
 
 
 
-# Function to read 
-def read_data ( filename, info = None ):
+# Function to read the calibrated data, optionally only a window of samples
+# [start, stop) and a subset of channels (labels or indexes), converted to
+# 'units' and stored as 'dtype' (see CntFile.get_data).
+@profiling.timed ( 'read_data' )
+def read_data ( filename, info = None, start = None, stop = None, picks = None, nthreads = None, dtype = 'float64', units = None, raw_int32 = False ):
+    
+    # Opens the file, if required, and decodes the data.
+    return open_cnt ( filename, info ).get_data ( start, stop, picks, nthreads, dtype = dtype, units = units, raw_int32 = raw_int32 )
+
+
+
+
+# Function to iterate over the calibrated data in chunks of samples.
+def iter_chunks ( filename, chunk_samples = None, overlap = 0, start = None, stop = None, picks = None, nthreads = None, dtype = 'float64', units = None ):
+    
+    # Opens the file, if required, and iterates over the chunks.
+    yield from open_cnt ( filename ).iter_chunks ( chunk_samples, overlap, start, stop, picks, nthreads, dtype, units )
+
+
+
+
+"""
+Code for converting the raw data and header into an MNE object.
+"""
+@profiling.timed ( 'read_mne' )
+def read_mne ( filename, preload = True, nthreads = None ):
     
+    # Opens the file, if required, and builds the MNE Raw object.
+    return open_cnt ( filename ).get_mne ( preload, nthreads )
+
+
+
+# Function to read the trials around the events of some types (by default,
+# all the events but the segment onsets), from tmin to tmax seconds (both
+# included, as MNE). Only the raw3 epochs overlapping each trial are decoded,
+# and the trials are decoded in parallel. The trials not fully inside one
+# recording segment are dropped.
+# Returns an MNE EpochsArray (in volts), or, if return_numpy is True, a
+# (trials x channels x samples) array (in 'units') and the selected events.
+@profiling.timed ( 'read_epochs' )
+def read_epochs ( filename, event_types = None, tmin = -0.2, tmax = 0.5, picks = None, nthreads = None, dtype = 'float64', units = None, return_numpy = False ):
+    
+    
+    # Opens the file, if required.
+    cntfile  = open_cnt ( filename )
+    info     = cntfile.info
+    picks    = cntfile.get_picks ( picks )
+    
+    # Gets the window of the trials, in samples.
+    sfreq    = info [ 'sample_rate' ]
+    first    = int ( round ( tmin * sfreq ) )
+    last     = int ( round ( tmax * sfreq ) ) + 1
+    if last <= first:
+        raise ValueError ( 'tmax must not be lower than tmin.' )
+    
+    
+    # Selects the events, without the segment onsets.
+    events   = info [ 'events' ]
+    isseg    = events [ 'description' ] == 'New segment'
+    if event_types is None:
+        hits     = ~isseg
+    else:
+        event_types = [ event_types ] if isinstance ( event_types, str ) else list ( event_types )
+        hits     = numpy.isin ( events [ 'type' ].astype ( str ), event_types ) & ~isseg
+    
+    # Keeps the trials inside the data and not crossing a segment onset.
+    onsets   = events [ 'sample' ].astype ( 'int64' )
+    bounds   = numpy.unique ( onsets [ isseg ] )
+    hits    &= ( onsets + first >= 0 ) & ( onsets + last <= info [ 'sample_count' ] )
+    hits    &= numpy.searchsorted ( bounds, onsets + first, side = 'right' ) == numpy.searchsorted ( bounds, onsets + last - 1, side = 'right' )
+    events   = events [ hits ]
+    
+    
+    # Decodes the trials (in volts, for MNE).
+    data     = cntfile.get_epochs ( events [ 'sample' ], first, last, picks, nthreads, dtype, units if return_numpy else 'V' )
+    
+    # Returns the data and the events, if requested.
+    if return_numpy:
+        return data, events
+    
+    
+    # Builds the MNE Epochs object.
+    from .tools import mnetools
+    return mnetools.build_epochs ( info, data, events, tmin = first / sfreq, picks = picks, event_types = event_types )
+
+
+
+
+"""
+Code for reading several synchronized recordings (e.g. hyperscanning dyads).
+"""
+
+# Function to open several recordings and align them on a common timeline,
+# by their acquisition time or by a common trigger event (see CntGroup).
+def read_group ( filenames, event = None ):
     
-    # Gets the EEProbe header and raw data.
-    info     = read_info ( filename )
-    rawdata  = read_rawdata ( filename )
+    # Opens the files and aligns them.
+    return CntGroup ( filenames, event )
+
+
+
+# Function to open a pair of recordings and align them (see CntGroup).
+def read_dyad ( filename1, filename2, event = None ):
     
+    # Opens the files and aligns them.
+    return CntGroup ( [ filename1, filename2 ], event )
+
+
+
+# Class to read several recordings, with the same sampling rate, aligned on
+# a common timeline. The samples are mapped to time from the onset of their
+# segment, so pauses are taken into account. The recordings are aligned by
+# these times and, if 'event' is provided, refined with the onsets of the
+# events of that type, matched to the nearest ones of the first recording.
+# The timeline joins the pieces of time recorded in all the recordings: it
+# starts when all the recordings have started and ends when the first one
+# ends. Without pauses, sample n of the timeline is sample n + shifts [r] of
+# recording r.
+class CntGroup:
     
-    # Gets the information from the system-specific header.
-    nchan    = info [ 'channel_count' ]
-    nsamp    = info [ 'sample_count' ]
-    chcalib  = numpy.array ( info [ 'channels' ].calibration )
     
-    # Gets the raw data information.
-    nepoch   = rawdata [ 'epoch_count' ]
-    sepoch   = rawdata [ 'epoch_length' ]
-    starts   = rawdata [ 'epoch_start' ]
-    chorder  = rawdata [ 'channel_order' ]
-    rawdata  = rawdata [ 'data' ]
+    # Opens the files concurrently and aligns them.
+    def __init__ ( self, filenames, event = None ):
+        
+        import concurrent.futures
+        
+        
+        # Opens the files (or takes the open files), parsing the headers in parallel.
+        with concurrent.futures.ThreadPoolExecutor ( max_workers = max ( len ( filenames ), 1 ) ) as pool:
+            self.files    = list ( pool.map ( open_cnt, filenames ) )
+        
+        if len ( self.files ) == 0:
+            raise ValueError ( 'At least one recording is required.' )
+        
+        # Checks that all the recordings have the same sampling rate.
+        self.sample_rate = self.files [0].info [ 'sample_rate' ]
+        if any ( cntfile.info [ 'sample_rate' ] != self.sample_rate for cntfile in self.files ):
+            raise ValueError ( 'All the recordings must have the same sampling rate.' )
+        
+        
+        # Gets the time offset of each recording to the first one.
+        self.event    = event
+        self.offsets  = numpy.array ( [ self.get_offset ( cntfile ) for cntfile in self.files ], dtype = 'float64' )
+        
+        # Gets the pieces of the common timeline: the first sample of each
+        # piece in the timeline, its length and its first sample in each
+        # recording. Without pauses, there is only one piece.
+        self.onsets, self.lengths, self.starts = self.get_pieces ()
+        if len ( self.lengths ) == 0:
+            raise ValueError ( 'The recordings do not overlap.' )
+        
+        # Gets the length of the common timeline, and its first sample in each recording.
+        self.sample_count = int ( self.lengths.sum () )
+        self.shifts   = self.starts [0]
+        
+        # Gets the acquisition time of the first sample of the timeline.
+        self.start_time = float ( get_sample_times ( self.files [0].info, self.shifts [:1] ) [0] )
     
     
-    # Initializes the list of epochs.
-    data     = [];
     
-    # Goes through each epoch but the last.
-    for eindex in range ( nepoch - 1 ):
+    # Function to get the time, in seconds, to add to the sample times of a
+    # recording to align it with the first recording.
+    def get_offset ( self, cntfile ):
         
-        # Reads the current epoch.
-        datum, _ = raweep.read_block ( rawdata, sepoch, nchan, 8 * starts [ eindex ] )
         
-        # Converts the bytes stream into an int32 matrix.
-        datum    = numpy.frombuffer (datum, dtype = 'int32' )
-        datum    = datum.reshape ( nchan, sepoch ).T
+        # If no event is defined, aligns the acquisition times.
+        if self.event is None:
+            return 0.0
         
         
-        # Stores the samples.
-        data     = data + [ datum ]
+        # Gets the times of the event in both recordings.
+        reference = self.files [0].info
+        times0   = get_sample_times ( reference, get_onsets ( reference, self.event ) )
+        times    = get_sample_times ( cntfile.info, get_onsets ( cntfile.info, self.event ) )
+        if len ( times0 ) == 0 or len ( times ) == 0:
+            raise ValueError ( 'Event \'%s\' not found in all the recordings.' % self.event )
+        
+        # Matches each event of the first recording to the nearest one in time
+        # (so missing events are skipped).
+        upper    = numpy.minimum ( numpy.searchsorted ( times, times0 ), len ( times ) - 1 )
+        lower    = numpy.maximum ( upper - 1, 0 )
+        nearest  = numpy.where ( numpy.abs ( times [ lower ] - times0 ) <= numpy.abs ( times [ upper ] - times0 ), lower, upper )
+        
+        
+        # Returns the median delay of the matched events.
+        return float ( numpy.median ( times0 - times [ nearest ] ) )
     
     
-    # Gets the number of samples in the last epoch.
-    srem     = nsamp - sepoch * ( nepoch - 1 )
     
-    # Reads the last block.
-    datum, _ = raweep.read_block ( rawdata, srem, nchan, 8 * starts [ -1 ] )
+    # Function to get the pieces of time recorded in all the recordings, from
+    # the onset in time of the segments of each one.
+    def get_pieces ( self ):
+        
+        
+        # Gets the first sample, the length and the aligned time span of the
+        # segments of each recording.
+        segments = []
+        for cntfile, offset in zip ( self.files, self.offsets ):
+            ssamples = cntfile.info [ 'segments' ].start_sample.to_numpy ( dtype = 'int64' )
+            scounts  = cntfile.info [ 'segments' ].sample_count.to_numpy ( dtype = 'int64' )
+            stimes   = cntfile.info [ 'segments' ].start_time.to_numpy ( dtype = 'float64' ) + offset
+            segments.append ( ( ssamples, scounts, stimes, stimes + scounts / self.sample_rate ) )
+        
+        # Intersects the time spans of all the recordings.
+        spans    = list ( zip ( segments [0] [2], segments [0] [3] ) )
+        for _, _, tstarts, tstops in segments [1:]:
+            spans    = [
+                ( max ( first, tstart ), min ( last, tstop ) )
+                for first, last in spans
+                for tstart, tstop in zip ( tstarts, tstops )
+                if max ( first, tstart ) < min ( last, tstop ) ]
+        
+        
+        # Gets the first sample of each span in each recording, and the
+        # samples available in all of them.
+        lengths  = []
+        starts   = []
+        for tstart, _ in spans:
+            first    = []
+            count    = []
+            for ssamples, scounts, stimes, stops in segments:
+                sindex   = numpy.flatnonzero ( ( stimes <= tstart ) & ( tstart < stops ) ) [0]
+                offset   = int ( round ( ( tstart - stimes [ sindex ] ) * self.sample_rate ) )
+                first.append ( ssamples [ sindex ] + offset )
+                count.append ( scounts [ sindex ] - offset )
+            if min ( count ) > 0:
+                lengths.append ( min ( count ) )
+                starts.append ( first )
+        
+        
+        # Returns the onset and length of each piece in the timeline, and its
+        # first sample in each recording.
+        lengths  = numpy.array ( lengths, dtype = 'int64' )
+        starts   = numpy.array ( starts, dtype = 'int64' ).reshape ( len ( lengths ), len ( self.files ) )
+        onsets   = numpy.concatenate ( ( [ 0 ], numpy.cumsum ( lengths ) [ :-1 ] ) ).astype ( 'int64' )
+        return onsets, lengths, starts
     
-    # Converts the bytes stream into an int32 matrix.
-    datum    = numpy.frombuffer (datum, dtype = 'int32' )
-    datum    = datum.reshape ( nchan, srem ).T
     
-    # Stores the samples.
-    data     = data + [ datum ]
+    
+    # Function to list the pieces of the timeline overlapping the window
+    # [start, stop): the first sample and length of the overlap in the
+    # timeline and its first sample in each recording.
+    def list_pieces ( self, start, stop ):
+        
+        pieces   = []
+        for onset, length, first in zip ( self.onsets, self.lengths, self.starts ):
+            tfirst   = max ( start, onset )
+            tlast    = min ( stop, onset + length )
+            if tfirst < tlast:
+                pieces.append ( ( int ( tfirst ), int ( tlast - tfirst ), first + ( tfirst - onset ) ) )
+        return pieces
     
     
-    # Concatenates all the epochs.
-    data     = numpy.concatenate ( data, 0 )
     
-    # Reorders the channels and applies the calibration.
-    data     = data [ :, chorder ]
-    data     = chcalib * data;
+    # Function to get the limits of a window of the common timeline.
+    def get_window ( self, start = None, stop = None ):
+        
+        # Sets the default limits.
+        start    = 0 if start is None else int ( start )
+        stop     = self.sample_count if stop is None else int ( stop )
+        
+        # Checks the limits.
+        if start < 0 or stop > self.sample_count or start > stop:
+            raise ValueError ( 'The requested window [%i, %i) is outside the common data [0, %i).' % ( start, stop, self.sample_count ) )
+        
+        # Returns the limits.
+        return start, stop
     
     
-    # Returns the data.
-    return data
+    
+    # Function to decode the same window [start, stop) of the common timeline
+    # from all the recordings. Returns a list of (samples x channels) arrays
+    # (see CntFile.get_data). Only the epochs in the window are decoded.
+    def get_data ( self, start = None, stop = None, picks = None, nthreads = None, dtype = 'float64', units = None ):
+        
+        
+        # Gets the window and the pieces of the timeline in it.
+        start, stop = self.get_window ( start, stop )
+        pieces   = self.list_pieces ( start, stop )
+        
+        # Decodes the window of each recording, piece by piece.
+        data     = []
+        for findex, cntfile in enumerate ( self.files ):
+            chunks   = [
+                cntfile.get_data ( first [ findex ], first [ findex ] + length, picks, nthreads, dtype = dtype, units = units )
+                for _, length, first in pieces ]
+            data.append ( chunks [0] if len ( chunks ) == 1 else numpy.concatenate ( chunks ) )
+        
+        # Returns the data.
+        return data
+    
+    
+    
+    # Function to iterate over time-locked chunks of all the recordings.
+    # Yields the first sample of each chunk, in the common timeline, and a
+    # list with one (samples x channels) array per recording (see
+    # CntFile.iter_chunks). The chunks do not span the pauses between pieces
+    # of the timeline. The recordings are decoded concurrently.
+    def iter_chunks ( self, chunk_samples = None, overlap = 0, start = None, stop = None, picks = None, nthreads = None, dtype = 'float64', units = None ):
+        
+        import concurrent.futures
+        
+        
+        # Gets the window.
+        start, stop = self.get_window ( start, stop )
+        
+        
+        # Goes through the pieces of the timeline in the window.
+        with concurrent.futures.ThreadPoolExecutor ( max_workers = len ( self.files ) ) as pool:
+            for onset, length, first in self.list_pieces ( start, stop ):
+                
+                # Builds the (shifted) iterators of each recording.
+                iterators = [
+                    cntfile.iter_chunks ( chunk_samples, overlap, first [ findex ], first [ findex ] + length, picks, nthreads, dtype, units )
+                    for findex, cntfile in enumerate ( self.files ) ]
+                
+                # Advances all the iterators at once, in parallel (the
+                # decoding releases the GIL).
+                while True:
+                    chunks   = list ( pool.map ( lambda iterator: next ( iterator, None ), iterators ) )
+                    if chunks [0] is None:
+                        break
+                    
+                    # Returns the onset in the timeline and the data.
+                    yield onset + chunks [0] [0] - first [0], [ data for _, data in chunks ]
+
+
+
+# Function to get the onsets, in samples, of the events of a type.
+def get_onsets ( info, event ):
+    
+    # Selects the events, without the segment onsets.
+    events   = info [ 'events' ]
+    hits     = ( events [ 'type' ] == event ) & ( events [ 'description' ] != 'New segment' )
+    
+    # Returns the sorted onsets.
+    return numpy.sort ( events [ 'sample' ] [ hits ].astype ( 'int64' ) )
+
+
+
+# Function to get the acquisition time, in seconds, of samples of a recording,
+# from the onset in time of the segment of each sample.
+def get_sample_times ( info, samples ):
+    
+    # Gets the segment definition.
+    stimes   = info [ 'segments' ].start_time.to_numpy ( dtype = 'float64' )
+    ssamples = info [ 'segments' ].start_sample.to_numpy ( dtype = 'int64' )
+    
+    # Gets the segment of each sample and its time.
+    samples  = numpy.asarray ( samples, dtype = 'int64' )
+    ssegment = numpy.maximum ( numpy.searchsorted ( ssamples, samples, side = 'right' ) - 1, 0 )
+    return stimes [ ssegment ] + ( samples - ssamples [ ssegment ] ) / info [ 'sample_rate' ]
+
 
 
 
 """
-Code for converting the raw data and header into an MNE object.
+Code for writing EEProbe files.
 """
-def read_mne ( filename ):
+
+# Function to write an EEProbe file, and its sidecar event and segment files,
+# from (samples x channels) data and a file information (as from read_info).
+# Integer data is stored as it is. Floating point data, in 'units' (by
+# default, the units of each channel), is divided by the calibration factors
+# and rounded. The data is compressed in epochs of 'epoch_length' samples (by
+# default, one second), selecting the shortest raw3 method for each channel
+# and epoch. The file is RF64 if requested or if it can exceed 4 GiB.
+def write_cnt ( filename, data, info, units = None, epoch_length = None, rf64 = None ):
+    
+    
+    # Checks the data.
+    data     = numpy.asarray ( data )
+    nchan    = len ( info [ 'channels' ] )
+    
+    if data.ndim != 2 or data.shape [1] != nchan:
+        raise ValueError ( 'The data must be an array of (samples x channels), with %i channels.' % nchan )
+    if data.shape [0] == 0 or nchan == 0:
+        raise ValueError ( 'The data must have at least one sample and one channel.' )
+    if data.dtype.kind not in 'iuf':
+        raise ValueError ( 'The data must be of integer or floating point type.' )
+    if data.dtype.kind in 'iu' and ( data.min () < -2 ** 31 or data.max () > 2 ** 31 - 1 ):
+        raise ValueError ( 'The data does not fit in 32-bit integers.' )
+    
+    
+    # Gets the dimensions of the data and of the epochs.
+    nsamp    = data.shape [0]
+    sfreq    = float ( info [ 'sample_rate' ] )
+    
+    # Checks that the segments, if more than one, cover exactly the data.
+    # Otherwise the first segment, implicit in the file, would not match.
+    segments = info.get ( 'segments' )
+    if segments is not None and len ( segments ) > 1:
+        scounts  = segments.sample_count.to_numpy ( dtype = 'int64' )
+        if numpy.any ( scounts < 0 ) or scounts.sum () != nsamp:
+            raise ValueError ( 'The segments (%i samples) do not match the data (%i samples).' % ( scounts.sum (), nsamp ) )
+    sepoch   = int ( epoch_length or max ( round ( sfreq ), 1 ) )
+    nepoch   = -( -nsamp // sepoch )
+    
+    # Gets the scale to convert floating point data into integers.
+    if data.dtype.kind == 'f':
+        scale    = get_scale ( info, units )
+        if numpy.any ( scale == 0 ) or not numpy.all ( numpy.isfinite ( scale ) ):
+            raise ValueError ( 'The calibration of some channels is not valid, or their units are unknown.' )
+    
+    # Uses RF64 if the file can exceed the RIFF limit.
+    if rf64 is None:
+        rf64     = nchan * ( 4 * nsamp + nepoch ) + 2 ** 20 >= 2 ** 32
+    plen     = 8 if rf64 else 4
+    
+    
+    # Builds the headers.
+    eeph     = build_eeph ( info, nsamp )
+    header   = build_header ( info )
+    
+    # Writes the file.
+    with open ( filename, 'wb' ) as fid:
+        
+        # Writes the RIFF root and the headers.
+        root     = riff.start_chunk ( fid, 'RF64' if rf64 else 'RIFF', plen, 'CNT ' )
+        riff.write_chunk ( fid, 'eeph', eeph.encode (), plen )
+        riff.write_chunk ( fid, 'info', header.encode (), plen )
+        
+        # Writes the raw3 list, reserving the epoch table.
+        raw3     = riff.start_chunk ( fid, 'LIST', plen, 'raw3' )
+        eptable  = riff.start_chunk ( fid, 'ep', plen )
+        fid.write ( bytes ( 8 * ( nepoch + 1 ) ) )
+        riff.end_chunk ( fid, eptable, plen )
+        riff.write_chunk ( fid, 'chan', numpy.arange ( nchan, dtype = '<u2' ).tobytes (), plen )
+        
+        
+        # Encodes the data in groups of epochs, so the memory used does not
+        # depend on the length of the recording.
+        stream   = riff.start_chunk ( fid, 'data', plen )
+        nchunk   = sepoch * max ( 1, 2 ** 22 // ( sepoch * nchan ) )
+        offsets  = []
+        position = 0
+        for first in range ( 0, nsamp, nchunk ):
+            
+            # Converts the data into integers, if required.
+            block    = data [ first: first + nchunk ]
+            if data.dtype.kind == 'f':
+                block    = numpy.rint ( block / scale )
+                if not numpy.all ( numpy.abs ( block ) < 2 ** 31 ):
+                    raise ValueError ( 'The data does not fit in 32-bit integers after calibration.' )
+            
+            # Encodes the epochs and writes them.
+            encoded, starts = raweep.write_blocks ( block.astype ( 'int32' ), sepoch )
+            offsets.append ( numpy.frombuffer ( starts, dtype = 'uint64' ) + position )
+            fid.write ( encoded )
+            position += len ( encoded )
+        
+        riff.end_chunk ( fid, stream, plen )
+        
+        
+        # Fills the epoch table: epoch length and byte offset of each epoch.
+        fid.seek ( eptable + 4 + plen, 0 )
+        fid.write ( numpy.concatenate ( [ [ sepoch ] ] + offsets ).astype ( '<u8' ).tobytes () )
+        fid.seek ( 0, 2 )
+        
+        # Finishes the lists.
+        riff.end_chunk ( fid, raw3, plen )
+        riff.end_chunk ( fid, root, plen )
+    
+    
+    # Writes the sidecar files.
+    write_seg ( re.sub ( '.cnt$', '.seg', filename ), segments )
+    write_evt ( re.sub ( '.cnt$', '.evt', filename ), *get_evt ( info, nsamp ) )
+    
+    # Forgets the memoized index and information of the overwritten file.
+    clear_memo ( filename )
+
+
+
+# Function to build the EEP header.
+def build_eeph ( info, nsamp ):
+    
+    
+    # Builds the channel table: label, calibration, factor, unit and reference.
+    rows     = []
+    for channel in info [ 'channels' ].itertuples ():
+        row      = [ channel.label, '%.17g' % channel.calibration, '1', channel.unit, channel.reference ]
+        while row [ -1 ] is None:
+            row.pop ()
+        rows.append ( ' '.join ( map ( str, row ) ) )
+    
+    # Builds the header.
+    eeph     = ''.join ( [
+        '[File Version]\n%s\n' % info.get ( 'file_version', '4.0' ),
+        '[Sampling Rate]\n%.17g\n' % info [ 'sample_rate' ],
+        '[Samples]\n%i\n' % nsamp,
+        '[Channels]\n%i\n' % len ( rows ),
+        '[Basic Channel Data]\n;label    calibration factor\n',
+        ''.join ( row + '\n' for row in rows ) ] )
+    
+    
+    # Returns the header.
+    return eeph
+
+
+
+# Function to build the recording information header.
+def build_header ( info ):
+    
     
+    # Writes the acquisition date, as days and seconds.
+    days, seconds = to_days ( info.get ( 'acquisition_time', 0.0 ) )
+    header   = '[StartDate]\n%.17g\n[StartFraction]\n%.17g\n' % ( days, seconds )
     
-    # Reads the CNT file.
-    info     = read_info ( filename )
-    data     = read_data ( filename )
+    # Writes the software, amplifier and subject identification.
+    for name, key, _ in infofields:
+        if key in info and name != 'File Version':
+            header  += '[%s]\n%s\n' % ( name, info [ key ] )
     
     
-    # Adjusts the scale to SI units (volts).
-    scale    = numpy.zeros ( len ( info [ 'channels' ] ) )
-    ind_uV   = info [ 'channels' ] [ 'unit' ] == 'uV'
-    ind_uV   = ind_uV | ( info [ 'channels' ] [ 'unit' ] == 'µV' )
-    ind_V    = info [ 'channels' ] [ 'unit' ] == 'V'
-    scale [ ind_uV ] = 1e-6
-    scale [ ind_V ] = 1e0
+    # Returns the header.
+    return header
+
+
+
+# Function to convert a POSIX time into days from 1899-12-30 and seconds.
+def to_days ( time ):
+    
+    # Splits the time into whole days and the rest, in seconds.
+    seconds  = numpy.floor ( time )
+    days, rest = divmod ( int ( seconds ) + 2209161600, 60 * 60 * 24 )
+    return float ( days ), float ( rest + ( time - seconds ) )
+
+
+
+# Function to get the events to write (without the segment onsets) and the
+# epoch descriptors of the epoch events, impedances and videos. If the number
+# of samples is provided, the events after the end of the data are dropped.
+def get_evt ( info, nsamp = None ):
+    
     
-    # Applies the scale to the data.
-    data     = scale * data
+    # Gets the events, if any.
+    events   = info.get ( 'events' )
+    if events is None or len ( events ) == 0:
+        return [], []
     
+    # Removes the segment onsets, stored in the segments file.
+    events   = events [ ( events [ 'type' ] != 'Segment' ) | ( events [ 'description' ] != 'New segment' ) ]
     
-    # Builds the MNE Raw object.
-    mneraw   = mnetools.build_raw ( info, data )
     
+    # Fills the missing timestamps from the onset of the segment.
+    if 'segments' in info:
+        stimes   = info [ 'segments' ].start_time.to_numpy ( dtype = 'float64' )
+        ssamples = info [ 'segments' ].start_sample.to_numpy ( dtype = 'int64' )
+        missing  = numpy.array ( [ time is None or time != time for time in events [ 'timestamp' ] ], dtype = bool )
+        if missing.any ():
+            events   = events.copy ()
+            esegment = numpy.maximum ( numpy.searchsorted ( ssamples, events [ 'sample' ] [ missing ], side = 'right' ) - 1, 0 )
+            events [ 'timestamp' ] [ missing ] = stimes [ esegment ] + events [ 'onset' ] [ missing ] - ssamples [ esegment ] / info [ 'sample_rate' ]
+    
+    
+    # Builds the epoch descriptors of the epoch events, impedances and videos.
+    impedances = iter ( info.get ( 'impedances', [] ) )
+    videos   = iter ( info.get ( 'videos', [] ) )
+    descs    = []
+    for event in events:
+        
+        if event [ 'description' ] == 'Epoch Event':
+            descs.append ( [ { 'name': 'Epoch', 'data': event [ 'value' ], 'unit': '' } ] )
+        
+        elif event [ 'description' ] == 'Impedance':
+            imp      = next ( impedances )
+            values   = numpy.array ( list ( imp [ 'measurement' ].values () ), dtype = 'float32' )
+            descs.append ( [ { 'name': 'Impedance', 'data': values, 'unit': imp [ 'unit' ] } ] )
+        
+        elif event [ 'description' ].startswith ( 'Video' ):
+            video    = next ( videos )
+            descs.append ( [ { 'name': 'Video', 'data': None, 'unit': '' }, { 'name': 'File', 'data': video [ 'filename' ], 'unit': '' } ] )
+        
+        else:
+            descs.append ( [] )
     
-    # Returns the MNE object.
-    return mneraw
+    # Removes the events after the end of the data (once matched with the
+    # impedances and videos).
+    if nsamp is not None:
+        keep     = events [ 'sample' ] < nsamp
+        events   = events [ keep ]
+        descs    = [ desc for desc, kept in zip ( descs, keep ) if kept ]
+    
+    
+    # Returns the events and their descriptors.
+    return events, descs
+
+
+
+# Function to write the EEProbe segment (*.seg) file. The segments are a
+# table as in the file information, where the first segment is implicit.
+def write_seg ( filename, segments = None ):
+    
+    
+    # Lists the segments after the first one.
+    rows     = []
+    if segments is not None:
+        for segment in segments [ 1: ].itertuples ():
+            rows.append ( '%.17g %.17g %i\n' % ( *to_days ( segment.start_time ), segment.sample_count ) )
+    
+    # If only one segment, writes an empty definition.
+    if not rows:
+        rows     = [ 'NaN NaN NaN\n' ]
+    
+    
+    # Writes the file.
+    with open ( filename, 'w' ) as fid:
+        fid.write ( 'NumberSegments=%i\n' % ( 1 if segments is None else max ( len ( segments ), 1 ) ) )
+        fid.writelines ( rows )
+
+
+
+# Function to write the EEProbe event (*.evt) file from a table of events
+# (as in the file information) with, optionally, the epoch descriptors of
+# each event. The events are written as markers, in the version 103 layout.
+def write_evt ( filename, events, descs = None ):
+    
+    
+    # Helper function to pack fixed-size fields.
+    def pack ( fmt, *values ):
+        parts.append ( struct.pack ( fmt, *values ) )
+    
+    # Helper function to write (utf-8) strings.
+    def write_string ( text ):
+        text     = str ( text ).encode ()
+        if len ( text ) >= 255:
+            raise ValueError ( 'Text too long.' )
+        pack ( '<B', len ( text ) )
+        parts.append ( text )
+    
+    # Helper function to write the entry class.
+    def write_class ( cname ):
+        pack ( '<i', -1 )
+        write_string ( cname )
+    
+    # Helper function to write a data piece.
+    def write_data ( data ):
+        
+        if data is None:
+            pack ( '<h', 0 )
+        elif isinstance ( data, str ):
+            text     = data.encode ( 'utf16' )
+            pack ( '<hi', 8, len ( text ) )
+            parts.append ( text )
+        elif isinstance ( data, numpy.ndarray ):
+            pack ( '<hh4xI', 2 ** 13 | 4, 4, data.size )
+            parts.append ( data.astype ( '<f4' ).tobytes () )
+        elif isinstance ( data, ( int, numpy.integer ) ):
+            pack ( '<hi', 3, data )
+        else:
+            pack ( '<hd', 5, data )
+    
+    # Helper function to get the integer state of an event.
+    def get_state ( value ):
+        try:
+            return int ( value ) if int ( value ) == value else 0
+        except ( TypeError, ValueError ):
+            return 0
+    
+    
+    # Writes the event header (no compression or encryption) and the library.
+    parts    = []
+    pack ( '<3I3i', 0, 0, 0, 103, 0, 0 )
+    write_class ( 'class dcEventsLibrary_c' )
+    write_string ( '' )
+    pack ( '<I', len ( events ) )
+    
+    # Goes through each event.
+    for eindex, event in enumerate ( events ):
+        
+        # Writes the event identifier, class and name.
+        write_class ( 'class dcEventMarker_c' )
+        pack ( '<i16x', eindex )
+        write_class ( 'class dcEventMarker_c' )
+        write_string ( event [ 'type' ] )
+        write_string ( event [ 'type' ] )
+        
+        # Writes the type, state, original tag, duration, offset and timestamp.
+        days, seconds = to_days ( event [ 'timestamp' ] )
+        pack ( '<iibdddd', 0, get_state ( event [ 'value' ] ), 0, event [ 'duration' ], 0.0, days, seconds )
+        
+        # Writes the epoch descriptors.
+        edescs   = descs [ eindex ] if descs is not None else []
+        pack ( '<i', len ( edescs ) )
+        for desc in edescs:
+            write_string ( desc [ 'name' ] )
+            write_data ( desc [ 'data' ] )
+            write_string ( desc [ 'unit' ] )
+        
+        # Writes the channel information, the description and the display flags.
+        write_string ( '' )
+        write_string ( '' )
+        write_string ( event [ 'description' ] )
+        pack ( '<ib', 0, 0 )
+    
+    
+    # Writes the file.
+    with open ( filename, 'wb' ) as fid:
+        fid.write ( b''.join ( parts ) )
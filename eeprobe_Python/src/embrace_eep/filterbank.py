@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+
+@author: Ricardo Bruña
+
+FFT filter bank: zero-phase band-pass filtering and analytic signal.
+
+Filters the (calibrated) data in several frequency bands at once and returns
+the analytic signal of each band, ready for the phase synchronization (see
+connectivity.py) or the band power: for each block of data, one forward FFT
+per channel, the response of the complex kernel of each band (band-pass and
+Hilbert transform at once), and one inverse FFT per band. No filtered copy
+of the real signal is ever built.
+
+The kernel of each band is designed in the frequency domain and windowed in
+the time domain. The ideal response is flat in the pass band, zero in the
+stop band, and has raised cosine transitions; it is doubled in the positive
+frequencies and removed in the negative ones (analytic signal). Its impulse
+response is truncated to 2 * pad + 1 taps, centered in zero, with a Hann
+window. The kernel is symmetric (conjugate), so the filter is zero-phase,
+and its response is the ideal one smoothed by the spectrum of the window
+(the transitions are slightly wider, and the stop band and the negative
+frequencies are not exactly zero). By default, the transition bands are as
+in MNE: min ( max ( 0.25 * f, 2 ), f ) Hz below the band and
+min ( max ( 0.25 * f, 2 ), nyquist - f ) Hz above it.
+
+Long signals are processed in blocks (overlap-save): each block is extended
+with 'pad' samples of context on each side, which are discarded after the
+filtering. As the kernel has exactly 2 * pad + 1 taps, the result is the
+linear convolution of the whole signal with the kernel (the data out of the
+signal taken as zero), whatever the length of the blocks. The blocks can be
+read directly from an EEProbe file, decoding only the samples required.
+
+"""
+
+import math
+
+import numpy
+import scipy.fft
+
+
+# Class to filter the data in several bands and get the analytic signals.
+class FilterBank:
+    
+    
+    def __init__ ( self, bands, sample_rate, transition = None, block_samples = None, dtype = 'complex128', nthreads = None ):
+        
+        
+        # Stores the definition.
+        self.bands    = numpy.array ( bands, dtype = 'float64' ).reshape ( -1, 2 )
+        self.sample_rate = float ( sample_rate )
+        self.dtype    = numpy.dtype ( dtype )
+        self.nthreads = nthreads
+        
+        # Checks the definition.
+        nyquist  = self.sample_rate / 2
+        if len ( self.bands ) == 0:
+            raise ValueError ( 'At least one band is required.' )
+        if numpy.any ( self.bands [ :, 0 ] < 0 ) or numpy.any ( self.bands [ :, 1 ] > nyquist ) or numpy.any ( self.bands [ :, 0 ] >= self.bands [ :, 1 ] ):
+            raise ValueError ( 'The bands must be (low, high) pairs with 0 <= low < high <= %g Hz.' % nyquist )
+        if self.dtype not in ( numpy.complex64, numpy.complex128 ):
+            raise ValueError ( 'The output must be of type complex64 or complex128.' )
+        
+        
+        # Gets the width of the transition bands, below and above each band.
+        low      = self.bands [ :, 0 ]
+        high     = self.bands [ :, 1 ]
+        if transition is None:
+            self.transition = numpy.stack ( [
+                numpy.minimum ( numpy.maximum ( 0.25 * low, 2 ), low ),
+                numpy.minimum ( numpy.maximum ( 0.25 * high, 2 ), nyquist - high ) ], axis = 1 )
+        else:
+            self.transition = numpy.broadcast_to ( numpy.array ( transition, dtype = 'float64' ), self.bands.shape ).copy ()
+        
+        # Gets the half-length of the kernels: the impulse response decays in
+        # a few times the inverse of the narrowest transition.
+        narrowest = self.transition [ self.transition > 0 ].min () if numpy.any ( self.transition > 0 ) else self.sample_rate
+        self.pad      = int ( math.ceil ( 4 * self.sample_rate / narrowest ) )
+        
+        # Gets the length of the FFT, so the output of each block is at
+        # least as long as the context.
+        self.nfft     = scipy.fft.next_fast_len ( max ( 4 * self.pad, int ( block_samples or 0 ) + 2 * self.pad, 256 ) )
+        self.step     = self.nfft - 2 * self.pad
+        
+        
+        # Designs the kernel of each band, and gets its response.
+        self.kernel   = self.get_kernel ()
+        self.response = self.get_kernel_response ( self.nfft )
+    
+    
+    
+    # Function to get the ideal response of each band (bands x frequencies)
+    # for the positive frequencies of an FFT of length 'nfft', including the
+    # Hilbert transform.
+    def get_response ( self, nfft ):
+        
+        
+        # Gets the positive frequencies.
+        freqs    = scipy.fft.rfftfreq ( nfft, 1 / self.sample_rate )
+        response = numpy.zeros ( ( len ( self.bands ), len ( freqs ) ) )
+        
+        # Goes through each band.
+        for bindex, ( ( low, high ), ( tlow, thigh ) ) in enumerate ( zip ( self.bands, self.transition ) ):
+            
+            # Sets the pass band.
+            response [ bindex, ( freqs >= low ) & ( freqs <= high ) ] = 1
+            
+            # Sets the raised cosine transitions.
+            if tlow > 0:
+                hits     = ( freqs > low - tlow ) & ( freqs < low )
+                response [ bindex, hits ] = 0.5 * ( 1 + numpy.cos ( numpy.pi * ( low - freqs [ hits ] ) / tlow ) )
+            if thigh > 0:
+                hits     = ( freqs > high ) & ( freqs < high + thigh )
+                response [ bindex, hits ] = 0.5 * ( 1 + numpy.cos ( numpy.pi * ( freqs [ hits ] - high ) / thigh ) )
+        
+        
+        # The analytic signal doubles the positive frequencies (but not the
+        # zero and Nyquist frequencies) and removes the negative ones.
+        response [ :, 1: ( nfft + 1 ) // 2 ] *= 2
+        
+        
+        # Returns the response.
+        return response
+    
+    
+    
+    # Function to design the kernel of each band (bands x taps), with taps
+    # from -pad to pad samples: the impulse response of the ideal response,
+    # truncated with a Hann window.
+    def get_kernel ( self ):
+        
+        
+        # Gets the impulse response from a fine sampling of the ideal
+        # response (with the negative frequencies set to zero).
+        ndesign  = scipy.fft.next_fast_len ( max ( 16 * self.pad, 1024 ) )
+        response = self.get_response ( ndesign )
+        impulse  = scipy.fft.ifft ( response, ndesign, axis = 1 )
+        
+        # Keeps the taps from -pad to pad.
+        kernel   = numpy.concatenate ( [ impulse [ :, -self.pad: ], impulse [ :, :self.pad + 1 ] ], axis = 1 )
+        
+        # Applies the window (without the zero end points).
+        kernel  *= numpy.hanning ( 2 * self.pad + 3 ) [ 1: -1 ]
+        
+        
+        # Returns the kernel.
+        return kernel
+    
+    
+    
+    # Function to get the response of the kernel of each band (bands x
+    # frequencies) for all the frequencies of an FFT of length 'nfft', with
+    # nfft > 2 * pad. The kernel is conjugate symmetric, so its response is
+    # real (zero-phase).
+    def get_kernel_response ( self, nfft ):
+        
+        
+        # Places the kernel circularly, centered in the first sample.
+        taps     = numpy.zeros ( ( len ( self.bands ), nfft ), dtype = 'complex128' )
+        taps [ :, :self.pad + 1 ] = self.kernel [ :, self.pad: ]
+        taps [ :, -self.pad: ] = self.kernel [ :, :self.pad ]
+        
+        # Gets the response.
+        response = scipy.fft.fft ( taps, axis = 1 ).real
+        
+        
+        # Returns the response in the precision of the output.
+        return response.astype ( 'float32' if self.dtype == numpy.complex64 else 'float64' )
+    
+    
+    
+    # Function to filter a block of (samples x channels) real data, with at
+    # most nfft samples, as a circular signal. Returns the analytic signals
+    # of samples [first, last) as a (bands x samples x channels) array.
+    def filter_block ( self, block, first = 0, last = None ):
+        
+        
+        # Gets the block in the precision of the output.
+        block    = numpy.asarray ( block, dtype = 'float32' if self.dtype == numpy.complex64 else 'float64' )
+        last     = block.shape [0] if last is None else last
+        
+        # Gets the spectrum of each channel (zero-padded up to nfft).
+        spectrum = scipy.fft.rfft ( block, self.nfft, axis = 0, workers = self.nthreads )
+        nfreq    = spectrum.shape [0]
+        
+        
+        # Gets the negative frequencies from the positive ones (the block is
+        # real, so its spectrum is conjugate symmetric).
+        mirror   = spectrum [ 1: self.nfft - nfreq + 1 ] [ ::-1 ].conj ()
+        
+        
+        # Goes through each band.
+        output   = numpy.empty ( ( len ( self.bands ), last - first, block.shape [1] ), dtype = self.dtype )
+        full     = numpy.empty ( ( self.nfft, block.shape [1] ), dtype = self.dtype )
+        for bindex, response in enumerate ( self.response ):
+            
+            # Applies the response of the kernel.
+            numpy.multiply ( spectrum, response [ :nfreq, None ], out = full [ :nfreq ] )
+            numpy.multiply ( mirror, response [ nfreq:, None ], out = full [ nfreq: ] )
+            
+            # Gets the analytic signal.
+            output [ bindex ] = scipy.fft.ifft ( full, axis = 0, overwrite_x = True, workers = self.nthreads ) [ first: last ]
+        
+        
+        # Returns the analytic signals.
+        return output
+    
+    
+    
+    # Function to iterate over the analytic signals of the samples
+    # [start, stop) of a signal, in blocks. 'get_block' ( first, last )
+    # returns the (samples x channels) real data in [first, last), with
+    # 0 <= first <= last <= total. The data out of the signal is taken as zero.
+    # Yields the first sample of each block and a (bands x samples x channels)
+    # array.
+    def iter_blocks ( self, get_block, start, stop, total ):
+        
+        
+        # Goes through each block.
+        for onset in range ( start, stop, self.step ):
+            
+            # Gets the block with its context, inside the signal.
+            offset   = min ( onset + self.step, stop )
+            first    = max ( onset - self.pad, 0 )
+            last     = min ( offset + self.pad, total )
+            block    = get_block ( first, last )
+            
+            # Filters the block and keeps the samples [onset, offset).
+            yield onset, self.filter_block ( block, onset - first, offset - first )
+    
+    
+    
+    # Function to get the analytic signals of a (samples x channels) array,
+    # as a (bands x samples x channels) array.
+    def apply ( self, data ):
+        
+        
+        # Gets the data as (samples x channels).
+        data     = numpy.asarray ( data )
+        data2d   = data.reshape ( data.shape [0], -1 )
+        
+        # Filters the data in blocks.
+        output   = numpy.empty ( ( len ( self.bands ), ) + data2d.shape, dtype = self.dtype )
+        for onset, analytic in self.iter_blocks ( lambda first, last: data2d [ first: last ], 0, data2d.shape [0], data2d.shape [0] ):
+            output [ :, onset: onset + analytic.shape [1] ] = analytic
+        
+        
+        # Returns the analytic signals.
+        return output.reshape ( ( len ( self.bands ), ) + data.shape )
+    
+    
+    
+    # Function to iterate over the analytic signals of an EEProbe file (a
+    # file name or an open file) or of a group of synchronized files (see
+    # eep.CntGroup, the channels of the files are concatenated), decoding
+    # only the samples required by each block. Yields the first sample of
+    # each block and a (bands x samples x channels) array.
+    def iter_cnt ( self, source, start = None, stop = None, picks = None, nthreads = None, units = None ):
+        
+        from . import eep
+        
+        
+        # Opens the file, if required.
+        if not isinstance ( source, eep.CntGroup ):
+            source   = eep.open_cnt ( source )
+        
+        # Gets the window and the function to read the data.
+        dtype    = 'float32' if self.dtype == numpy.complex64 else 'float64'
+        start, stop = source.get_window ( start, stop )
+        if isinstance ( source, eep.CntGroup ):
+            rate     = source.sample_rate
+            total    = source.sample_count
+            get_block = lambda first, last: numpy.concatenate ( source.get_data ( first, last, picks, nthreads, dtype, units ), axis = 1 )
+        else:
+            rate     = source.info [ 'sample_rate' ]
+            total    = source.info [ 'sample_count' ]
+            get_block = lambda first, last: source.get_data ( first, last, picks, nthreads, dtype = dtype, units = units )
+        
+        
+        # Checks the sampling rate.
+        if rate != self.sample_rate:
+            raise ValueError ( 'The data is sampled at %g Hz, but the filter bank is defined for %g Hz.' % ( rate, self.sample_rate ) )
+        
+        
+        # Filters the data in blocks.
+        yield from self.iter_blocks ( get_block, start, stop, total )
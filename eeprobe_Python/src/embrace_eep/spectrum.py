@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+
+@author: Ricardo Bruña
+
+Power spectrum and band power of each channel, by condition.
+
+The condition windows are selected from the events of the file (see
+get_windows), and the data is decoded window by window, in chunks, so only
+the samples in the windows are decoded and the memory used depends only on
+the length of the chunks and the number of channels, not on the length of
+the recording.
+
+Each window is split into overlapping segments and the (one-sided) power
+spectral density of each segment is accumulated for its condition:
+* 'welch':      Hann window (Welch's method, as scipy.signal.welch).
+* 'multitaper': DPSS tapers with eigenvalue above 0.9, weighted by their
+                eigenvalue (non-adaptive multitaper, as MNE).
+The mean of each segment is removed before tapering. The FFTs of all the
+segments and channels of a chunk are computed at once.
+
+"""
+
+import numpy
+import scipy.fft
+import scipy.signal
+
+
+# Lists the available methods.
+psdmethods = ( 'welch', 'multitaper' )
+
+# Lists the default frequency bands, in Hz.
+defbands = {
+    'delta': ( 1, 4 ),
+    'theta': ( 4, 8 ),
+    'alpha': ( 8, 13 ),
+    'beta':  ( 13, 30 ),
+    'gamma': ( 30, 45 ) }
+
+
+
+"""
+Code for selecting the condition windows.
+"""
+
+# Function to get the condition windows from the events of a file.
+# 'segments' defines the conditions:
+# * None:   all the data, as condition 'all'.
+# * A string or a list of strings: the events of each type, as a condition
+#   named after the type.
+# * A dictionary: for each condition, an event type or a list of types.
+# Each event defines a window from 'tmin' to 'tmax' seconds after its onset.
+# If tmax is None, the window lasts the duration of the event or, if none,
+# until the next selected event. The windows never cross the end of the
+# recording segment containing the event.
+# Returns a list of (condition, start, stop) tuples, in samples.
+def get_windows ( info, segments = None, tmin = 0.0, tmax = None ):
+    
+    
+    # Gets the events and the limits of the recording segments.
+    sfreq    = float ( info [ 'sample_rate' ] )
+    nsamp    = int ( info [ 'sample_count' ] )
+    events   = info [ 'events' ]
+    isseg    = events [ 'description' ] == 'New segment'
+    bounds   = numpy.union1d ( [ 0, nsamp ], events [ 'sample' ] [ isseg ].astype ( 'int64' ) )
+    bounds   = bounds [ ( bounds >= 0 ) & ( bounds <= nsamp ) ]
+    
+    # Without conditions, takes each recording segment.
+    if segments is None:
+        return [ ( 'all', int ( start ), int ( stop ) ) for start, stop in zip ( bounds [ :-1 ], bounds [ 1: ] ) if stop > start ]
+    
+    
+    # Gets the event types of each condition.
+    if isinstance ( segments, str ):
+        segments = [ segments ]
+    if not isinstance ( segments, dict ):
+        segments = { etype: etype for etype in segments }
+    conditions = { condition: [ etypes ] if isinstance ( etypes, str ) else list ( etypes ) for condition, etypes in segments.items () }
+    
+    # Gets the condition of each event (the first one listing its type).
+    econd    = numpy.full ( len ( events ), None, dtype = object )
+    for condition, etypes in reversed ( list ( conditions.items () ) ):
+        econd [ numpy.isin ( events [ 'type' ].astype ( str ), etypes ) & ~isseg ] = condition
+    
+    # Keeps the selected events, sorted by onset.
+    hits     = numpy.flatnonzero ( [ condition is not None for condition in econd ] )
+    hits     = hits [ numpy.argsort ( events [ 'sample' ] [ hits ], kind = 'stable' ) ]
+    onsets   = events [ 'sample' ] [ hits ].astype ( 'int64' )
+    
+    
+    # Goes through each selected event.
+    windows  = []
+    for index, ( eindex, onset ) in enumerate ( zip ( hits, onsets ) ):
+        
+        # Gets the end of the recording segment.
+        send     = bounds [ numpy.searchsorted ( bounds, onset, side = 'right' ) ] if onset < nsamp else nsamp
+        
+        # Gets the end of the window.
+        if tmax is not None:
+            stop     = onset + int ( round ( tmax * sfreq ) )
+        elif events [ 'duration' ] [ eindex ] > 0:
+            stop     = onset + int ( round ( events [ 'duration' ] [ eindex ] * sfreq ) )
+        else:
+            stop     = onsets [ index + 1 ] if index + 1 < len ( onsets ) else nsamp
+        
+        # Gets the window inside the recording segment.
+        start    = max ( onset + int ( round ( tmin * sfreq ) ), 0 )
+        stop     = min ( stop, send )
+        if stop > start:
+            windows.append ( ( econd [ eindex ], int ( start ), int ( stop ) ) )
+    
+    
+    # Returns the windows.
+    return windows
+
+
+
+"""
+Code for estimating the power spectrum.
+"""
+
+# Class to accumulate the power spectral density of the segments of data.
+class Periodogram:
+    
+    
+    def __init__ ( self, sample_rate, window_samples, method = 'welch', overlap = 0.5, bandwidth = None, nthreads = None ):
+        
+        
+        # Checks the definition.
+        if method not in psdmethods:
+            raise ValueError ( 'Unknown method \'%s\'. Valid methods are: %s.' % ( method, ', '.join ( psdmethods ) ) )
+        if window_samples < 2:
+            raise ValueError ( 'The segments must have at least two samples.' )
+        if overlap < 0 or overlap >= 1:
+            raise ValueError ( 'The overlap must be a fraction in [0, 1).' )
+        
+        # Stores the definition.
+        self.sample_rate = float ( sample_rate )
+        self.nper     = int ( window_samples )
+        self.hop      = max ( int ( round ( self.nper * ( 1 - overlap ) ) ), 1 )
+        self.method   = method
+        self.nthreads = nthreads
+        self.freqs    = scipy.fft.rfftfreq ( self.nper, 1 / self.sample_rate )
+        
+        
+        # For Welch's method uses a single (periodic) Hann window.
+        if method == 'welch':
+            tapers   = scipy.signal.get_window ( 'hann', self.nper ) [ None ]
+            weights  = numpy.ones ( 1 )
+        
+        # For the multitaper method uses the DPSS tapers with low bias. By
+        # default the time-half-bandwidth product is 4.
+        else:
+            halfnbw  = 4.0 if bandwidth is None else bandwidth * self.nper / ( 2 * self.sample_rate )
+            tapers, ratios = scipy.signal.windows.dpss ( self.nper, halfnbw, max ( int ( 2 * halfnbw ), 1 ), return_ratios = True )
+            tapers   = numpy.atleast_2d ( tapers ) [ numpy.atleast_1d ( ratios ) > 0.9 ]
+            weights  = numpy.atleast_1d ( ratios ) [ numpy.atleast_1d ( ratios ) > 0.9 ]
+            if len ( tapers ) == 0:
+                raise ValueError ( 'The bandwidth is too narrow for the segment length.' )
+        
+        # Gets the scale of each taper for the one-sided density: the
+        # positive frequencies account for the negative ones, except the zero
+        # and Nyquist frequencies.
+        self.tapers   = tapers
+        self.scale    = weights / weights.sum () / ( self.sample_rate * ( tapers ** 2 ).sum ( axis = 1 ) )
+        self.onesided = numpy.full ( len ( self.freqs ), 2.0 )
+        self.onesided [0] = 1
+        if self.nper % 2 == 0:
+            self.onesided [ -1 ] = 1
+    
+    
+    
+    # Function to get the number of segments in a number of samples.
+    def get_count ( self, nsamp ):
+        return max ( ( nsamp - self.nper ) // self.hop + 1, 0 )
+    
+    
+    
+    # Function to get the sum of the power spectral densities of all the
+    # segments of a (samples x channels) array, starting at its first sample.
+    # Returns the (channels x frequencies) sum and the number of segments.
+    def get_power ( self, data ):
+        
+        
+        # Gets the segments as a (segments x channels x samples) view.
+        nseg     = self.get_count ( data.shape [0] )
+        power    = numpy.zeros ( ( data.shape [1], len ( self.freqs ) ) )
+        if nseg == 0:
+            return power, 0
+        segments = numpy.lib.stride_tricks.sliding_window_view ( data, self.nper, axis = 0 ) [ : nseg * self.hop: self.hop ]
+        
+        # Removes the mean of each segment.
+        segments = segments - segments.mean ( axis = -1, keepdims = True )
+        
+        
+        # Goes through each taper, transforming all the segments at once.
+        for taper, scale in zip ( self.tapers, self.scale ):
+            spectrum = scipy.fft.rfft ( segments * taper, axis = -1, workers = self.nthreads )
+            power   += scale * ( spectrum.real ** 2 + spectrum.imag ** 2 ).sum ( axis = 0 )
+        
+        
+        # Returns the sum of the one-sided densities.
+        return power * self.onesided, nseg
+
+
+
+# Function to get the power in each band from a (... x frequencies) power
+# spectral density, integrating over the frequencies in [low, high).
+def get_band_power ( psd, freqs, bands = None ):
+    
+    
+    # Gets the frequency resolution.
+    bands    = defbands if bands is None else bands
+    step     = freqs [1] - freqs [0]
+    
+    # Returns the power of each band.
+    return { name: psd [ ..., ( freqs >= low ) & ( freqs < high ) ].sum ( axis = -1 ) * step for name, ( low, high ) in bands.items () }
+
+
+
+# Function to compute the power spectrum and the band power of each channel
+# for each condition (see get_windows), streaming the data of the windows.
+# Returns a pandas table with a row for each condition and channel, with the
+# number of segments averaged ('nave') and the power of each band (in units
+# squared). With return_psd, returns also the frequencies and, for each
+# condition, the (channels x frequencies) power spectral density.
+def compute_psd ( filename, segments = None, tmin = 0.0, tmax = None, method = 'welch', window_seconds = 2.0, overlap = 0.5, bandwidth = None, bands = None, picks = None, units = None, chunk_samples = None, nthreads = None, return_psd = False ):
+    
+    import pandas
+    from . import eep
+    
+    
+    # Opens the file.
+    cntfile  = eep.open_cnt ( filename )
+    sfreq    = cntfile.info [ 'sample_rate' ]
+    picks    = cntfile.get_picks ( picks )
+    labels   = cntfile.info [ 'channels' ] [ 'label' ] [ picks ]
+    
+    # Defines the estimator.
+    estimator = Periodogram ( sfreq, int ( round ( window_seconds * sfreq ) ), method, overlap, bandwidth, eep.default_threads ( nthreads ) )
+    
+    # Gets the number of segments per chunk (by default, ten seconds).
+    chunk_samples = int ( 10 * sfreq ) if chunk_samples is None else int ( chunk_samples )
+    nbatch   = max ( estimator.get_count ( chunk_samples ), 1 )
+    
+    
+    # Gets the condition windows.
+    windows  = get_windows ( cntfile.info, segments, tmin, tmax )
+    
+    # Initializes the sums of each condition, in order of appearance.
+    sums     = {}
+    counts   = {}
+    for condition, _, _ in windows:
+        sums.setdefault ( condition, numpy.zeros ( ( len ( picks ), len ( estimator.freqs ) ) ) )
+        counts.setdefault ( condition, 0 )
+    
+    
+    # Goes through each window with at least one segment.
+    for condition, start, stop in windows:
+        if estimator.get_count ( stop - start ) == 0:
+            continue
+        
+        # Goes through the window in chunks of whole segments. Consecutive
+        # chunks share the overlap of the segments, decoded only once.
+        for _, data in cntfile.iter_chunks (
+                ( nbatch - 1 ) * estimator.hop + estimator.nper, estimator.nper - estimator.hop,
+                start, stop, picks, nthreads, units = units ):
+            
+            # Accumulates the segments of the chunk.
+            power, nseg = estimator.get_power ( data )
+            sums [ condition ] += power
+            counts [ condition ] += nseg
+    
+    
+    # Gets the mean power spectral density of each condition.
+    psds     = {
+        condition: sums [ condition ] / counts [ condition ] if counts [ condition ] else numpy.full ( sums [ condition ].shape, numpy.nan )
+        for condition in sums }
+    
+    # Builds the table of band power.
+    rows     = []
+    for condition, psd in psds.items ():
+        power    = get_band_power ( psd, estimator.freqs, bands )
+        rows.append ( pandas.DataFrame ( {
+            'condition': condition,
+            'channel':   labels,
+            'nave':      counts [ condition ],
+            **power } ) )
+    table    = pandas.concat ( rows, ignore_index = True ) if rows else pandas.DataFrame ( columns = [ 'condition', 'channel', 'nave' ] + list ( defbands if bands is None else bands ) )
+    
+    
+    # Returns the table and, if requested, the spectra.
+    if return_psd:
+        return table, estimator.freqs, psds
+    return table
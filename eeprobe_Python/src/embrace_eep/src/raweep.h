@@ -4,6 +4,7 @@
 
 #include <stdint.h>
 #include <stdio.h>
+#include <string.h>
 
 #if defined ( __GNUC__ )
     uint64_t swap_uint64 ( uint64_t val ) {
@@ -97,6 +98,8 @@ int32_t bin2uint32 ( const uint8_t *byte, int64_t offset, uint32_t length ) {
 }
 
 
+/* Expands the residuals of a channel in a second pass. read_block fuses this
+ * into the decoding loop (see read_samples), this version is kept as reference. */
 void apply_residuals ( int32_t *data, uint64_t nsamp, uint32_t method ) {
     
     uint64_t index;
@@ -150,11 +153,185 @@ void apply_residuals ( int32_t *data, uint64_t nsamp, uint32_t method ) {
 }
 
 
-int64_t read_channel ( int32_t *data, const uint8_t *byte, int64_t off, uint64_t nsamp, uint32_t method ) {
+/* Streaming reader of big-endian bit fields.
+ * The cache holds the next 'count' bits of the stream, left aligned, and is
+ * refilled with (up to) 64 bits at a time instead of re-deriving the byte and
+ * bit position of every field. */
+typedef struct {
+    const uint8_t * byte;
+    uint64_t size;
+    uint64_t pos;
+    uint64_t cache;
+    uint32_t count;
+} bitreader;
+
+
+static inline void br_refill ( bitreader *br ) {
+    
+    uint64_t word;
+    
+    /* Loads the next eight bytes at once, if available. */
+    if ( br->pos + 8 <= br->size ) {
+        memcpy ( &word, br->byte + br->pos, sizeof ( word ) );
+        word   = swap_uint64 ( word );
+        
+        /* Keeps the cached bits and moves the position by whole bytes. */
+        br->cache |= word >> br->count;
+        br->pos   += ( 63 - br->count ) >> 3;
+        br->count |= 56;
+    
+    /* Near the end of the buffer loads byte by byte, padding with zeros. */
+    } else {
+        while ( br->count <= 56 ) {
+            word   = br->pos < br->size ? br->byte [ br->pos ] : 0;
+            br->cache |= word << ( 56 - br->count );
+            br->pos   += 1;
+            br->count += 8;
+        }
+    }
+}
+
+
+static inline void br_init ( bitreader *br, const uint8_t *byte, uint64_t size, int64_t off ) {
+    
+    br->byte   = byte;
+    br->size   = size;
+    br->pos    = off / 8;
+    br->cache  = 0;
+    br->count  = 0;
+    
+    /* Loads the first bits and discards the bits before the offset. */
+    br_refill ( br );
+    br->cache <<= off % 8;
+    br->count  -= off % 8;
+}
+
+
+/* Reads an unsigned field of up to 32 bits. */
+static inline uint32_t br_read_uint ( bitreader *br, uint32_t length ) {
+    
+    uint32_t intval;
+    
+    if ( length == 0 ) return 0;
+    if ( br->count < length ) br_refill ( br );
+    
+    intval     = ( uint32_t ) ( br->cache >> ( 64 - length ) );
+    br->cache <<= length;
+    br->count  -= length;
+    
+    return intval;
+}
+
+
+/* Reads a signed (two's complement) field of up to 32 bits. */
+static inline int32_t br_read_int ( bitreader *br, uint32_t length ) {
+    
+    int32_t intval;
+    
+    if ( length == 0 ) return 0;
+    if ( br->count < length ) br_refill ( br );
+    
+    /* The arithmetic shift fills the leftmost bits with the sign. */
+    intval     = ( int32_t ) ( ( int64_t ) br->cache >> ( 64 - length ) );
+    br->cache <<= length;
+    br->count  -= length;
+    
+    return intval;
+}
+
+
+/* Gets the current offset, in bits. */
+static inline int64_t br_offset ( const bitreader *br ) {
+    return 8 * br->pos - br->count;
+}
+
+
+/* Skips the bits up to the next byte boundary. */
+static inline void br_align ( bitreader *br ) {
+    br->cache <<= br->count % 8;
+    br->count  -= br->count % 8;
+}
+
+
+/* Reads nsamp - 1 residuals of nbit bits (or xbit bits after the escape
+ * value -2^(nbit - 1), if xbit is not zero) and reconstructs the
+ * samples in the same pass:
+ *   method 1: x [i] = x [i-1] + r [i]
+ *   method 2: x [i] = x [i-1] + ( x [i-1] - x [i-2] ) + r [i]
+ *   method 3: x [i] = x [i-1] + ( p [i] - p [i-1] ) + r [i]
+ * where p is the previous channel. Inlined with a constant method (and
+ * nbit), the branches, shifts and refill tests are resolved at compile
+ * time. The arithmetic is unsigned to wrap around as int32 on overflow. */
+static inline void read_samples ( int32_t *data, const int32_t *prev, bitreader *br, uint64_t nsamp, uint32_t nbit, uint32_t xbit, uint32_t method ) {
+    
+    uint64_t index;
+    int32_t datum, escape;
+    uint32_t value, slope;
+    
+    
+    /* The escape value is -2^(nbit - 1). Without standard residuals there
+     * is no escape value. */
+    escape = nbit > 0 ? ( int32_t ) ( - ( ( int64_t ) 1 << ( nbit - 1 ) ) ) : 0;
+    if ( nbit == 0 ) xbit = 0;
+    
+    /* Starts from the first sample. */
+    value  = ( uint32_t ) data [0];
+    slope  = 0;
+    
+    for ( index = 1; index < nsamp; index ++ ) {
+        
+        /* Reads the residual. */
+        datum  = br_read_int ( br, nbit );
+        if ( xbit && datum == escape )
+            datum  = br_read_int ( br, xbit );
+        
+        /* Reconstructs the sample. */
+        switch ( method ) {
+            case 1:
+                value += ( uint32_t ) datum;
+                break;
+            case 2:
+                slope += ( uint32_t ) datum;
+                value += slope;
+                break;
+            case 3:
+                value += ( uint32_t ) datum + ( ( uint32_t ) prev [ index ] - ( uint32_t ) prev [ index - 1 ] );
+                break;
+        }
+        
+        data [ index ] = ( int32_t ) value;
+    }
+}
+
+
+#define READ_SAMPLES_CASE(n) case n: read_samples ( data, prev, br, nsamp, n, 0, method ); break;
+
+
+/* Dispatches to a loop specialized for the most common residual lengths. */
+static inline void read_samples_method ( int32_t *data, const int32_t *prev, bitreader *br, uint64_t nsamp, uint32_t nbit, uint32_t xbit, uint32_t method ) {
+    
+    /* With extended residuals uses the generic loop. */
+    if ( xbit && nbit > 0 ) {
+        read_samples ( data, prev, br, nsamp, nbit, xbit, method );
+        return;
+    }
+    
+    switch ( nbit ) {
+        READ_SAMPLES_CASE (  2 ) READ_SAMPLES_CASE (  3 ) READ_SAMPLES_CASE (  4 )
+        READ_SAMPLES_CASE (  5 ) READ_SAMPLES_CASE (  6 ) READ_SAMPLES_CASE (  7 )
+        READ_SAMPLES_CASE (  8 ) READ_SAMPLES_CASE (  9 ) READ_SAMPLES_CASE ( 10 )
+        READ_SAMPLES_CASE ( 11 ) READ_SAMPLES_CASE ( 12 ) READ_SAMPLES_CASE ( 13 )
+        READ_SAMPLES_CASE ( 14 ) READ_SAMPLES_CASE ( 15 ) READ_SAMPLES_CASE ( 16 )
+        default: read_samples ( data, prev, br, nsamp, nbit, 0, method );
+    }
+}
+
+
+int64_t read_channel ( int32_t *data, bitreader *br, uint64_t nsamp, uint32_t method ) {
     
     uint32_t mbit, dbit, nbit, xbit;
     uint64_t index;
-    int32_t datum;
+    const uint8_t * byte;
     
     
     /* Gets the length of the data and metadata depending on the method. */
@@ -165,69 +342,76 @@ int64_t read_channel ( int32_t *data, const uint8_t *byte, int64_t off, uint64_t
     if ( ( method & 7 ) == 0 ) {
         
         /* Data is stored as samples. */
-        nbit   = dbit;
-        xbit   = 0;
-        off   += 4;
+        br_read_uint ( br, 4 );
         
-    } else {
+        /* If byte-aligned, reads the big-endian samples directly. */
+        if ( br->count % 8 == 0 && br->pos - br->count / 8 + nsamp * dbit / 8 <= br->size ) {
+            
+            byte   = br->byte + br->pos - br->count / 8;
+            
+            if ( dbit == 16 ) {
+                for ( index = 0; index < nsamp; index ++, byte += 2 )
+                    data [ index ] = ( int16_t ) ( ( byte [0] << 8 ) | byte [1] );
+            } else {
+                for ( index = 0; index < nsamp; index ++, byte += 4 )
+                    data [ index ] = ( int32_t ) ( ( ( uint32_t ) byte [0] << 24 ) | ( ( uint32_t ) byte [1] << 16 ) | ( ( uint32_t ) byte [2] << 8 ) | byte [3] );
+            }
+            
+            /* Moves the reader after the samples. */
+            br_init ( br, br->byte, br->size, 8 * ( byte - br->byte ) );
         
-        /* Reads the length of the standard and extended residuals. */
-        nbit   = bin2uint32 ( byte, off, mbit );
-        off   += mbit;
-        xbit   = bin2uint32 ( byte, off, mbit );
-        off   += mbit;
+        } else {
+            for ( index = 0; index < nsamp; index ++ )
+                data [ index ] = br_read_int ( br, dbit );
+        }
         
-        /* If xbit is equal to nbit there are no extended residuals. */
-        if ( xbit == nbit ) xbit = 0;
+        return 0;
     }
     
     
-    /* Reads the first sample of the channel. */
-    datum  = bin2int32 ( byte, off, dbit );
-    off   += dbit;
+    /* Reads the length of the standard and extended residuals. */
+    nbit   = br_read_uint ( br, mbit );
+    xbit   = br_read_uint ( br, mbit );
     
-    /* Stores the first sample for this channel. */
-    data [0] = datum;
+    /* Residuals longer than 32 bits are not valid. */
+    if ( nbit > 32 || xbit > 32 )
+        return -4;
     
+    /* If xbit is equal to nbit there are no extended residuals. */
+    if ( xbit == nbit ) xbit = 0;
     
-    /* Goes through the samples. */
-    for ( index = 1; index < nsamp; index ++ ) {
-        
-        /* Reads nbit bits. */
-        datum  = bin2int32 ( byte, off, nbit );
-        off   += nbit;
-        
-        /* Checks if we need the extended residual. */
-        if ( xbit && ( datum == -pow ( 2, nbit - 1 ) ) ) {
-            
-            /* Reads nbit bits. */
-            datum  = bin2int32 ( byte, off, xbit );
-            off   += xbit;
-        }
-        
-        /* Stores the current residual. */
-        data [ index ] = datum;
-    }
+    /* Reads the first sample of the channel. */
+    data [0] = br_read_int ( br, dbit );
     
-    /* Aligns the offset with the byte. */
-    off    = 8 * ( ( off - 1 ) / 8 + 1 );
     
-    return off;
+    /* Reads the residuals and reconstructs the samples. The previous
+     * channel (for method 3) is stored just before this one. */
+    switch ( method & 7 ) {
+        case 1: read_samples_method ( data, NULL, br, nsamp, nbit, xbit, 1 ); break;
+        case 2: read_samples_method ( data, NULL, br, nsamp, nbit, xbit, 2 ); break;
+        case 3: read_samples_method ( data, data - nsamp, br, nsamp, nbit, xbit, 3 ); break;
+    }
+    
+    return 0;
 }
 
 
-int64_t read_block ( int32_t *data, const uint8_t *byte, int64_t off, uint64_t nsamp, uint64_t nchan ) {
+int64_t read_block ( int32_t *data, const uint8_t *byte, uint64_t size, int64_t off, uint64_t nsamp, uint64_t nchan ) {
     
     uint64_t index;
     uint32_t method;
+    int64_t error;
+    bitreader br;
+    
     
+    /* Starts reading at the block offset. */
+    br_init ( &br, byte, size, off );
     
     /* Iterates through channels. */
     for ( index = 0; index < nchan; index ++ ) {
         
         /* Checks the compression method. */
-        method = bin2uint32 ( byte, off, 4 );
-        off   += 4;
+        method = br_read_uint ( &br, 4 );
         
         /* Only methods 0, 1, 2, 3, 8, 9, 10, 11 are allowed. */
         if ( ( method & 7 ) > 3 )
@@ -237,12 +421,14 @@ int64_t read_block ( int32_t *data, const uint8_t *byte, int64_t off, uint64_t n
         if ( index == 0 && ( ( method & 7 ) == 3 ) )
             return -2;
         
-        /* Reads the data for this channel. */
-        off    = read_channel ( data + ( index * nsamp ), byte, off, nsamp, method );
+        /* Reads the data for this channel, expanding the residuals. */
+        error  = read_channel ( data + ( index * nsamp ), &br, nsamp, method );
+        if ( error < 0 )
+            return error;
         
-        /* Expands the residuals for this channel. */
-        apply_residuals ( data + ( index * nsamp ), nsamp, method );
+        /* Aligns the offset with the byte. */
+        br_align ( &br );
     }
     
-    return off;
+    return br_offset ( &br );
 }
@@ -1,6 +1,30 @@
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
 #include "raweep.h"
+#include "raweep_write.h"
+
+#if defined ( _WIN32 )
+    #include <windows.h>
+    typedef HANDLE thread_t;
+#else
+    #include <pthread.h>
+    typedef pthread_t thread_t;
+#endif
+
+
+/* Sets the Python exception for a failed block read. */
+static void
+raweep_block_error ( int64_t off ) {
+    
+    if ( off == -1 )
+        PyErr_SetString ( PyExc_RuntimeError, "Unknown compression method (only methods 0-3 and 8-11 are allowed)." );
+    else if ( off == -2 )
+        PyErr_SetString ( PyExc_RuntimeError, "The compression method for the first channel cannot be inter-channel residuals (method 3/11)." );
+    else if ( off == -4 )
+        PyErr_SetString ( PyExc_RuntimeError, "Invalid residual length (longer than 32 bits)." );
+    else
+        PyErr_NoMemory ();
+}
 
 
 static PyObject *
@@ -19,12 +43,17 @@ raweep_read_block ( PyObject *self, PyObject *args ) {
     
     /* Reserves memory for the block data. */
     data = PyMem_Malloc ( nsamp * nchan * sizeof ( *data ) );
+    if ( data == NULL )
+        return PyErr_NoMemory ();
     
     /* Reads the block. */
-    off  = read_block ( data, bytes, offset, nsamp, nchan );
+    off  = read_block ( data, bytes, bsize, offset, nsamp, nchan );
     
-    if ( off < 1 )
-        PyErr_SetString ( PyExc_RuntimeError, "The compression method for the first channel cannot be inter-channel residuals (method 3/11)." );
+    if ( off < 1 ) {
+        raweep_block_error ( off );
+        PyMem_Free ( data );
+        return NULL;
+    }
     
 
     /* Builds a Python tuple from the data stram and the offset. */
@@ -41,10 +70,524 @@ raweep_read_block ( PyObject *self, PyObject *args ) {
 
 
 
+/* Definition of the work for each decoding thread. */
+typedef struct {
+    const uint8_t  * bytes;
+    uint64_t size;
+    const uint64_t * offsets;
+    const int64_t  * chans;
+    const double   * scale;
+    uint64_t nepoch, nsamp, nlast, nchan, ncol, first, total;
+    char * out;
+    char otype;
+    Py_ssize_t sstride, cstride;
+    uint64_t thread, step;
+    int64_t error;
+} raweep_job;
+
+
+/* Decodes every step-th epoch into the output, starting at the thread-th one. */
+static void
+raweep_decode_epochs ( raweep_job *job ) {
+    
+    uint64_t eindex, sindex, cindex, esamp, sfirst, slast;
+    int64_t off, row;
+    int32_t * data;
+    const int32_t * src;
+    char * dest;
+    double scale;
+    
+    
+    /* Reserves memory for one block. The GIL is released, so uses malloc. */
+    data = malloc ( job->nsamp * job->nchan * sizeof ( *data ) );
+    if ( data == NULL ) {
+        job->error = -3;
+        return;
+    }
+    
+    /* Goes through the epochs assigned to this thread. */
+    for ( eindex = job->thread; eindex < job->nepoch; eindex += job->step ) {
+        
+        /* The last epoch can be shorter. */
+        esamp  = ( eindex == job->nepoch - 1 ) ? job->nlast : job->nsamp;
+        
+        /* Reads the block. */
+        off    = read_block ( data, job->bytes, job->size, job->offsets [ eindex ], esamp, job->nchan );
+        
+        if ( off < 1 ) {
+            job->error = off;
+            break;
+        }
+        
+        
+        /* Gets the output row of the first sample of the epoch. */
+        row    = ( int64_t ) ( eindex * job->nsamp ) - ( int64_t ) job->first;
+        
+        /* Gets the samples of the epoch inside the output window. */
+        sfirst = row < 0 ? ( uint64_t ) -row : 0;
+        slast  = esamp;
+        if ( row + ( int64_t ) slast > ( int64_t ) job->total )
+            slast  = job->total - row;
+        
+        
+        /* Writes the selected channels (in the block as channels x samples)
+         * into the output (samples x columns), applying the scale. */
+        for ( cindex = 0; cindex < job->ncol; cindex ++ ) {
+            
+            src    = data + ( job->chans ? ( uint64_t ) job->chans [ cindex ] : cindex ) * esamp;
+            dest   = job->out + ( row + ( int64_t ) sfirst ) * job->sstride + cindex * job->cstride;
+            scale  = job->scale ? job->scale [ cindex ] : 1.0;
+            
+            if ( job->otype == 'd' ) {
+                for ( sindex = sfirst; sindex < slast; sindex ++, dest += job->sstride )
+                    * ( double * ) dest = scale * src [ sindex ];
+            } else if ( job->otype == 'f' ) {
+                for ( sindex = sfirst; sindex < slast; sindex ++, dest += job->sstride )
+                    * ( float * ) dest = ( float ) ( scale * src [ sindex ] );
+            } else {
+                for ( sindex = sfirst; sindex < slast; sindex ++, dest += job->sstride )
+                    * ( int32_t * ) dest = src [ sindex ];
+            }
+        }
+    }
+    
+    free ( data );
+}
+
+
+/* Thread entry points. */
+#if defined ( _WIN32 )
+    static DWORD WINAPI
+    raweep_thread ( LPVOID job ) {
+        raweep_decode_epochs ( ( raweep_job * ) job );
+        return 0;
+    }
+#else
+    static void *
+    raweep_thread ( void *job ) {
+        raweep_decode_epochs ( ( raweep_job * ) job );
+        return NULL;
+    }
+#endif
+
+
+/* Gets the type of the elements in a buffer ('i', 'q', 'f', 'd' or 0 if not supported). */
+static char
+raweep_buffer_type ( Py_buffer *view ) {
+    
+    const char * format = view->format;
+    
+    /* Skips the byte order mark, if any. */
+    if ( format == NULL )
+        return 0;
+    if ( *format == '<' || *format == '=' || *format == '@' )
+        format ++;
+    if ( strlen ( format ) != 1 )
+        return 0;
+    
+    /* Classifies the element type. */
+    if ( strchr ( "il", *format ) && view->itemsize == 4 )
+        return 'i';
+    if ( strchr ( "lq", *format ) && view->itemsize == 8 )
+        return 'q';
+    if ( *format == 'f' && view->itemsize == 4 )
+        return 'f';
+    if ( *format == 'd' && view->itemsize == 8 )
+        return 'd';
+    return 0;
+}
+
+
+static PyObject *
+raweep_read_blocks ( PyObject *self, PyObject *args, PyObject *kwargs ) {
+    
+    static char * kwlist [] = {
+        "bytes", "offsets", "nsamp", "nchan", "out",
+        "nlast", "nthreads", "chans", "scale", "first", NULL };
+    
+    Py_buffer bytes, offsets, out;
+    Py_buffer chans = { 0 }, scale = { 0 };
+    PyObject * pyout, * pychans = Py_None, * pyscale = Py_None;
+    unsigned long long nsamp, nchan, nlast = 0, first = 0;
+    int nthreads = 1;
+    uint64_t nepoch, eindex, cindex, ncol, total, avail;
+    int tindex;
+    char otype;
+    raweep_job * jobs = NULL;
+    thread_t * threads = NULL;
+    int64_t error = 0;
+    
+    if ( !PyArg_ParseTupleAndKeywords ( args, kwargs, "y*y*KKO|KiOOK", kwlist,
+            &bytes, &offsets, &nsamp, &nchan, &pyout, &nlast, &nthreads, &pychans, &pyscale, &first ) )
+        return NULL;
+    
+    /* Gets the output buffer, with its shape and strides. */
+    if ( PyObject_GetBuffer ( pyout, &out, PyBUF_RECORDS ) < 0 ) {
+        PyBuffer_Release ( &bytes );
+        PyBuffer_Release ( &offsets );
+        return NULL;
+    }
+    
+    /* Gets the channel selection and the scale, if provided. */
+    if ( pychans != Py_None && PyObject_GetBuffer ( pychans, &chans, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT ) < 0 )
+        goto done;
+    if ( pyscale != Py_None && PyObject_GetBuffer ( pyscale, &scale, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT ) < 0 )
+        goto done;
+    
+    
+    /* Gets the dimensions of the problem. */
+    nepoch = offsets.len / sizeof ( uint64_t );
+    otype  = raweep_buffer_type ( &out );
+    total  = out.ndim == 2 ? ( uint64_t ) out.shape [0] : 0;
+    ncol   = out.ndim == 2 ? ( uint64_t ) out.shape [1] : 0;
+    
+    /* By default, the last epoch ends with the output. */
+    if ( nlast == 0 && nepoch > 0 && first + total > ( nepoch - 1 ) * nsamp )
+        nlast  = first + total - ( nepoch - 1 ) * nsamp;
+    
+    /* Gets the number of samples available after skipping the first ones. */
+    avail  = nepoch > 0 ? ( nepoch - 1 ) * nsamp + nlast - first : 0;
+    
+    
+    /* Checks the inputs. */
+    if ( offsets.len % sizeof ( uint64_t ) != 0 ) {
+        PyErr_SetString ( PyExc_ValueError, "The offsets must be a buffer of 64-bit unsigned integers." );
+        goto done;
+    }
+    if ( out.ndim != 2 || ( otype != 'i' && otype != 'f' && otype != 'd' ) ) {
+        PyErr_SetString ( PyExc_ValueError, "The output must be a two-dimensional int32, float32 or float64 array." );
+        goto done;
+    }
+    if ( nepoch == 0 || nsamp == 0 || nlast > nsamp || first >= ( nepoch > 1 ? nsamp : nlast ) ||
+            total > avail || ( nepoch > 1 && total + first <= ( nepoch - 1 ) * nsamp ) ) {
+        PyErr_SetString ( PyExc_ValueError, "The output window (samples x channels) does not match the epochs." );
+        goto done;
+    }
+    if ( pychans != Py_None && ( raweep_buffer_type ( &chans ) != 'q' || ( uint64_t ) chans.shape [0] != ncol ) ) {
+        PyErr_SetString ( PyExc_ValueError, "The channels must be an int64 array with one entry per output column." );
+        goto done;
+    }
+    if ( pychans == Py_None && ncol != nchan ) {
+        PyErr_SetString ( PyExc_ValueError, "The output must have one column per channel." );
+        goto done;
+    }
+    if ( pyscale != Py_None && ( raweep_buffer_type ( &scale ) != 'd' || ( uint64_t ) scale.shape [0] != ncol ) ) {
+        PyErr_SetString ( PyExc_ValueError, "The scale must be a float64 array with one entry per output column." );
+        goto done;
+    }
+    if ( pyscale != Py_None && otype == 'i' ) {
+        PyErr_SetString ( PyExc_ValueError, "The scale can only be applied to a floating point output." );
+        goto done;
+    }
+    for ( cindex = 0; pychans != Py_None && cindex < ncol; cindex ++ ) {
+        if ( ( ( int64_t * ) chans.buf ) [ cindex ] < 0 || ( uint64_t ) ( ( int64_t * ) chans.buf ) [ cindex ] >= nchan ) {
+            PyErr_SetString ( PyExc_ValueError, "Channel index out of range." );
+            goto done;
+        }
+    }
+    for ( eindex = 0; eindex < nepoch; eindex ++ ) {
+        if ( ( ( uint64_t * ) offsets.buf ) [ eindex ] / 8 >= ( uint64_t ) bytes.len ) {
+            PyErr_SetString ( PyExc_ValueError, "Epoch offset beyond the end of the data." );
+            goto done;
+        }
+    }
+    
+    
+    /* Never uses more threads than epochs. */
+    if ( nthreads < 1 )
+        nthreads = 1;
+    if ( ( uint64_t ) nthreads > nepoch )
+        nthreads = ( int ) nepoch;
+    
+    /* Reserves memory for the thread definitions. */
+    jobs    = PyMem_Malloc ( nthreads * sizeof ( *jobs ) );
+    threads = PyMem_Malloc ( nthreads * sizeof ( *threads ) );
+    
+    if ( jobs == NULL || threads == NULL ) {
+        PyErr_NoMemory ();
+        goto done;
+    }
+    
+    /* Defines the work for each thread (epochs interleaved across threads). */
+    for ( tindex = 0; tindex < nthreads; tindex ++ ) {
+        jobs [ tindex ].bytes   = bytes.buf;
+        jobs [ tindex ].size    = bytes.len;
+        jobs [ tindex ].offsets = offsets.buf;
+        jobs [ tindex ].chans   = pychans != Py_None ? chans.buf : NULL;
+        jobs [ tindex ].scale   = pyscale != Py_None ? scale.buf : NULL;
+        jobs [ tindex ].nepoch  = nepoch;
+        jobs [ tindex ].nsamp   = nsamp;
+        jobs [ tindex ].nlast   = nlast;
+        jobs [ tindex ].nchan   = nchan;
+        jobs [ tindex ].ncol    = ncol;
+        jobs [ tindex ].first   = first;
+        jobs [ tindex ].total   = total;
+        jobs [ tindex ].out     = out.buf;
+        jobs [ tindex ].otype   = otype;
+        jobs [ tindex ].sstride = out.strides [0];
+        jobs [ tindex ].cstride = out.strides [1];
+        jobs [ tindex ].thread  = tindex;
+        jobs [ tindex ].step    = nthreads;
+        jobs [ tindex ].error   = 0;
+    }
+    
+    
+    /* Decodes the epochs without the GIL. */
+    Py_BEGIN_ALLOW_THREADS
+    
+    /* Launches the extra threads. The current thread does the first job. */
+    for ( tindex = 1; tindex < nthreads; tindex ++ ) {
+#if defined ( _WIN32 )
+        threads [ tindex ] = CreateThread ( NULL, 0, raweep_thread, &jobs [ tindex ], 0, NULL );
+        if ( threads [ tindex ] == NULL )
+#else
+        if ( pthread_create ( &threads [ tindex ], NULL, raweep_thread, &jobs [ tindex ] ) != 0 )
+#endif
+        {
+            /* If the thread cannot be created, does its work here. */
+            raweep_decode_epochs ( &jobs [ tindex ] );
+            jobs [ tindex ].step = 0;
+        }
+    }
+    
+    raweep_decode_epochs ( &jobs [0] );
+    
+    /* Waits for the extra threads. */
+    for ( tindex = 1; tindex < nthreads; tindex ++ ) {
+        if ( jobs [ tindex ].step == 0 )
+            continue;
+#if defined ( _WIN32 )
+        WaitForSingleObject ( threads [ tindex ], INFINITE );
+        CloseHandle ( threads [ tindex ] );
+#else
+        pthread_join ( threads [ tindex ], NULL );
+#endif
+    }
+    
+    Py_END_ALLOW_THREADS
+    
+    
+    /* Collects the errors, if any. */
+    for ( tindex = 0; tindex < nthreads; tindex ++ ) {
+        if ( jobs [ tindex ].error != 0 )
+            error = jobs [ tindex ].error;
+    }
+    
+    if ( error != 0 )
+        raweep_block_error ( error );
+    
+    
+done:
+    
+    /* Releases the memory and the buffers. */
+    PyMem_Free ( jobs );
+    PyMem_Free ( threads );
+    PyBuffer_Release ( &bytes );
+    PyBuffer_Release ( &offsets );
+    PyBuffer_Release ( &out );
+    if ( chans.obj != NULL )
+        PyBuffer_Release ( &chans );
+    if ( scale.obj != NULL )
+        PyBuffer_Release ( &scale );
+    
+    if ( PyErr_Occurred () )
+        return NULL;
+    
+    Py_RETURN_NONE;
+}
+
+
+
+/* Sets the Python exception for a failed block write. */
+static void
+raweep_write_error ( int64_t size ) {
+    
+    if ( size == -3 )
+        PyErr_SetString ( PyExc_RuntimeError, "The encoded block does not fit in the output buffer." );
+    else
+        PyErr_Format ( PyExc_RuntimeError, "Unknown error encoding the block (code %lld).", ( long long ) size );
+}
+
+
+
+static PyObject *
+raweep_write_block ( PyObject *self, PyObject *args ) {
+    
+    const uint8_t * bytes;
+    size_t bsize;
+    const uint64_t nsamp, nchan;
+    int64_t size;
+    int32_t * res;
+    PyObject * pyblock;
+    
+    if ( !PyArg_ParseTuple ( args, "y#KK", &bytes, &bsize, &nsamp, &nchan ) )
+        return NULL;
+    
+    /* Checks the dimensions of the block. */
+    if ( nsamp == 0 || bsize != nsamp * nchan * sizeof ( int32_t ) ) {
+        PyErr_SetString ( PyExc_ValueError, "The data must be (channels x samples) int32 values." );
+        return NULL;
+    }
+    
+    
+    /* Reserves memory for the residuals and the (longest) encoded block. */
+    res     = PyMem_Malloc ( nsamp * sizeof ( *res ) );
+    pyblock = PyBytes_FromStringAndSize ( NULL, max_block_size ( nsamp, nchan ) );
+    if ( res == NULL || pyblock == NULL ) {
+        PyMem_Free ( res );
+        Py_XDECREF ( pyblock );
+        return PyErr_NoMemory ();
+    }
+    
+    /* Encodes the block. */
+    size = write_block ( ( uint8_t * ) PyBytes_AS_STRING ( pyblock ), PyBytes_GET_SIZE ( pyblock ), ( const int32_t * ) bytes, nsamp, nchan, res );
+    PyMem_Free ( res );
+    
+    if ( size < 0 ) {
+        Py_DECREF ( pyblock );
+        raweep_write_error ( size );
+        return NULL;
+    }
+    
+    
+    /* Trims the encoded block to its length and returns it. On failure the
+     * block is released and the exception set. */
+    if ( _PyBytes_Resize ( &pyblock, size ) < 0 )
+        return NULL;
+    
+    return pyblock;
+    
+}
+
+
+
+static PyObject *
+raweep_write_blocks ( PyObject *self, PyObject *args ) {
+    
+    Py_buffer data;
+    PyObject * pydata, * pystream = NULL, * pyoffsets = NULL;
+    unsigned long long nsamp;
+    uint64_t total, nchan, nepoch, eindex, sindex, cindex, esamp, size, pos;
+    int64_t length = 0;
+    int32_t * block = NULL, * res = NULL;
+    uint64_t * offsets;
+    const char * src;
+    
+    if ( !PyArg_ParseTuple ( args, "OK", &pydata, &nsamp ) )
+        return NULL;
+    
+    /* Gets the input buffer, with its shape and strides. */
+    if ( PyObject_GetBuffer ( pydata, &data, PyBUF_RECORDS_RO ) < 0 )
+        return NULL;
+    
+    if ( data.ndim != 2 || raweep_buffer_type ( &data ) != 'i' ) {
+        PyErr_SetString ( PyExc_ValueError, "The data must be a two-dimensional (samples x channels) int32 array." );
+        goto done;
+    }
+    if ( nsamp == 0 ) {
+        PyErr_SetString ( PyExc_ValueError, "The epoch length must be positive." );
+        goto done;
+    }
+    
+    
+    /* Gets the dimensions of the problem. The last epoch can be shorter. */
+    total  = data.shape [0];
+    nchan  = data.shape [1];
+    nepoch = ( total + nsamp - 1 ) / nsamp;
+    
+    /* Gets the longest possible stream. */
+    size   = 0;
+    for ( eindex = 0; eindex < nepoch; eindex ++ )
+        size  += max_block_size ( eindex < nepoch - 1 ? nsamp : total - eindex * nsamp, nchan );
+    
+    /* Reserves memory for one block, the residuals, the stream and the offsets. */
+    block     = PyMem_Malloc ( nsamp * nchan * sizeof ( *block ) + 1 );
+    res       = PyMem_Malloc ( nsamp * sizeof ( *res ) );
+    pystream  = PyBytes_FromStringAndSize ( NULL, size );
+    pyoffsets = PyBytes_FromStringAndSize ( NULL, nepoch * sizeof ( uint64_t ) );
+    
+    if ( block == NULL || res == NULL || pystream == NULL || pyoffsets == NULL ) {
+        PyErr_NoMemory ();
+        goto done;
+    }
+    
+    offsets = ( uint64_t * ) PyBytes_AS_STRING ( pyoffsets );
+    
+    
+    /* Encodes the epochs without the GIL. */
+    Py_BEGIN_ALLOW_THREADS
+    
+    pos    = 0;
+    for ( eindex = 0; eindex < nepoch; eindex ++ ) {
+        
+        /* Copies the epoch as (channels x samples). */
+        esamp  = eindex < nepoch - 1 ? nsamp : total - eindex * nsamp;
+        for ( cindex = 0; cindex < nchan; cindex ++ ) {
+            src    = ( const char * ) data.buf + eindex * nsamp * data.strides [0] + cindex * data.strides [1];
+            for ( sindex = 0; sindex < esamp; sindex ++, src += data.strides [0] )
+                block [ cindex * esamp + sindex ] = * ( const int32_t * ) src;
+        }
+        
+        /* Encodes the epoch after the previous one. */
+        offsets [ eindex ] = pos;
+        length = write_block ( ( uint8_t * ) PyBytes_AS_STRING ( pystream ) + pos, size - pos, block, esamp, nchan, res );
+        if ( length < 0 )
+            break;
+        pos   += length;
+    }
+    
+    Py_END_ALLOW_THREADS
+    
+    if ( length < 0 ) {
+        raweep_write_error ( length );
+        goto done;
+    }
+    
+    /* Trims the stream to its length. On failure the stream is released
+     * and the exception set. */
+    if ( _PyBytes_Resize ( &pystream, pos ) < 0 )
+        goto done;
+    
+    
+done:
+    
+    /* Releases the memory and the buffer. */
+    PyMem_Free ( block );
+    PyMem_Free ( res );
+    PyBuffer_Release ( &data );
+    
+    if ( PyErr_Occurred () ) {
+        Py_XDECREF ( pystream );
+        Py_XDECREF ( pyoffsets );
+        return NULL;
+    }
+    
+    
+    /* Returns the stream and the byte offset of each epoch. */
+    return Py_BuildValue ( "NN", pystream, pyoffsets );
+}
+
+
+
 /* Defines the method table (available methods). */
 static PyMethodDef
 raweep_methods [] = {
     { "read_block",  raweep_read_block, METH_VARARGS, "Decodes a block of data from a raw3 stream." },
+    { "read_blocks", ( PyCFunction ) ( void ( * ) ( void ) ) raweep_read_blocks, METH_VARARGS | METH_KEYWORDS,
+      "read_blocks(bytes, offsets, nsamp, nchan, out, nlast=0, nthreads=1, chans=None, scale=None, first=0)\n\n"
+      "Decodes several blocks (epochs) of a raw3 stream in parallel, without the GIL,\n"
+      "directly into a preallocated (samples x columns) int32, float32 or float64 array.\n"
+      "offsets are the bit offsets of the epochs (uint64) and nlast the length of the\n"
+      "last epoch. Column k takes the stream channel chans[k] (int64) multiplied by\n"
+      "scale[k] (float64), and the first samples of the first epoch are skipped. The\n"
+      "output can have any strides, so out.T writes (channels x samples)." },
+    { "write_block", raweep_write_block, METH_VARARGS, "Encodes a block of (channels x samples) int32 data into a raw3 stream." },
+    { "write_blocks", raweep_write_blocks, METH_VARARGS,
+      "write_blocks(data, nsamp)\n\n"
+      "Encodes a (samples x channels) int32 array, with any strides, into a raw3\n"
+      "stream of epochs of nsamp samples (the last one can be shorter), without the\n"
+      "GIL. Each channel of each epoch uses the compression method with the shortest\n"
+      "encoding. Returns the stream and the byte offset of each epoch (uint64)." },
     { NULL, NULL, 0, NULL }        /* Sentinel */
 };
 
@@ -53,7 +596,7 @@ static struct
 PyModuleDef raweepmodule = {
     PyModuleDef_HEAD_INIT,
     "raweep", 
-    PyDoc_STR ( "Module to read raw data from EEP (CNT) files." ),
+    PyDoc_STR ( "Module to read and write raw data from EEP (CNT) files." ),
     -1,
     raweep_methods
 };
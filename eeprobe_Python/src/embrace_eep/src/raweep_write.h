@@ -0,0 +1,274 @@
+/*  Encoder of the raw3 data stream, the inverse of read_block in raweep.h.
+ *  Based on the description of the EEP 3.x file format in:
+ *  * cnt_riff.txt by Rainer Nowagk & Maren Grigutsch.
+ */
+
+#include <stdint.h>
+#include <string.h>
+
+
+/* Number of bits of an unsigned value (0 for 0). */
+static inline uint32_t bit_length ( uint32_t value ) {
+#if defined ( __GNUC__ )
+    return value ? 32 - __builtin_clz ( value ) : 0;
+#else
+    uint32_t length = 0;
+    while ( value ) {
+        value >>= 1;
+        length ++;
+    }
+    return length;
+#endif
+}
+
+
+/* Bits to store a residual in two's complement (0 for 0). */
+static inline uint32_t full_bits ( int32_t value ) {
+    return value ? bit_length ( ( uint32_t ) ( value < 0 ? ~value : value ) ) + 1 : 0;
+}
+
+
+/* Bits to store a residual without escaping it. The most negative value,
+ * -2^(nbit - 1), is the escape marker, so it must be escaped. */
+static inline uint32_t short_bits ( int32_t value ) {
+    return value ? bit_length ( value < 0 ? - ( uint32_t ) value : ( uint32_t ) value ) + 1 : 0;
+}
+
+
+
+/* Streaming writer of big-endian bit fields.
+ * The cache holds the last 'count' bits not yet written, right aligned. */
+typedef struct {
+    uint8_t * byte;
+    uint64_t size;
+    uint64_t pos;
+    uint64_t cache;
+    uint32_t count;
+} bitwriter;
+
+
+static inline void bw_init ( bitwriter *bw, uint8_t *byte, uint64_t size ) {
+    
+    bw->byte   = byte;
+    bw->size   = size;
+    bw->pos    = 0;
+    bw->cache  = 0;
+    bw->count  = 0;
+}
+
+
+/* Writes the lowest 'length' bits (up to 32) of a value. */
+static inline void bw_write ( bitwriter *bw, uint32_t value, uint32_t length ) {
+    
+    if ( length == 0 ) return;
+    
+    /* Appends the bits to the cache. */
+    bw->cache  = ( bw->cache << length ) | ( value & ( uint32_t ) ( ( ( uint64_t ) 1 << length ) - 1 ) );
+    bw->count += length;
+    
+    /* Writes the complete bytes. Past the end of the buffer only counts them. */
+    while ( bw->count >= 8 ) {
+        bw->count -= 8;
+        if ( bw->pos < bw->size )
+            bw->byte [ bw->pos ] = ( uint8_t ) ( bw->cache >> bw->count );
+        bw->pos   += 1;
+    }
+}
+
+
+/* Pads the stream with zeros up to the next byte boundary. */
+static inline void bw_align ( bitwriter *bw ) {
+    
+    if ( bw->count > 0 )
+        bw_write ( bw, 0, 8 - bw->count );
+}
+
+
+
+/* Gets the nsamp - 1 residuals of a channel for a compression method:
+ *   method 1: r [i] = x [i] - x [i-1]
+ *   method 2: r [i] = x [i] - x [i-1] - ( x [i-1] - x [i-2] ), r [1] as method 1
+ *   method 3: r [i] = x [i] - x [i-1] - ( p [i] - p [i-1] )
+ * where p is the previous channel. The arithmetic is unsigned, as in the
+ * decoder, so the residuals wrap around as int32. */
+void get_residuals ( int32_t *res, const int32_t *data, const int32_t *prev, uint64_t nsamp, uint32_t method ) {
+    
+    uint64_t index;
+    uint32_t value;
+    
+    
+    for ( index = 1; index < nsamp; index ++ ) {
+        
+        value  = ( uint32_t ) data [ index ] - ( uint32_t ) data [ index - 1 ];
+        
+        if ( method == 2 && index > 1 )
+            value -= ( uint32_t ) data [ index - 1 ] - ( uint32_t ) data [ index - 2 ];
+        if ( method == 3 )
+            value -= ( uint32_t ) prev [ index ] - ( uint32_t ) prev [ index - 1 ];
+        
+        res [ index - 1 ] = ( int32_t ) value;
+    }
+}
+
+
+/* Selects the residual lengths with the shortest encoding: nbit bits for
+ * each residual and, for the residuals not fitting, the escape marker plus
+ * xbit bits (the length of the longest residual). Returns the length of the
+ * encoded residuals, in bits. */
+uint64_t get_residual_bits ( const int32_t *res, uint64_t nres, uint32_t *nbit, uint32_t *xbit ) {
+    
+    uint64_t index, hist [34], escaped, bits, best;
+    uint32_t width, length;
+    
+    
+    /* Counts the residuals by length, and gets the longest one. */
+    memset ( hist, 0, sizeof ( hist ) );
+    width  = 0;
+    for ( index = 0; index < nres; index ++ ) {
+        hist [ short_bits ( res [ index ] ) ] ++;
+        length = full_bits ( res [ index ] );
+        if ( length > width )
+            width  = length;
+    }
+    
+    /* By default, all the residuals are stored with the longest length. */
+    *nbit  = width;
+    *xbit  = width;
+    best   = nres * width;
+    
+    /* Tries each shorter length, escaping the longer residuals. */
+    escaped = 0;
+    for ( length = 32; length > 0; length -- ) {
+        escaped += hist [ length + 1 ];
+        if ( length >= width )
+            continue;
+        
+        bits   = nres * length + escaped * width;
+        if ( bits < best ) {
+            best   = bits;
+            *nbit  = length;
+        }
+    }
+    
+    return best;
+}
+
+
+/* Writes one channel with the given method and residual lengths. */
+void write_channel ( bitwriter *bw, const int32_t *data, const int32_t *res, uint64_t nsamp, uint32_t method, uint32_t nbit, uint32_t xbit ) {
+    
+    uint32_t mbit, dbit, escape;
+    uint64_t index;
+    
+    
+    /* Gets the length of the data and metadata depending on the method. */
+    mbit   =  4 + ( ( method & 8 ) >> 2 );
+    dbit   = 16 + ( ( method & 8 ) << 1 );
+    
+    /* Writes the compression method. */
+    bw_write ( bw, method, 4 );
+    
+    /* Method 0 (or 8) stores the samples after four padding bits. */
+    if ( ( method & 7 ) == 0 ) {
+        bw_write ( bw, 0, 4 );
+        for ( index = 0; index < nsamp; index ++ )
+            bw_write ( bw, ( uint32_t ) data [ index ], dbit );
+    }
+    
+    /* The other methods store the first sample and the residuals. */
+    else {
+        bw_write ( bw, nbit, mbit );
+        bw_write ( bw, xbit, mbit );
+        bw_write ( bw, ( uint32_t ) data [0], dbit );
+        
+        escape = nbit > 0 ? ( uint32_t ) 1 << ( nbit - 1 ) : 0;
+        for ( index = 0; index + 1 < nsamp; index ++ ) {
+            if ( xbit != nbit && short_bits ( res [ index ] ) > nbit ) {
+                bw_write ( bw, escape, nbit );
+                bw_write ( bw, ( uint32_t ) res [ index ], xbit );
+            } else {
+                bw_write ( bw, ( uint32_t ) res [ index ], nbit );
+            }
+        }
+    }
+    
+    /* Each channel ends at a byte boundary. */
+    bw_align ( bw );
+}
+
+
+/* Maximum length of an encoded block, in bytes (all channels as method 8). */
+uint64_t max_block_size ( uint64_t nsamp, uint64_t nchan ) {
+    return nchan * ( 1 + 4 * nsamp );
+}
+
+
+/* Encodes a block of (channels x samples) data. For each channel selects
+ * the method (samples, first or second derivative, or first derivative
+ * respect to the previous channel, with 16 or 32 bits) and the residual
+ * lengths giving the shortest encoding. 'res' is a buffer of nsamp values.
+ * Returns the length of the block, in bytes, or -3 if it does not fit. */
+int64_t write_block ( uint8_t *byte, uint64_t size, const int32_t *data, uint64_t nsamp, uint64_t nchan, int32_t *res ) {
+    
+    uint64_t cindex, sindex, bits, best;
+    uint32_t method, bmethod, nbit, xbit, bnbit, bxbit, narrow;
+    const int32_t * chan;
+    const int32_t * prev;
+    bitwriter bw;
+    
+    
+    bw_init ( &bw, byte, size );
+    
+    /* Iterates through channels. */
+    for ( cindex = 0; cindex < nchan; cindex ++ ) {
+        
+        chan   = data + cindex * nsamp;
+        prev   = cindex > 0 ? chan - nsamp : NULL;
+        
+        /* Checks if the samples fit in 16 bits. */
+        narrow = 1;
+        for ( sindex = 0; sindex < nsamp && narrow; sindex ++ )
+            narrow = chan [ sindex ] >= INT16_MIN && chan [ sindex ] <= INT16_MAX;
+        
+        /* Starts with the samples (method 0 or 8). */
+        bmethod = narrow ? 0 : 8;
+        bnbit  = 0;
+        bxbit  = 0;
+        best   = ( 8 + nsamp * ( narrow ? 16 : 32 ) + 7 ) / 8;
+        
+        /* Tries each residual method. Method 3 requires a previous channel. */
+        for ( method = 1; method <= ( prev ? 3u : 2u ); method ++ ) {
+            
+            get_residuals ( res, chan, prev, nsamp, method );
+            bits   = get_residual_bits ( res, nsamp - 1, &nbit, &xbit );
+            
+            /* Uses 16 bits if the first sample and the lengths fit. */
+            if ( chan [0] >= INT16_MIN && chan [0] <= INT16_MAX && xbit < 16 )
+                bits  += 4 + 2 * 4 + 16;
+            else {
+                bits  += 4 + 2 * 6 + 32;
+                method |= 8;
+            }
+            
+            /* Keeps the shortest encoding (rounded to whole bytes). */
+            if ( ( bits + 7 ) / 8 < best ) {
+                best   = ( bits + 7 ) / 8;
+                bmethod = method;
+                bnbit  = nbit;
+                bxbit  = xbit;
+            }
+            method &= 7;
+        }
+        
+        
+        /* Writes the channel with the selected method. */
+        if ( ( bmethod & 7 ) > 0 )
+            get_residuals ( res, chan, prev, nsamp, bmethod & 7 );
+        write_channel ( &bw, chan, res, nsamp, bmethod, bnbit, bxbit );
+    }
+    
+    if ( bw.pos > size )
+        return -3;
+    
+    return bw.pos;
+}
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+
+@author: Ricardo Bruña
+
+On-disk cache of decoded EEProbe files.
+
+Each entry stores the decoded (uncalibrated) int32 samples of one file as a
+(samples x channels) .npy file, which is written and read memory-mapped, and
+the parsed file information as JSON (the tables as plain columns). Nothing
+is ever unpickled, so a shared cache directory cannot run code in the
+readers. Entries are keyed on the file path, size and modification time
+(also of the sidecar files) and on a hash of the file header, so a modified
+file is never served from the cache.
+
+The cache is disabled by default. Use enable ( directory, max_size ) to
+store the entries in 'directory', keeping at most 'max_size' bytes: the least
+recently used entries are removed first.
+
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+import numpy
+
+
+# Stores the active cache, if any.
+active   = None
+
+
+# Function to enable the on-disk cache.
+def enable ( directory, max_size = None ):
+    
+    global active
+    
+    # Creates the cache and sets it as the active one.
+    active   = DecodedCache ( directory, max_size )
+    
+    # Returns the cache.
+    return active
+
+
+
+# Function to disable the on-disk cache.
+def disable ():
+    
+    global active
+    
+    # Removes the active cache. The stored entries are kept.
+    active   = None
+
+
+
+# Function to get the active cache (or None, if disabled).
+def get_cache ():
+    return active
+
+
+
+# Class to store and retrieve the decoded data of EEProbe files.
+class DecodedCache:
+    
+    
+    def __init__ ( self, directory, max_size = None ):
+        
+        # Stores the cache definition.
+        self.directory = os.path.abspath ( directory )
+        self.max_size  = max_size
+        
+        # Lock to serialize the writes from this process.
+        self.lock      = threading.Lock ()
+        
+        # Creates the directory, if required.
+        os.makedirs ( self.directory, exist_ok = True )
+    
+    
+    
+    # Function to build the key of a file from its (and its sidecar files)
+    # path, size and modification time and from the file header.
+    def get_key ( self, filenames, header ):
+        
+        
+        # Initializes the hash.
+        digest   = hashlib.sha1 ()
+        
+        # Adds the identification of each file, if it exists.
+        for filename in filenames:
+            
+            filename = os.path.abspath ( filename )
+            digest.update ( filename.encode () )
+            
+            try:
+                stat     = os.stat ( filename )
+                digest.update ( b'%d:%d' % ( stat.st_size, stat.st_mtime_ns ) )
+            except FileNotFoundError:
+                digest.update ( b'-' )
+        
+        # Adds the header.
+        digest.update ( bytes ( header ) )
+        
+        
+        # Returns the key.
+        return digest.hexdigest ()
+    
+    
+    
+    # Function to get the file names of an entry.
+    def get_paths ( self, key ):
+        
+        # Lists the data and information files.
+        base     = os.path.join ( self.directory, key )
+        return base + '.npy', base + '.json'
+    
+    
+    
+    # Function to read an entry. Returns the memory-mapped data and the file
+    # information, or None if the entry does not exist.
+    def load ( self, key ):
+        
+        
+        # Gets the file names.
+        datafile, infofile = self.get_paths ( key )
+        
+        # Reads the entry, if it exists.
+        try:
+            with open ( infofile, 'r' ) as fid:
+                info     = json.load ( fid, object_hook = decode_value )
+            data     = numpy.load ( datafile, mmap_mode = 'r', allow_pickle = False )
+        except ( FileNotFoundError, EOFError, ValueError, KeyError, TypeError ):
+            return None
+        
+        
+        # Marks the entry as recently used.
+        try:
+            os.utime ( infofile )
+        except OSError:
+            pass
+        
+        
+        # Returns the entry.
+        return data, info
+    
+    
+    
+    # Function to write an entry of data with the given (samples x channels)
+    # shape. 'fill' ( out ) writes the data into a memory-mapped int32 array,
+    # so the data never needs to be in memory at once.
+    def store ( self, key, shape, fill, info ):
+        
+        
+        # Gets the file names.
+        datafile, infofile = self.get_paths ( key )
+        
+        # Serializes the information (before writing any data).
+        text     = json.dumps ( encode_value ( info ) )
+        
+        
+        # Writes each file to a temporary file and moves it into place, so
+        # other processes never see a partial entry. The information is
+        # written last, as it marks the entry as complete.
+        handle, tmpfile = tempfile.mkstemp ( dir = self.directory, suffix = '.tmp' )
+        os.close ( handle )
+        try:
+            
+            # Writes the data through a memory map, and releases it.
+            data     = numpy.lib.format.open_memmap ( tmpfile, mode = 'w+', dtype = 'int32', shape = shape )
+            fill ( data )
+            data.flush ()
+            del data
+            os.replace ( tmpfile, datafile )
+            
+            # Writes the information.
+            with self.lock:
+                handle, tmpfile = tempfile.mkstemp ( dir = self.directory, suffix = '.tmp' )
+                with os.fdopen ( handle, 'w' ) as fid:
+                    fid.write ( text )
+                os.replace ( tmpfile, infofile )
+                
+                # Removes the old entries, if required.
+                self.evict ()
+        
+        except BaseException:
+            if os.path.exists ( tmpfile ):
+                os.remove ( tmpfile )
+            raise
+    
+    
+    
+    # Function to list the entries as (last use, size, key), oldest first.
+    def list_entries ( self ):
+        
+        
+        # Initializes the list of entries.
+        entries  = []
+        
+        # Goes through each complete entry.
+        for filename in os.listdir ( self.directory ):
+            
+            if not filename.endswith ( '.json' ):
+                continue
+            
+            key      = filename [ :-5 ]
+            datafile, infofile = self.get_paths ( key )
+            
+            # Gets the last use and the size of the entry.
+            try:
+                used     = os.stat ( infofile ).st_mtime_ns
+                size     = os.path.getsize ( infofile ) + os.path.getsize ( datafile )
+            except FileNotFoundError:
+                continue
+            
+            entries.append ( ( used, size, key ) )
+        
+        
+        # Returns the entries sorted by last use.
+        return sorted ( entries )
+    
+    
+    
+    # Function to remove an entry.
+    def remove ( self, key ):
+        
+        # Removes the information first, so the entry is no longer valid.
+        for filename in reversed ( self.get_paths ( key ) ):
+            try:
+                os.remove ( filename )
+            except FileNotFoundError:
+                pass
+    
+    
+    
+    # Function to remove the least recently used entries above the size cap.
+    def evict ( self ):
+        
+        
+        # If no size cap, does nothing.
+        if self.max_size is None:
+            return
+        
+        # Gets the entries and the total size.
+        entries  = self.list_entries ()
+        total    = sum ( size for _, size, _ in entries )
+        
+        # Removes the oldest entries until the cache fits the size cap.
+        for _, size, key in entries:
+            
+            if total <= self.max_size:
+                break
+            
+            self.remove ( key )
+            total   -= size
+    
+    
+    
+    # Function to remove all the entries.
+    def clear ( self ):
+        
+        # Goes through each entry.
+        for _, _, key in self.list_entries ():
+            self.remove ( key )
+
+
+
+
+"""
+Code for storing the file information as JSON.
+"""
+
+# Function to convert the file information into JSON types. The tables
+# (DataFrames), record arrays and arrays are stored as tagged objects with
+# their columns or values as plain lists.
+def encode_value ( value ):
+    
+    import pandas
+    
+    
+    # Converts the tables column by column.
+    if isinstance ( value, pandas.DataFrame ):
+        return { '__type__': 'table', 'columns': [ [ name, encode_value ( value [ name ].to_numpy () ) ] for name in value.columns ] }
+    
+    # Converts the record arrays field by field.
+    if isinstance ( value, numpy.ndarray ) and value.dtype.names is not None:
+        return { '__type__': 'records', 'fields': [ [ name, encode_value ( numpy.asarray ( value [ name ] ) ) ] for name in value.dtype.names ] }
+    
+    # Converts the arrays, keeping their type.
+    if isinstance ( value, numpy.ndarray ):
+        if value.dtype.kind not in 'biufcO':
+            raise ValueError ( 'Arrays of type %s cannot be stored.' % value.dtype )
+        return { '__type__': 'array', 'dtype': value.dtype.str, 'shape': list ( value.shape ), 'data': [ encode_value ( item ) for item in value.ravel ().tolist () ] }
+    
+    # Converts the NumPy scalars.
+    if isinstance ( value, numpy.generic ):
+        return value.item ()
+    
+    # Converts the containers.
+    if isinstance ( value, dict ):
+        if not all ( isinstance ( name, str ) for name in value ) or '__type__' in value:
+            raise ValueError ( 'Only dictionaries with text keys can be stored.' )
+        return { name: encode_value ( item ) for name, item in value.items () }
+    if isinstance ( value, ( list, tuple ) ):
+        return [ encode_value ( item ) for item in value ]
+    
+    # Keeps the basic types.
+    if value is None or isinstance ( value, ( str, int, float ) ):
+        return value
+    
+    raise ValueError ( 'Values of type %s cannot be stored.' % type ( value ).__name__ )
+
+
+
+# Function to restore the tagged objects of encode_value (see json.load).
+def decode_value ( value ):
+    
+    import pandas
+    
+    
+    # Keeps the plain dictionaries.
+    vtype    = value.get ( '__type__' )
+    if vtype is None:
+        return value
+    
+    # Restores the tables.
+    if vtype == 'table':
+        return pandas.DataFrame ( dict ( value [ 'columns' ] ) )
+    
+    # Restores the record arrays.
+    if vtype == 'records':
+        names, columns = zip ( *value [ 'fields' ] ) if value [ 'fields' ] else ( (), () )
+        return numpy.rec.fromarrays ( columns, names = names )
+    
+    # Restores the arrays.
+    if vtype == 'array':
+        dtype    = numpy.dtype ( value [ 'dtype' ] )
+        array    = numpy.empty ( len ( value [ 'data' ] ), dtype = dtype )
+        if dtype.kind == 'O':
+            for index, item in enumerate ( value [ 'data' ] ):
+                array [ index ] = item
+        else:
+            array [:] = value [ 'data' ]
+        return array.reshape ( value [ 'shape' ] )
+    
+    raise ValueError ( 'Unknown stored type \'%s\'.' % vtype )
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+
+@author: Ricardo Bruña
+
+In-process memoization of functions reading files.
+
+The results are kept in a bounded, thread-safe, least recently used cache,
+keyed on the function arguments and on the path, modification time and
+size of the file (and, optionally, of its related files). A file modified
+on disk is therefore read again. The cached results are shared: they must
+be treated as read-only.
+
+"""
+
+import os
+import functools
+import threading
+import collections
+
+
+# Function to wrap a function reading a file in a memo.
+def file_memo ( maxsize = 128, related = None ):
+    
+    # Returns the decorator.
+    return lambda function: FileMemo ( function, maxsize, related )
+
+
+
+# Class to memoize a function whose first argument is a file name.
+class FileMemo:
+    
+    
+    def __init__ ( self, function, maxsize = 128, related = None ):
+        
+        # Stores the function and the cache definition.
+        self.function = function
+        self.maxsize  = maxsize
+        self.related  = related
+        
+        # Initializes the cache and the statistics.
+        self.entries  = collections.OrderedDict ()
+        self.lock     = threading.Lock ()
+        self.hits     = 0
+        self.misses   = 0
+        
+        # Copies the name and documentation of the function.
+        functools.update_wrapper ( self, function )
+    
+    
+    
+    # Function to get the identification of a file and its related files.
+    def get_stamp ( self, filename ):
+        
+        
+        # Lists the file and its related files.
+        filenames = [ filename ]
+        if self.related is not None:
+            filenames += list ( self.related ( filename ) )
+        
+        # Gets the modification time and size of each file, if it exists.
+        stamp    = []
+        for filename in filenames:
+            try:
+                stat     = os.stat ( filename )
+                stamp.append ( ( stat.st_mtime_ns, stat.st_size ) )
+            except FileNotFoundError:
+                stamp.append ( None )
+        
+        
+        # Returns the identification.
+        return tuple ( stamp )
+    
+    
+    
+    def __call__ ( self, filename, *args, **kwargs ):
+        
+        
+        # Builds the key from the arguments.
+        path     = os.path.abspath ( filename )
+        key      = ( path, args, tuple ( sorted ( kwargs.items () ) ) )
+        stamp    = self.get_stamp ( path )
+        
+        # Looks for a valid entry.
+        with self.lock:
+            entry    = self.entries.get ( key )
+            if entry is not None and entry [0] == stamp:
+                self.entries.move_to_end ( key )
+                self.hits   += 1
+                return entry [1]
+            self.misses += 1
+        
+        
+        # Calls the function (without locking, so files are read in parallel).
+        result   = self.function ( filename, *args, **kwargs )
+        
+        # Stores the result and removes the least recently used entries.
+        with self.lock:
+            self.entries [ key ] = ( stamp, result )
+            self.entries.move_to_end ( key )
+            while self.maxsize is not None and len ( self.entries ) > self.maxsize:
+                self.entries.popitem ( last = False )
+        
+        
+        # Returns the result.
+        return result
+    
+    
+    
+    # Function to get the cache statistics.
+    def cache_info ( self ):
+        
+        with self.lock:
+            return {
+                'hits':    self.hits,
+                'misses':  self.misses,
+                'size':    len ( self.entries ),
+                'maxsize': self.maxsize }
+    
+    
+    
+    # Function to remove the entries of a file (or all of them, if None).
+    def invalidate ( self, filename = None ):
+        
+        with self.lock:
+            
+            # Removes all the entries, if requested.
+            if filename is None:
+                self.entries.clear ()
+                return
+            
+            # Otherwise removes only the entries of the file.
+            path     = os.path.abspath ( filename )
+            for key in [ key for key in self.entries if key [0] == path ]:
+                del self.entries [ key ]
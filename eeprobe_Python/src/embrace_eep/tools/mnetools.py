@@ -13,6 +13,8 @@ import datetime
 import mne
 import numpy
 
+from . import profiling
+
 
 # Lists the valid MNE objects.
 mnevalid = (
@@ -23,7 +25,8 @@ mnevalid = (
 mne.set_log_level ( verbose = 'ERROR' )
 
 
-def build_raw ( info, data, montage = None ):
+# Function to build the MNE information object from the file information.
+def build_info ( info, montage = None ):
     
     
     # Lists the channels in the data.
@@ -43,7 +46,7 @@ def build_raw ( info, data, montage = None ):
     
     # Marks all the channels as EEG.
     ch_types = numpy.array ( [ 'eeg' ] * len ( ch_label ) )
-
+    
     # Sets the channel types.
     ch_types [ ind_eeg ] = 'eeg'
     ch_types [ ind_eog ] = 'eog'
@@ -62,17 +65,17 @@ def build_raw ( info, data, montage = None ):
         mneinfo.set_montage ( montage )
     
     
-    # Creates the MNE-Python raw data object.
-    mneraw   = mne.io.RawArray ( data.T, mneinfo, verbose = False )
+    # Returns the MNE information object.
+    return mneinfo
+
+
+
+# Function to add the acquisition time, impedances and events to an MNE object.
+def add_metadata ( mneraw, info ):
     
-    # Overwrites the default parameters.
-    mneraw.set_meas_date ( info [ 'acquisition_time' ] )
     
-    # Adds the calibration factor.
-    mneraw._cals = numpy.ones ( len ( ch_label ) )
-    
-    # Marks the 'active' channels.
-    mneraw._read_picks = [ numpy.arange ( len ( ch_label ) ) ]
+    # Sets the acquisition time.
+    mneraw.set_meas_date ( info [ 'acquisition_time' ] )
     
     
     # Gets the information about the impedances, if any.
@@ -81,30 +84,164 @@ def build_raw ( info, data, montage = None ):
         # Takes only the first measurement.
         if len(info['impedances']) > 0:
             impmeta    = info [ 'impedances' ] [0]
-            impedances = impmeta [ 'measurement' ]
-
+            impedances = dict ( impmeta [ 'measurement' ] )
+            
             # Fills the extra information for MNE.
             for channel, value in impedances.items ():
-
+                
                 impedances [ channel ] = {
                     'imp':           value,
                     'imp_unit':      impmeta [ 'unit' ],
                     'imp_meas_time': datetime.datetime.fromtimestamp ( impmeta [ 'time' ] ) }
-
-
+            
+            
             # Adds the impedances to the MNE object.
             mneraw.impedances = impedances
     
     
     # Gets the annotations, if any.
     annotations = mne.Annotations (
-        [ annot [ 'onset' ] for annot in info [ 'events' ] ],
-        [ annot [ 'duration' ] for annot in info [ 'events' ] ],
-        [ annot [ 'description' ] for annot in info [ 'events' ] ] )
+        info [ 'events' ] [ 'onset' ],
+        info [ 'events' ] [ 'duration' ],
+        info [ 'events' ] [ 'description' ] )
     
     # Adds the annotations to the MNE object.
     mneraw.set_annotations ( annotations )
-        
+
+
+
+# Function to build an MNE Raw object from the (samples x channels) data.
+@profiling.timed ( 'mnetools.build_raw' )
+def build_raw ( info, data, montage = None ):
+    
+    
+    # Lists the channels in the data.
+    ch_label = info [ 'channels' ] [ 'label' ]
+    
+    # Creates the MNE-Python information object.
+    mneinfo  = build_info ( info, montage )
+    
+    
+    # Creates the MNE-Python raw data object.
+    mneraw   = mne.io.RawArray ( data.T, mneinfo, verbose = False )
+    
+    # Adds the calibration factor.
+    mneraw._cals = numpy.ones ( len ( ch_label ) )
+    
+    # Marks the 'active' channels.
+    mneraw._read_picks = [ numpy.arange ( len ( ch_label ) ) ]
+    
+    
+    # Adds the acquisition time, impedances and annotations.
+    add_metadata ( mneraw, info )
+    
     
     # Returns the MNE Raw object.
     return mneraw
+
+
+
+# Function to build an MNE Epochs object from the (trials x channels x
+# samples) data of the selected channels, in volts, and the trial events.
+# The event codes follow the order of 'event_types' (by default, sorted).
+# Trials with a repeated onset keep only the first one (as MNE 'drop').
+@profiling.timed ( 'mnetools.build_epochs' )
+def build_epochs ( info, data, events, tmin, picks = None, event_types = None, montage = None ):
+    
+    
+    # Creates the MNE-Python information object, with the selected channels.
+    mneinfo  = build_info ( info, montage )
+    if picks is not None:
+        mneinfo  = mne.pick_info ( mneinfo, picks )
+    
+    # Sets the acquisition time.
+    mneinfo.set_meas_date ( info [ 'acquisition_time' ] )
+    
+    
+    # Drops the trials with a repeated onset.
+    _, keep  = numpy.unique ( events [ 'sample' ], return_index = True )
+    keep     = numpy.sort ( keep )
+    data     = data [ keep ] if len ( keep ) < len ( events ) else data
+    events   = events [ keep ]
+    
+    # Assigns a code to each event type.
+    etypes   = events [ 'type' ].astype ( str )
+    if event_types is None:
+        event_types = numpy.unique ( etypes )
+    event_id = { str ( etype ): code + 1 for code, etype in enumerate ( event_types ) if etype in etypes }
+    
+    # Builds the MNE events as (sample, previous value, code).
+    mneevents = numpy.zeros ( ( len ( events ), 3 ), dtype = 'int64' )
+    mneevents [ :, 0 ] = events [ 'sample' ]
+    mneevents [ :, 2 ] = [ event_id [ etype ] for etype in etypes ]
+    
+    
+    # Creates the MNE-Python epochs object.
+    mneepochs = mne.EpochsArray ( data, mneinfo, mneevents, tmin, event_id or None, verbose = False )
+    
+    
+    # Returns the MNE Epochs object.
+    return mneepochs
+
+
+
+# Function to build an MNE Raw object that decodes the data on demand.
+@profiling.timed ( 'mnetools.build_lazy' )
+def build_lazy ( cntfile, montage = None, nthreads = None ):
+    
+    # Creates the MNE-Python raw data object.
+    mneraw   = RawCnt ( cntfile, montage, nthreads )
+    
+    # Adds the acquisition time, impedances and annotations.
+    add_metadata ( mneraw, cntfile.info )
+    
+    # Returns the MNE Raw object.
+    return mneraw
+
+
+
+# MNE Raw class backed by an open CNT file (embrace_eep.eep.CntFile).
+# The data is not loaded: each request decodes only the raw3 epochs and
+# channels that overlap it, directly into the output, in volts, with
+# 'nthreads' decoding threads (by default, one per core).
+class RawCnt ( mne.io.BaseRaw ):
+    
+    
+    def __init__ ( self, cntfile, montage = None, nthreads = None ):
+        
+        # Creates the MNE-Python information object.
+        mneinfo  = build_info ( cntfile.info, montage )
+        
+        # Initializes the MNE object without preloading the data.
+        super ().__init__ (
+            mneinfo,
+            preload     = False,
+            last_samps  = [ cntfile.info [ 'sample_count' ] - 1 ],
+            filenames   = [ cntfile.filename ],
+            raw_extras  = [ { 'cntfile': cntfile, 'nthreads': nthreads } ],
+            orig_format = 'int',
+            verbose     = False )
+    
+    
+    
+    # Function to read a window of samples [start, stop) of the file.
+    def _read_segment_file ( self, data, idx, fi, start, stop, cals, mult ):
+        
+        
+        # Gets the open file and the number of decoding threads.
+        cntfile  = self._raw_extras [ fi ] [ 'cntfile' ]
+        nthreads = self._raw_extras [ fi ] [ 'nthreads' ]
+        
+        # Gets the requested channels.
+        picks    = numpy.arange ( cntfile.info [ 'channel_count' ] ) [ idx ]
+        
+        
+        # Without projections, decodes the data directly into the output.
+        if mult is None:
+            cntfile.get_data ( start, stop, picks, nthreads, out = data.T, units = 'V' )
+            data    *= cals
+        
+        # Otherwise decodes the channels and applies the projection.
+        else:
+            chunk    = cntfile.get_data ( start, stop, picks, nthreads, units = 'V' )
+            data [:] = mult @ chunk.T
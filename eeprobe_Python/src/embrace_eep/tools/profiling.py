@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+
+@author: Ricardo Bruña
+
+Optional instrumentation of the reader hot paths.
+
+The reader records timing spans (RIFF walk, header and sidecar parsing,
+raw3 decoding, MNE object construction) and counters (bytes read, epochs and
+samples decoded, compressed bits, allocations and bytes allocated) into the
+active profiler.
+Profiling is disabled by default, and then each instrumented function only
+checks that there is no active profiler.
+
+Use the profile () context manager to collect the spans and counters of a
+block of code, optionally passing each record to a callback as it happens:
+    
+    with profiling.profile ( callback = print ) as profiler:
+        eep.read_data ( filename )
+    profiler.summary ()
+
+"""
+
+import time
+import functools
+import threading
+import contextlib
+import collections
+
+
+# Stores the active profiler, if any.
+active   = None
+
+
+# Function to enable the profiling, with an optional callback.
+def enable ( callback = None ):
+    
+    global active
+    
+    # Creates the profiler and sets it as the active one.
+    active   = Profiler ( callback )
+    
+    # Returns the profiler.
+    return active
+
+
+
+# Function to disable the profiling.
+def disable ():
+    
+    global active
+    
+    # Removes the active profiler. The collected records are kept.
+    active   = None
+
+
+
+# Function to get the active profiler (or None, if disabled).
+def get_profiler ():
+    return active
+
+
+
+# Context manager to profile a block of code. Restores the previous
+# profiler (if any) on exit.
+@contextlib.contextmanager
+def profile ( callback = None ):
+    
+    global active
+    
+    # Activates a new profiler.
+    previous = active
+    active   = Profiler ( callback )
+    
+    # Runs the block and restores the previous profiler.
+    try:
+        yield active
+    finally:
+        active   = previous
+
+
+
+# Decorator to record each call of a function as a timing span.
+def timed ( name ):
+    
+    def decorator ( function ):
+        
+        @functools.wraps ( function )
+        def wrapper ( *args, **kwargs ):
+            
+            # If disabled, only calls the function.
+            if active is None:
+                return function ( *args, **kwargs )
+            
+            # Otherwise, times the call.
+            with active.span ( name ):
+                return function ( *args, **kwargs )
+        
+        return wrapper
+    
+    return decorator
+
+
+
+# Function to add a value to a counter of the active profiler, if any.
+def count ( name, value = 1 ):
+    
+    if active is not None:
+        active.count ( name, value )
+
+
+
+# Function to count an allocation of the given number of bytes.
+def allocated ( nbytes ):
+    
+    if active is not None:
+        active.count ( 'allocations' )
+        active.count ( 'bytes_allocated', nbytes )
+
+
+
+# Class to collect the timing spans and counters.
+class Profiler:
+    
+    
+    def __init__ ( self, callback = None ):
+        
+        # Stores the callback, called with each record.
+        self.callback = callback
+        
+        # Initializes the records.
+        self.spans    = []
+        self.counters = collections.Counter ()
+        
+        # Lock for the records, and the stack of open spans of each thread.
+        self.lock     = threading.Lock ()
+        self.local    = threading.local ()
+    
+    
+    
+    # Context manager to time a block of code. Nested spans are recorded
+    # with their path (e.g. 'read_data/decode').
+    @contextlib.contextmanager
+    def span ( self, name ):
+        
+        
+        # Adds the span to the stack of this thread.
+        if not hasattr ( self.local, 'stack' ):
+            self.local.stack = []
+        self.local.stack.append ( name )
+        path     = '/'.join ( self.local.stack )
+        
+        # Runs the block.
+        tstart   = time.perf_counter ()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter () - tstart
+            self.local.stack.pop ()
+            
+            # Stores the span.
+            record   = {
+                'type':     'span',
+                'name':     name,
+                'path':     path,
+                'start':    tstart,
+                'duration': duration,
+                'thread':   threading.get_ident () }
+            with self.lock:
+                self.spans.append ( record )
+            
+            # Passes the span to the callback.
+            if self.callback is not None:
+                self.callback ( record )
+    
+    
+    
+    # Function to add a value to a counter.
+    def count ( self, name, value = 1 ):
+        
+        # Updates the counter.
+        with self.lock:
+            self.counters [ name ] += value
+        
+        # Passes the update to the callback.
+        if self.callback is not None:
+            self.callback ( { 'type': 'count', 'name': name, 'value': value } )
+    
+    
+    
+    # Function to summarize the records: for each span the number of calls
+    # and the total and longest time, in seconds, and the counters.
+    def summary ( self ):
+        
+        
+        # Aggregates the spans by path.
+        spans    = {}
+        with self.lock:
+            for record in self.spans:
+                entry    = spans.setdefault ( record [ 'path' ], { 'calls': 0, 'total': 0.0, 'max': 0.0 } )
+                entry [ 'calls' ] += 1
+                entry [ 'total' ] += record [ 'duration' ]
+                entry [ 'max' ]    = max ( entry [ 'max' ], record [ 'duration' ] )
+            counters = dict ( self.counters )
+        
+        # Adds the compression ratio of the decoded epochs, if any. Both
+        # counters refer to whole epochs, with all the channels.
+        if counters.get ( 'raw3.epoch_samples' ):
+            counters [ 'raw3.bits_per_sample' ] = counters.get ( 'raw3.epoch_bits', 0 ) / counters [ 'raw3.epoch_samples' ]
+        
+        
+        # Returns the summary.
+        return { 'spans': spans, 'counters': counters }
@@ -7,8 +7,19 @@
 
 import numpy
 
+from . import profiling
+
 # Function to read RIFF and RF64 files.
-def read_file ( filename ):
+@profiling.timed ( 'riff.read_file' )
+def read_file ( filename, lazy = False, index = False ):
+    
+    # If lazy, the chunk payloads are not read. Instead, the 'data' field of
+    # each leaf chunk is a (zero-copy) view over a memory map of the file, so
+    # only the pages actually accessed are ever loaded from disk.
+    
+    # If index, the chunk payloads are neither read nor mapped: the 'data'
+    # field of each leaf chunk is None. The tree holds no reference to the
+    # file, and can be mapped later (see map_file).
     
     
     # Opens the file to read.
@@ -21,7 +32,7 @@ def read_file ( filename ):
         
         # Reads the magic number.
         mnum = numpy.fromfile ( fid, ( bytes, 4 ), 1 ) [0].decode ()
-            
+        
         # Defines the length of the pointer (chunk size marker).
         if mnum == 'RIFF':
             plen = 4
@@ -39,11 +50,23 @@ def read_file ( filename ):
             raise EOFError ( 'Data is incomplete or extends beyond the end of the file.' )
         
         
+        # Maps the file in memory, if requested.
+        if index:
+            fmap = None
+        elif lazy:
+            fmap = numpy.memmap ( fid, 'uint8', mode = 'r' )
+        else:
+            fmap = None
+            profiling.count ( 'riff.bytes_read', flen )
+        
+        profiling.count ( 'riff.files' )
+        
+        
         # Restarts the file cursor.
         fid.seek ( 0, 0 )
         
         # Reads the RIFF tree from the file.
-        tree = read_tree ( fid, plen )
+        tree = read_tree ( fid, plen, fmap, index )
         
         # Returns the tree.
         return tree
@@ -51,7 +74,7 @@ def read_file ( filename ):
 
 
 # Function to read a RIFF tree.
-def read_tree ( fid, plen ):
+def read_tree ( fid, plen, fmap = None, index = False ):
     
     
     # Reads the label and length for the current chunk.
@@ -82,7 +105,27 @@ def read_tree ( fid, plen ):
                 break
             
             # Reads the next child.
-            chil = chil + [ read_tree ( fid, plen ) ]
+            chil = chil + [ read_tree ( fid, plen, fmap, index ) ]
+    
+    elif index:
+        
+        # Skips the data and the padding, if required.
+        data = None
+        fid.seek ( int ( clen + clen % 2 ), 1 )
+        
+        # Initializes the children structure.
+        chil = []
+    
+    elif fmap is not None:
+        
+        # Gets a view of the data from the memory map.
+        data = fmap [ dpos: dpos + clen ]
+        
+        # Skips the data and the padding, if required.
+        fid.seek ( int ( clen + clen % 2 ), 1 )
+        
+        # Initializes the children structure.
+        chil = []
     
     elif len ( fid.peek (1) ) > 0:
         
@@ -109,9 +152,41 @@ def read_tree ( fid, plen ):
 
 
 
+# Function to map in memory a RIFF tree read with index = True. Returns a
+# copy of the tree where the 'data' field of each leaf chunk is a view over
+# a new memory map of the file, released with the copy.
+def map_file ( filename, tree ):
+    
+    # Maps the file in memory.
+    fmap = numpy.memmap ( filename, 'uint8', mode = 'r' )
+    
+    # Maps the tree.
+    return map_tree ( tree, fmap )
+
+
+
+# Function to map a RIFF tree over a memory map of its file.
+def map_tree ( tree, fmap ):
+    
+    
+    # Copies the chunk definition.
+    tree = dict ( tree )
+    
+    # Maps the children, for lists, or the chunk data otherwise.
+    if tree [ 'children' ]:
+        tree [ 'children' ] = [ map_tree ( child, fmap ) for child in tree [ 'children' ] ]
+    elif tree [ 'data' ] is None:
+        tree [ 'data' ] = fmap [ tree [ 'datapos' ]: tree [ 'datapos' ] + tree [ 'length' ] ]
+    
+    
+    # Returns the mapped tree.
+    return tree
+
+
+
 # Function to get a branch of the RIFF tree.
 def get_subtree ( tree, blabs = None ):
-
+    
     if (blabs is None):
         blabs = []
     
@@ -145,4 +220,60 @@ def get_subtree ( tree, blabs = None ):
     tree  = get_subtree ( tree, blabs [ 1: ] )
     
     # Returns the requested subtree.
-    return tree
\ No newline at end of file
+    return tree
+
+
+# Function to start a chunk (or a list, if a form type is provided) in a
+# RIFF file. The size is written when the chunk is finished (see end_chunk),
+# so the payload can be written in pieces. Returns the chunk position.
+def start_chunk ( fid, label, plen, form = None ):
+    
+    
+    # Gets the position of the chunk.
+    cpos = fid.tell ()
+    
+    # Writes the label and a placeholder for the size.
+    fid.write ( label.encode ().ljust ( 4 ) )
+    fid.write ( bytes ( plen ) )
+    
+    # Writes the form type, for lists.
+    if form is not None:
+        fid.write ( form.encode ().ljust ( 4 ) )
+    
+    
+    # Returns the position of the chunk.
+    return cpos
+
+
+
+# Function to finish a chunk started with start_chunk.
+def end_chunk ( fid, cpos, plen ):
+    
+    
+    # Gets the length of the payload.
+    epos = fid.tell ()
+    clen = epos - cpos - 4 - plen
+    
+    if clen >= 2 ** ( 8 * plen ):
+        raise ValueError ( 'Chunk too long for a RIFF file (use RF64).' )
+    
+    # Pads the chunk to an even length.
+    if clen % 2:
+        fid.write ( b'\0' )
+        epos = epos + 1
+    
+    
+    # Writes the size and moves back to the end of the chunk.
+    fid.seek ( cpos + 4, 0 )
+    fid.write ( clen.to_bytes ( plen, 'little' ) )
+    fid.seek ( epos, 0 )
+
+
+
+# Function to write a whole chunk.
+def write_chunk ( fid, label, data, plen ):
+    
+    # Writes the chunk and its payload.
+    cpos = start_chunk ( fid, label, plen )
+    fid.write ( data )
+    end_chunk ( fid, cpos, plen )
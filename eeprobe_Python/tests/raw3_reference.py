@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+
+Reference raw3 decoder for the tests.
+
+Pure Python port of the original (bit by bit) decoder in raweep.h: each
+channel is read as its first sample and residuals, and the residuals are
+then accumulated according to the compression method. It is slow, but
+independent of the streaming decoder, so both can be compared bit by bit.
+
+"""
+
+import numpy
+
+
+# Function to read an unsigned field of 'length' bits at bit 'offset'.
+def read_uint ( byte, offset, length ):
+
+    # Gets the bytes covering the field, padding with zeros at the end.
+    first    = offset // 8
+    last     = ( offset + length + 7 ) // 8
+    chunk    = bytes ( byte [ first: last ] ).ljust ( last - first, b'\x00' )
+
+    # Gets the field.
+    value    = int.from_bytes ( chunk, 'big' )
+    value  >>= 8 * ( last - first ) - length - offset % 8
+    return value & ( ( 1 << length ) - 1 )
+
+
+
+# Function to read a signed (two's complement) field.
+def read_int ( byte, offset, length ):
+
+    if length == 0:
+        return 0
+
+    value    = read_uint ( byte, offset, length )
+    return value - ( 1 << length ) if value >> ( length - 1 ) else value
+
+
+
+# Function to wrap a value around as int32.
+def wrap ( value ):
+    return ( value + 2 ** 31 ) % 2 ** 32 - 2 ** 31
+
+
+
+# Function to decode a block of (channels x samples) data starting at bit
+# 'offset'. Returns the data and the offset of the next block, in bits.
+def read_block ( byte, nsamp, nchan, offset = 0 ):
+
+
+    # Goes through each channel.
+    data     = numpy.zeros ( ( nchan, nsamp ), dtype = 'int64' )
+    for cindex in range ( nchan ):
+
+        # Reads the compression method.
+        method   = read_uint ( byte, offset, 4 )
+        offset  += 4
+        if method & 7 > 3:
+            raise ValueError ( 'Unknown compression method %i.' % method )
+
+        # Gets the length of the data and metadata.
+        mbit     = 6 if method & 8 else 4
+        dbit     = 32 if method & 8 else 16
+
+        # Gets the length of the residuals.
+        if method & 7 == 0:
+            nbit     = dbit
+            xbit     = 0
+            offset  += 4
+        else:
+            nbit     = read_uint ( byte, offset, mbit )
+            xbit     = read_uint ( byte, offset + mbit, mbit )
+            offset  += 2 * mbit
+
+            # If xbit is equal to nbit there are no extended residuals.
+            if xbit == nbit:
+                xbit     = 0
+
+
+        # Reads the first sample and the residuals.
+        values   = [ read_int ( byte, offset, dbit ) ]
+        offset  += dbit
+        for _ in range ( nsamp - 1 ):
+            datum    = read_int ( byte, offset, nbit )
+            offset  += nbit
+
+            # Reads the extended residual after the escape value.
+            if xbit and nbit and datum == - 2 ** ( nbit - 1 ):
+                datum    = read_int ( byte, offset, xbit )
+                offset  += xbit
+            values.append ( datum )
+
+        # Each channel ends at a byte boundary.
+        offset   = 8 * ( ( offset + 7 ) // 8 )
+
+
+        # Accumulates the residuals.
+        row      = data [ cindex ]
+        row [:]  = values
+        for index in range ( 1, nsamp ):
+            if method & 7 == 1:
+                row [ index ] = wrap ( row [ index ] + row [ index - 1 ] )
+            elif method & 7 == 2:
+                slope    = row [ index - 1 ] - row [ index - 2 ] if index > 1 else 0
+                row [ index ] = wrap ( row [ index ] + row [ index - 1 ] + slope )
+            elif method & 7 == 3:
+                prev     = data [ cindex - 1 ]
+                row [ index ] = wrap ( row [ index ] + row [ index - 1 ] + prev [ index ] - prev [ index - 1 ] )
+
+
+    # Returns the data and the next offset.
+    return data.astype ( 'int32' ), offset
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the on-disk cache of decoded files.
+
+"""
+
+import os
+import time
+
+import numpy
+import pandas
+import pytest
+
+import synthetic
+from embrace_eep import eep
+from embrace_eep.tools import cache
+
+
+# Enables the cache in a temporary directory for each test.
+@pytest.fixture
+def store ( tmp_path ):
+
+    eep.clear_memo ()
+    yield cache.enable ( str ( tmp_path / 'cache' ) )
+    cache.disable ()
+
+
+
+# Function to write a synthetic file, returning its name and its data.
+def make_file ( tmp_path, name = 'rec.cnt', **kwargs ):
+
+    filename = str ( tmp_path / name )
+    data     = synthetic.make_cnt ( filename, **kwargs )
+    return filename, data
+
+
+
+# Function to list the files in the cache directory.
+def list_files ( store ):
+    return sorted ( os.path.splitext ( filename ) [1] for filename in os.listdir ( store.directory ) )
+
+
+
+# The entries are a read-only memory map and JSON information.
+def test_entry ( tmp_path, store ):
+
+    filename, expect = make_file ( tmp_path, nchan = 4, duration = 20, nsegment = 2, event_rate = 2 )
+    info     = eep.read_info ( filename )
+
+    # The first read decodes and stores the file, the second one uses the cache.
+    numpy.testing.assert_array_equal ( eep.read_data ( filename, raw_int32 = True ) [0], expect )
+    assert list_files ( store ) == [ '.json', '.npy' ]
+    cntfile  = eep.open_cnt ( filename )
+    assert isinstance ( cntfile.cached, numpy.memmap ) and not cntfile.cached.flags.writeable
+    numpy.testing.assert_array_equal ( cntfile.get_data ( 10, 20, [ 3, 0 ], raw_int32 = True ) [0], expect [ 10: 20, [ 3, 0 ] ] )
+
+    # The stored information is the same.
+    cached   = store.load ( cntfile.get_cache_key ( store ) ) [1]
+    assert set ( cached ) == set ( info )
+    for name in ( 'channels', 'segments' ):
+        assert cached [ name ].equals ( info [ name ] )
+    assert cached [ 'events' ].dtype.names == info [ 'events' ].dtype.names
+    for field in info [ 'events' ].dtype.names:
+        assert list ( cached [ 'events' ] [ field ] ) == list ( info [ 'events' ] [ field ] )
+
+
+
+# Any change of the file, its size or its time stamp, stores a new entry.
+def test_invalidation ( tmp_path, store ):
+
+    filename, expect = make_file ( tmp_path, nchan = 4, duration = 10, seed = 1 )
+    info     = eep.read_info ( filename )
+    eep.read_data ( filename )
+    assert len ( store.list_entries () ) == 1
+
+    # Touches the file.
+    stat     = os.stat ( filename )
+    os.utime ( filename, ns = ( stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9 ) )
+    numpy.testing.assert_array_equal ( eep.read_data ( filename, raw_int32 = True ) [0], expect )
+    assert len ( store.list_entries () ) == 2
+
+    # Overwrites the file with other data, keeping its time stamp.
+    stat     = os.stat ( filename )
+    eep.write_cnt ( filename, expect [ ::-1 ], info, rf64 = True )
+    os.utime ( filename, ns = ( stat.st_atime_ns, stat.st_mtime_ns ) )
+    numpy.testing.assert_array_equal ( eep.read_data ( filename, raw_int32 = True ) [0], expect [ ::-1 ] )
+    assert len ( store.list_entries () ) == 3
+
+    # Changes the size (trailing bytes, ignored by the reader).
+    with open ( filename, 'ab' ) as fid:
+        fid.write ( bytes ( 4 ) )
+    numpy.testing.assert_array_equal ( eep.read_data ( filename, raw_int32 = True ) [0], expect [ ::-1 ] )
+    assert len ( store.list_entries () ) == 4
+
+
+
+# Above the size cap, the least recently used entries are removed.
+def test_eviction ( tmp_path, store ):
+
+    # Writes three files of about 80 kB each.
+    files    = [ make_file ( tmp_path, 'rec%i.cnt' % index, nchan = 4, duration = 10, seed = index ) for index in range ( 3 ) ]
+    keys     = []
+    for filename, expect in files [ :2 ]:
+        numpy.testing.assert_array_equal ( eep.read_data ( filename, raw_int32 = True ) [0], expect )
+        keys.append ( eep.open_cnt ( filename ).get_cache_key ( store ) )
+        time.sleep ( 0.05 )
+    size     = max ( entry [1] for entry in store.list_entries () )
+
+    # Uses the first file again, and adds the third one with room for two.
+    store.max_size = 2 * size + size // 2
+    eep.clear_memo ()
+    numpy.testing.assert_array_equal ( eep.read_data ( files [0] [0], raw_int32 = True ) [0], files [0] [1] )
+    time.sleep ( 0.05 )
+    numpy.testing.assert_array_equal ( eep.read_data ( files [2] [0], raw_int32 = True ) [0], files [2] [1] )
+    keys.append ( eep.open_cnt ( files [2] [0] ).get_cache_key ( store ) )
+
+    # The second file, the least recently used, is removed.
+    assert sorted ( key for _, _, key in store.list_entries () ) == sorted ( [ keys [0], keys [2] ] )
+    assert sum ( entry [1] for entry in store.list_entries () ) <= store.max_size
+
+    # A file larger than the cap is not stored.
+    store.max_size = size // 2
+    eep.clear_memo ()
+    numpy.testing.assert_array_equal ( eep.read_data ( files [1] [0], raw_int32 = True ) [0], files [1] [1] )
+    assert keys [1] not in [ key for _, _, key in store.list_entries () ]
+
+
+
+# The information is stored as JSON, without pickles.
+def test_json ():
+
+    value    = {
+        'table':   pandas.DataFrame ( { 'a': [ 1, 2 ], 'b': [ 'x', None ] } ),
+        'records': numpy.rec.fromarrays ( [ numpy.array ( [ 'T1', 'T2' ], dtype = object ), numpy.array ( [ 1.5, 2.5 ] ) ], names = ( 'type', 'onset' ) ),
+        'array':   numpy.arange ( 6, dtype = 'float32' ).reshape ( 2, 3 ),
+        'items':   [ { 'unit': 'kOhm', 'measurement': { 'Cz': numpy.float32 ( 5 ) } } ],
+        'scalar':  numpy.int64 ( 3 ) }
+    copy     = cache.json.loads ( cache.json.dumps ( cache.encode_value ( value ) ), object_hook = cache.decode_value )
+
+    assert copy [ 'table' ].equals ( value [ 'table' ] )
+    assert list ( copy [ 'records' ].type ) == [ 'T1', 'T2' ] and list ( copy [ 'records' ].onset ) == [ 1.5, 2.5 ]
+    assert copy [ 'array' ].dtype == numpy.float32 and numpy.array_equal ( copy [ 'array' ], value [ 'array' ] )
+    assert copy [ 'items' ] == [ { 'unit': 'kOhm', 'measurement': { 'Cz': 5.0 } } ] and copy [ 'scalar' ] == 3
+
+    with pytest.raises ( ValueError ):
+        cache.encode_value ( { 'object': object () } )
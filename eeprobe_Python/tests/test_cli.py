@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the conversion command.
+
+"""
+
+import os
+
+import mne
+import numpy
+
+import synthetic
+from embrace_eep import cli
+from embrace_eep import eep
+
+
+# The NumPy output has the calibrated data, in volts.
+def test_convert_npy ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 8, duration = 10 )
+
+    assert cli.main ( [ 'convert', filename, '-f', 'npy', '-j', '1', '-q' ] ) == 0
+    data     = numpy.load ( str ( tmp_path / 'rec.npy' ) )
+    numpy.testing.assert_allclose ( data, eep.read_data ( filename, units = 'V' ), rtol = 1e-6 )
+    assert sorted ( os.listdir ( tmp_path ) ) == [ 'rec.cnt', 'rec.evt', 'rec.npy', 'rec.seg' ]
+
+
+
+# The FIF output is decoded with one thread per worker.
+def test_convert_fif_single_thread ( tmp_path, monkeypatch ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 8, duration = 10 )
+
+    # Records the number of threads of each decoding call.
+    calls    = []
+    get_data = eep.CntFile.get_data
+    def spy ( self, *args, **kwargs ):
+        calls.append ( args [3] if len ( args ) > 3 else kwargs.get ( 'nthreads' ) )
+        return get_data ( self, *args, **kwargs )
+    monkeypatch.setattr ( eep.CntFile, 'get_data', spy )
+
+    cli.convert_file ( filename, str ( tmp_path / 'rec_raw.fif' ), 'fif', chunk = 2.0 )
+    assert calls and all ( nthreads == 1 for nthreads in calls )
+
+    mneraw   = mne.io.read_raw_fif ( str ( tmp_path / 'rec_raw.fif' ), preload = True )
+    numpy.testing.assert_allclose ( mneraw.get_data ().T, eep.read_data ( filename, units = 'V' ), rtol = 1e-6 )
+
+
+
+# Split FIF outputs keep the names of all the parts.
+def test_convert_fif_split ( tmp_path, monkeypatch ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 64, duration = 120, methods = ( 1, ) )
+
+    # Splits the output in parts of 12 MB (the minimum is 10 MB).
+    save     = mne.io.BaseRaw.save
+    monkeypatch.setattr ( mne.io.BaseRaw, 'save', lambda self, fname, **kwargs: save ( self, fname, split_size = '12MB', **kwargs ) )
+
+    cli.convert_file ( filename, str ( tmp_path / 'rec_raw.fif' ), 'fif', dtype = 'float64', chunk = 10.0 )
+    names    = sorted ( os.listdir ( tmp_path ) )
+    assert 'rec_raw-1.fif' in names
+    assert not [ name for name in names if 'tmp' in name or name.startswith ( '.convert' ) ]
+
+    mneraw   = mne.io.read_raw_fif ( str ( tmp_path / 'rec_raw.fif' ), preload = True )
+    numpy.testing.assert_allclose ( mneraw.get_data ().T, eep.read_data ( filename, units = 'V' ) )
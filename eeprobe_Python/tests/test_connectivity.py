@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the phase synchronization.
+
+"""
+
+import concurrent.futures
+
+import numpy
+import pytest
+
+from embrace_eep import connectivity
+
+
+# Function to compute the metrics of a (samples x channels) analytic signal
+# pair by pair, from their definitions.
+def get_direct ( signal ):
+
+    nchan    = signal.shape [1]
+    plv      = numpy.zeros ( ( nchan, nchan ) )
+    ciplv    = numpy.zeros ( ( nchan, nchan ) )
+    wpli     = numpy.zeros ( ( nchan, nchan ) )
+    phase    = numpy.angle ( signal )
+    for i in range ( nchan ):
+        for j in range ( nchan ):
+            if i == j:
+                plv [ i, j ] = 1
+                continue
+            cplv     = numpy.mean ( numpy.exp ( 1j * ( phase [ :, i ] - phase [ :, j ] ) ) )
+            cross    = ( signal [ :, i ] * signal [ :, j ].conj () ).imag
+            plv [ i, j ] = abs ( cplv )
+            ciplv [ i, j ] = abs ( cplv.imag ) / numpy.sqrt ( 1 - cplv.real ** 2 )
+            wpli [ i, j ] = abs ( cross.sum () ) / numpy.abs ( cross ).sum ()
+    return { 'plv': plv, 'ciplv': ciplv, 'wpli': wpli }
+
+
+
+# The accumulated metrics match their definitions, in any window split.
+def test_metrics ():
+
+    # Builds signals with a common component with several lags.
+    rng      = numpy.random.default_rng ( 4 )
+    common   = numpy.exp ( 1j * numpy.cumsum ( rng.normal ( 0, 0.3, 3000 ) ) )
+    signal   = numpy.stack ( [ common * numpy.exp ( 1j * lag ) for lag in ( 0, 0.3, 1.2, 2.5 ) ], axis = 1 )
+    signal   = signal + 0.8 * ( rng.standard_normal ( signal.shape ) + 1j * rng.standard_normal ( signal.shape ) )
+    expect   = get_direct ( signal )
+
+    # Accumulates two bands (the second one scaled) in windows.
+    bands    = numpy.stack ( [ signal, 5 * signal ] )
+    result   = connectivity.compute_sync ( bands [ :, first: first + 700 ] for first in range ( 0, 3000, 700 ) )
+    for metric, value in result.items ():
+        assert value.shape == ( 2, 4, 4 )
+        numpy.testing.assert_allclose ( value [0], expect [ metric ], atol = 1e-12 )
+        numpy.testing.assert_allclose ( value [1], expect [ metric ], atol = 1e-12 )
+
+
+
+# Several recordings are concatenated along the channels.
+def test_recordings ():
+
+    rng      = numpy.random.default_rng ( 5 )
+    signal   = rng.standard_normal ( ( 1000, 5 ) ) + 1j * rng.standard_normal ( ( 1000, 5 ) )
+
+    result   = connectivity.compute_sync ( ( [ signal [ first: first + 300, :2 ], signal [ first: first + 300, 2: ] ] for first in range ( 0, 1000, 300 ) ), metrics = [ 'wpli' ] )
+    assert list ( result ) == [ 'wpli' ]
+    numpy.testing.assert_allclose ( result [ 'wpli' ] [0], get_direct ( signal ) [ 'wpli' ], atol = 1e-12 )
+
+    # Invalid inputs.
+    with pytest.raises ( ValueError ):
+        connectivity.compute_sync ( [ signal.real ] )
+    with pytest.raises ( ValueError ):
+        connectivity.PhaseSync ( 4, metrics = [ 'coh' ] )
+    with pytest.raises ( ValueError ):
+        connectivity.compute_sync ( [] )
+
+
+
+# The wPLI is computed in blocks of channels, and the bands share one pool of threads.
+def test_blocks_and_pool ():
+
+    # Uses blocks of three channels (the last one shorter), and of one
+    # channel with many samples.
+    rng      = numpy.random.default_rng ( 6 )
+    signal   = rng.standard_normal ( ( 5000, 40 ) ) + 1j * rng.standard_normal ( ( 5000, 40 ) )
+    sync     = connectivity.PhaseSync ( 40, metrics = [ 'wpli' ] )
+    sync.update ( signal )
+    numpy.testing.assert_allclose ( sync.get ( 'wpli' ) [0], get_direct ( signal ) [ 'wpli' ], atol = 1e-12 )
+
+    signal   = rng.standard_normal ( ( 200000, 12 ) ) + 1j * rng.standard_normal ( ( 200000, 12 ) )
+    expect   = get_direct ( signal [ :2000 ] ) [ 'wpli' ]
+    sync     = connectivity.PhaseSync ( 12, metrics = [ 'wpli' ] )
+    sync.update ( signal )
+    numpy.testing.assert_allclose ( sync.get ( 'wpli' ) [0], get_direct ( signal ) [ 'wpli' ], atol = 1e-12 )
+
+    # The accumulator creates its pool once, and releases it on close.
+    sync     = connectivity.PhaseSync ( 12, nband = 2, metrics = [ 'wpli' ], nthreads = 2 )
+    sync.update ( numpy.stack ( [ signal [ :1000 ], signal [ :1000 ] ] ) )
+    pool     = sync.pool
+    sync.update ( numpy.stack ( [ signal [ 1000: 2000 ], signal [ 1000: 2000 ] ] ) )
+    assert pool is not None and sync.pool is pool
+    sync.close ()
+    assert sync.pool is None
+    numpy.testing.assert_allclose ( sync.get ( 'wpli' ) [1], expect, atol = 1e-12 )
+
+    # A pool provided is used, and not released.
+    with concurrent.futures.ThreadPoolExecutor ( max_workers = 2 ) as pool:
+        sync     = connectivity.PhaseSync ( 12, nband = 2, metrics = [ 'wpli' ], nthreads = 2, pool = pool )
+        sync.update ( numpy.stack ( [ signal [ :2000 ], signal [ :2000 ] ] ) )
+        sync.close ()
+        assert sync.pool is pool
+        assert pool.submit ( int, 1 ).result () == 1
+    numpy.testing.assert_allclose ( sync.get ( 'wpli' ) [0], expect, atol = 1e-12 )
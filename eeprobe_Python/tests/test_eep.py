@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the reader: decoding, lazy MNE objects, epochs and groups.
+
+"""
+
+import numpy
+import pytest
+
+import raw3_reference
+import synthetic
+from embrace_eep import eep
+
+
+# Function to write a synthetic file, returning its name and its data.
+def make_file ( tmp_path, name = 'rec.cnt', **kwargs ):
+
+    filename = str ( tmp_path / name )
+    data     = synthetic.make_cnt ( filename, **kwargs )
+    return filename, data
+
+
+
+# The files decode as written, and as with the reference decoder.
+@pytest.mark.parametrize ( 'rf64', [ False, True ] )
+def test_decode_file ( tmp_path, rf64 ):
+
+    filename, expect = make_file ( tmp_path, nchan = 6, duration = 10.5, rf64 = rf64 )
+    data, scale = eep.read_data ( filename, raw_int32 = True )
+    numpy.testing.assert_array_equal ( data, expect )
+    numpy.testing.assert_allclose ( eep.read_data ( filename ), expect * scale )
+
+    # Decodes each epoch with the reference decoder.
+    rawdata  = eep.open_cnt ( filename ).rawdata
+    stream   = bytes ( rawdata [ 'data' ] ) + bytes ( 8 )
+    sepoch   = rawdata [ 'epoch_length' ]
+    for eindex, start in enumerate ( rawdata [ 'epoch_start' ] ):
+        block    = expect [ eindex * sepoch: ( eindex + 1 ) * sepoch ]
+        decoded, _ = raw3_reference.read_block ( stream, len ( block ), 6, 8 * start )
+        numpy.testing.assert_array_equal ( decoded, block.T )
+
+
+
+# Windows and channels decode as the same part of the whole file.
+def test_window_and_picks ( tmp_path ):
+
+    filename, expect = make_file ( tmp_path, nchan = 8, duration = 10 )
+    cntfile  = eep.open_cnt ( filename )
+
+    # Windows across several epochs, inside an epoch and empty.
+    for start, stop in ( ( 0, 5000 ), ( 499, 2501 ), ( 1200, 1300 ), ( 4999, 5000 ), ( 300, 300 ) ):
+        data, _  = cntfile.get_data ( start, stop, [ 6, 1, 3 ], 2, raw_int32 = True )
+        numpy.testing.assert_array_equal ( data, expect [ start: stop, [ 6, 1, 3 ] ] )
+
+    # Channels by label.
+    labels   = list ( cntfile.info [ 'channels' ] [ 'label' ] [ [ 2, 5 ] ] )
+    numpy.testing.assert_array_equal ( cntfile.get_data ( 100, 200, labels, raw_int32 = True ) [0], expect [ 100: 200, [ 2, 5 ] ] )
+
+    # Overlapping chunks.
+    chunks   = list ( cntfile.iter_chunks ( 700, 100, 50, 4000 ) )
+    assert [ onset for onset, _ in chunks ] == list ( range ( 50, 4000 - 100, 600 ) )
+    for onset, data in chunks:
+        numpy.testing.assert_allclose ( data, eep.read_data ( filename, start = onset, stop = min ( onset + 700, 4000 ) ) )
+
+    with pytest.raises ( ValueError ):
+        cntfile.get_data ( 0, 5001 )
+
+
+
+# The lazy MNE object decodes the data on demand, also cropped and picked.
+def test_lazy_mne ( tmp_path ):
+
+    filename, _ = make_file ( tmp_path, nchan = 8, duration = 20, event_rate = 1 )
+    expect   = eep.read_data ( filename, units = 'V' )
+
+    mneraw   = eep.read_mne ( filename, preload = False, nthreads = 1 )
+    assert not mneraw.preload
+    numpy.testing.assert_allclose ( mneraw.get_data ( start = 1234, stop = 3456 ).T, expect [ 1234: 3456 ] )
+
+    # Crops and picks the channels.
+    labels   = list ( mneraw.ch_names [ 2: 5 ] )
+    cropped  = mneraw.copy ().crop ( 2.0, 8.0 ).pick ( labels )
+    numpy.testing.assert_allclose ( cropped.get_data ().T, expect [ 1000: 4001, 2: 5 ] )
+
+    # Loads the data.
+    numpy.testing.assert_allclose ( cropped.load_data ().get_data ().T, expect [ 1000: 4001, 2: 5 ] )
+    numpy.testing.assert_allclose ( eep.read_mne ( filename ).get_data (), expect.T )
+
+
+
+# The epochs are the windows of the events in the continuous data.
+def test_read_epochs ( tmp_path ):
+
+    filename, _ = make_file ( tmp_path, nchan = 4, duration = 30, nsegment = 2, event_rate = 2 )
+    expect   = eep.read_data ( filename, units = 'uV' )
+
+    data, events = eep.read_epochs ( filename, [ 'T1', 'T2' ], -0.1, 0.3, units = 'uV', return_numpy = True )
+    assert len ( events ) > 0 and set ( events [ 'type' ] ) <= { 'T1', 'T2' }
+    assert data.shape == ( len ( events ), 4, 201 )
+    for trial, onset in zip ( data, events [ 'sample' ] ):
+        numpy.testing.assert_allclose ( trial, expect [ onset - 50: onset + 151 ].T )
+
+    # No trial crosses the segment onset.
+    bound    = eep.read_info ( filename ) [ 'segments' ].start_sample [1]
+    assert not numpy.any ( ( events [ 'sample' ] - 50 < bound ) & ( events [ 'sample' ] + 151 > bound ) )
+
+    # The MNE object has the same data, in volts.
+    epochs   = eep.read_epochs ( filename, [ 'T1', 'T2' ], -0.1, 0.3 )
+    assert sorted ( epochs.event_id ) == [ 'T1', 'T2' ]
+    numpy.testing.assert_allclose ( epochs.get_data (), data * 1e-6 )
+
+
+
+# The recordings of a group are aligned by acquisition time or by an event.
+@pytest.mark.parametrize ( 'event', [ None, 'T1' ] )
+def test_read_group ( tmp_path, event ):
+
+    first, _ = make_file ( tmp_path, 'first.cnt', nchan = 4, duration = 30, event_rate = 1 )
+    info     = eep.read_info ( first )
+    data, _  = eep.read_data ( first, raw_int32 = True )
+
+    # Writes the second recording starting 1234 samples later. Aligning by
+    # event, the clock of the second recording is one second ahead.
+    shift    = 1234
+    offset   = shift / 500 + ( 1 if event else 0 )
+    events   = info [ 'events' ] [ info [ 'events' ] [ 'sample' ] >= shift ].copy ()
+    events [ 'sample' ] -= shift
+    events [ 'onset' ] -= shift / 500
+    events [ 'timestamp' ] += offset - shift / 500
+    second   = str ( tmp_path / 'second.cnt' )
+    eep.write_cnt ( second, data [ shift: ], dict ( info, events = events, acquisition_time = info [ 'acquisition_time' ] + offset ) )
+    onsets   = eep.get_onsets ( info, 'T1' )
+    numpy.testing.assert_array_equal ( eep.get_onsets ( eep.read_info ( second ), 'T1' ), onsets [ onsets >= shift ] - shift )
+
+    group    = eep.read_group ( [ first, second ], event )
+    assert list ( group.shifts ) == [ shift, 0 ] and group.sample_count == len ( data ) - shift
+
+    # Both recordings decode the same data.
+    chunks   = group.get_data ( 100, 900 )
+    numpy.testing.assert_array_equal ( chunks [0], chunks [1] )
+    for onset, ( data1, data2 ) in group.iter_chunks ( 1000, 0, 0, 5000 ):
+        numpy.testing.assert_array_equal ( data1, data2 )
+
+
+
+
+# The pauses of a recording are aligned by the onset in time of its segments.
+@pytest.mark.parametrize ( 'event', [ None, 'T1' ] )
+def test_read_group_segments ( tmp_path, event ):
+
+    # The first recording has two segments of ten seconds, with a pause of ten seconds.
+    first, _ = make_file ( tmp_path, 'first.cnt', nchan = 4, duration = 20, nsegment = 2, event_rate = 1 )
+    info     = eep.read_info ( first )
+    data, _  = eep.read_data ( first, raw_int32 = True )
+    assert numpy.diff ( info [ 'segments' ].start_time ) [0] == 20
+
+    # Writes a continuous second recording, with other data during the pause.
+    # Aligning by event, the clock of the second recording is one second ahead.
+    offset   = 1 if event else 0
+    filler   = numpy.full ( ( 5000, 4 ), 1000, dtype = 'int32' )
+    events   = info [ 'events' ] [ info [ 'events' ] [ 'description' ] != 'New segment' ].copy ()
+    events [ 'sample' ] += 5000 * ( events [ 'sample' ] >= 5000 )
+    events [ 'onset' ] = events [ 'sample' ] / 500
+    events [ 'timestamp' ] += offset
+    second   = str ( tmp_path / 'second.cnt' )
+    eep.write_cnt ( second, numpy.concatenate ( ( data [ :5000 ], filler, data [ 5000: ] ) ), dict (
+        info, events = events, segments = info [ 'segments' ].iloc [ :1 ].assign ( sample_count = 15000 ),
+        acquisition_time = info [ 'acquisition_time' ] + offset ) )
+
+    # The timeline skips the pause of the first recording.
+    group    = eep.read_group ( [ first, second ], event )
+    assert group.sample_count == 10000 and list ( group.shifts ) == [ 0, 0 ]
+    assert group.start_time == info [ 'acquisition_time' ]
+    numpy.testing.assert_array_equal ( group.starts, [ [ 0, 0 ], [ 5000, 10000 ] ] )
+
+    # Both recordings decode the same data, also across the pause.
+    chunks   = group.get_data ( 4000, 6000 )
+    numpy.testing.assert_array_equal ( chunks [0], chunks [1] )
+    numpy.testing.assert_array_equal ( chunks [0], eep.read_data ( first, start = 4000, stop = 6000 ) )
+    onsets   = []
+    for onset, ( data1, data2 ) in group.iter_chunks ( 3000, 0 ):
+        numpy.testing.assert_array_equal ( data1, data2 )
+        onsets.append ( onset )
+    assert onsets == [ 0, 3000, 5000, 8000 ]
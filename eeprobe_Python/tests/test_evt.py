@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the parser of the sidecar event files.
+
+"""
+
+import struct
+
+import numpy
+import pytest
+
+import eep_reference
+import synthetic
+from embrace_eep import eep
+
+
+# Lists the classes of events.
+classes  = [ 'class dcEventMarker_c', 'class dcEpochEvent_c', 'class dcArtefactEvent_c', 'class dcSpikeEvent_c', 'class dcSeizureEvent_c', 'class dcSleepEvent_c', 'class dcRPeakEvent_c' ]
+
+
+# Function to write an event file, returning its name.
+def write_evt ( tmp_path, times, names, **kwargs ):
+
+    filename = str ( tmp_path / 'rec.evt' )
+    with open ( filename, 'wb' ) as fid:
+        fid.write ( synthetic.build_evt ( times, names, **kwargs ) )
+    return filename
+
+
+
+# The table has the same events as the original parser.
+def test_reference ( tmp_path ):
+
+    times    = 1.6e9 + numpy.sort ( numpy.random.default_rng ( 1 ).uniform ( 0, 600, 300 ) )
+    names    = [ 'T%i' % ( eindex % 5 ) for eindex in range ( 300 ) ]
+    eclasses = [ classes [ eindex % 2 ] for eindex in range ( 300 ) ]
+    filename = write_evt ( tmp_path, times, names, classes = eclasses )
+
+    table    = eep.read_evt ( filename )
+    expect   = eep_reference.read_evt ( filename )
+    assert len ( table ) == len ( expect ) == 300
+    for event, ( _, row ) in zip ( expect, table.iterrows () ):
+        for field in ( 'id', 'uname', 'name', 'type', 'state', 'original', 'duration', 'offset', 'time', 'epoch_desc' ):
+            assert row [ field ] == event [ 'event' ] [ field ]
+        assert row [ 'event_class' ] == event [ 'event' ] [ 'class' ]
+        assert row [ 'description' ] == event [ 'description' ]
+        chaninfo = event [ 'chaninfo' ] or { 'active': '', 'ref': '' }
+        assert ( row [ 'active' ], row [ 'ref' ] ) == ( chaninfo [ 'active' ], chaninfo [ 'ref' ] )
+        assert ( row [ 'show_amplitude' ], row [ 'show_duration' ] ) == ( event [ 'show_amplitude' ], event [ 'show_duration' ] )
+    assert list ( table [ 'class' ] ) == [ 'marker', 'epoch' ] * 150
+
+
+
+# The clinical classes are read as markers.
+@pytest.mark.parametrize ( 'eclass', classes [ 2: ] )
+def test_clinical_classes ( tmp_path, eclass ):
+
+    times    = 1.6e9 + numpy.arange ( 4 )
+    filename = write_evt ( tmp_path, times, [ 'A', 'B', 'C', 'D' ], classes = [ classes [0], eclass, classes [1], eclass ] )
+
+    table    = eep.read_evt ( filename )
+    assert list ( table [ 'class' ] ) == [ 'marker', eep.evtclasses [ eclass ], 'epoch', eep.evtclasses [ eclass ] ]
+    assert list ( table [ 'event_class' ] ) == [ classes [0], eclass, classes [1], eclass ]
+    assert list ( table [ 'description' ] ) == [ 'A', 'B', 'C', 'D' ]
+    numpy.testing.assert_allclose ( table [ 'time' ], times )
+
+    # Extra fields after a clinical event are not silently ignored.
+    with open ( filename, 'ab' ) as fid:
+        fid.write ( struct.pack ( '<d', 1.0 ) )
+    with pytest.raises ( ValueError, match = 'layout' ):
+        eep.read_evt ( filename )
+
+
+
+# The display flags of the markers depend on the version of the file.
+@pytest.mark.parametrize ( 'version, flags', [ ( 34, ( 0, 0 ) ), ( 35, ( -3, 1 ) ), ( 102, ( 100, 1 ) ), ( 103, ( 100000, 1 ) ) ] )
+def test_versions ( tmp_path, version, flags ):
+
+    times    = 1.6e9 + numpy.arange ( 3 )
+    filename = write_evt ( tmp_path, times, [ 'A', 'B', 'C' ], classes = [ classes [0], classes [1], classes [0] ], version = version, flags = flags )
+
+    table    = eep.read_evt ( filename )
+    assert list ( table [ 'description' ] ) == [ 'A', 'B', 'C' ]
+    assert list ( table [ 'show_amplitude' ] ) == [ flags [0], 0, flags [0] ]
+    assert list ( table [ 'show_duration' ] ) == [ flags [1], 0, flags [1] ]
+    numpy.testing.assert_allclose ( table [ 'time' ], times )
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the FFT filter bank.
+
+"""
+
+import numpy
+
+import synthetic
+from embrace_eep import eep
+from embrace_eep import filterbank
+
+
+# Defines the bands.
+bands    = [ ( 1, 4 ), ( 4, 8 ), ( 8, 12 ), ( 30, 45 ) ]
+
+
+# The blocks give the linear convolution with the kernel, whatever their length.
+def test_blocks_match_convolution ():
+
+    rng      = numpy.random.default_rng ( 0 )
+    data     = rng.standard_normal ( ( 12000, 2 ) )
+
+    # Filters the data with blocks of several lengths.
+    outputs  = [ filterbank.FilterBank ( bands, 500, block_samples = length ).apply ( data ) for length in ( None, 3000, 20000 ) ]
+    for output in outputs [ 1: ]:
+        numpy.testing.assert_allclose ( output, outputs [0], rtol = 0, atol = 1e-12 * numpy.abs ( outputs [0] ).max () )
+
+    # Compares with the direct convolution.
+    fbank    = filterbank.FilterBank ( bands, 500 )
+    for kernel, output in zip ( fbank.kernel, outputs [0] ):
+        expect   = numpy.stack ( [ numpy.convolve ( data [ :, cindex ], kernel ) [ fbank.pad: fbank.pad + len ( data ) ] for cindex in range ( 2 ) ], axis = 1 )
+        numpy.testing.assert_allclose ( output, expect, rtol = 0, atol = 1e-12 * numpy.abs ( expect ).max () )
+
+
+
+# The kernels are zero-phase band-pass filters with the Hilbert transform.
+def test_band_response ():
+
+    # Filters a 10 Hz sine.
+    time     = numpy.arange ( 20000 ) / 500
+    sine     = numpy.sin ( 2 * numpy.pi * 10 * time ) [ :, None ]
+    analytic = filterbank.FilterBank ( bands, 500 ).apply ( sine ) [ :, 5000: -5000, 0 ]
+
+    # Only the alpha band keeps the sine, with its amplitude and phase.
+    numpy.testing.assert_allclose ( numpy.abs ( analytic ).mean ( axis = 1 ), [ 0, 0, 1, 0 ], atol = 5e-3 )
+    numpy.testing.assert_allclose ( analytic [2].real, sine [ 5000: -5000, 0 ], atol = 1e-6 )
+    numpy.testing.assert_allclose ( analytic [2].imag, - numpy.cos ( 2 * numpy.pi * 10 * time [ 5000: -5000 ] ), atol = 1e-6 )
+
+
+
+# The blocks read from a file match the filtering of the whole file.
+def test_iter_cnt ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 4, duration = 40 )
+
+    fbank    = filterbank.FilterBank ( bands [ 2: ], 500, block_samples = 2000 )
+    onsets, blocks = zip ( *fbank.iter_cnt ( filename, 1000, 15000, picks = [ 1, 3 ] ) )
+    output   = numpy.concatenate ( blocks, axis = 1 )
+    assert onsets [0] == 1000 and output.shape == ( 2, 14000, 2 )
+
+    expect   = fbank.apply ( eep.read_data ( filename ) [ :, [ 1, 3 ] ] ) [ :, 1000: 15000 ]
+    numpy.testing.assert_allclose ( output, expect, rtol = 0, atol = 1e-9 * numpy.abs ( expect ).max () )
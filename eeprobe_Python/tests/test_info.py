@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the parser of the file information: header, segments and events.
+
+"""
+
+import numpy
+
+import eep_reference
+import synthetic
+from embrace_eep import eep
+
+
+# Lists the fields of the events.
+fields   = ( 'type', 'onset', 'sample', 'value', 'duration', 'description', 'timestamp' )
+
+
+# The events match the original parser, with several segments.
+def test_events_reference ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 4, duration = 120, nsegment = 5, event_rate = 5 )
+
+    events   = eep.read_info ( filename ) [ 'events' ]
+    expect   = eep_reference.read_info ( filename ) [ 'events' ]
+    assert len ( events ) == len ( expect ) == 605
+    for field in fields:
+        assert list ( events [ field ] ) == [ event [ field ] for event in expect ], field
+
+
+
+# Events before the first segment, on the segment onsets and at the same
+# time are assigned and sorted as documented.
+def test_events_edge_cases ( tmp_path ):
+
+    # Writes a file with two segments (the second one after a pause).
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 2, duration = 20, nsegment = 2, event_rate = 0 )
+    info     = eep.read_info ( filename )
+    stimes   = info [ 'segments' ].start_time.to_numpy ()
+    bound    = info [ 'segments' ].start_sample [1]
+    assert bound == 5000 and stimes [1] - stimes [0] == 20
+
+    # Writes the events: before the recording (with and without tolerance),
+    # on the onset of the second segment, twice at the same time, and in the
+    # pause, just before the second segment.
+    times    = [ stimes [0] - 0.5, stimes [0] - 2.0, stimes [1], stimes [0] + 3.0, stimes [0] + 3.0, stimes [1] - 0.5 ]
+    names    = [ 'A', 'B', 'C', 'D', 'E', 'F' ]
+    with open ( filename [ :-4 ] + '.evt', 'wb' ) as fid:
+        fid.write ( synthetic.build_evt ( times, names ) )
+
+    # Builds the expected table, sorted by onset. The segment onsets
+    # precede the events at the same onset, and the events at the same onset
+    # keep their order in the file.
+    events   = eep.read_info ( filename ) [ 'events' ]
+    assert list ( events [ 'type' ] ) == [ 'B', 'A', 'Segment', 'D', 'E', 'F', 'Segment', 'C' ]
+    assert list ( events [ 'sample' ] ) == [ -1000, -250, 0, 1500, 1500, bound - 250, bound, bound ]
+    numpy.testing.assert_allclose ( events [ 'onset' ], [ -2, -0.5, 0, 3, 3, 9.5, 10, 10 ], atol = 1e-6 )
+    numpy.testing.assert_allclose ( events [ 'timestamp' ], [ times [1], times [0], stimes [0], times [3], times [4], times [5], stimes [1], times [2] ] )
+    assert list ( events [ 'description' ] ) == [ 'B', 'A', 'New segment', 'D', 'E', 'F', 'New segment', 'C' ]
+
+
+
+# The header matches the original parser.
+def test_header_reference ( tmp_path ):
+
+    # Writes a synthetic file and a copy with the optional fields, and a
+    # channel without reference.
+    source   = str ( tmp_path / 'source.cnt' )
+    synthetic.make_cnt ( source, nchan = 6, duration = 5 )
+    info     = eep.read_info ( source )
+    info [ 'channels' ] = info [ 'channels' ].copy ()
+    info [ 'channels' ].loc [ 5, 'reference' ] = None
+    info.update ( hardware_id = 'Amplifier 1', subject_name = 'Subject', subject_birth = '2000-01-01' )
+    target   = str ( tmp_path / 'target.cnt' )
+    eep.write_cnt ( target, eep.read_data ( source, raw_int32 = True ) [0], info )
+
+    for filename in ( source, target ):
+        header   = eep.read_info ( filename )
+        expect   = eep_reference.read_info ( filename )
+        for key in ( 'file_version', 'sample_rate', 'sample_count', 'channel_count', 'acquisition_time', 'software_id', 'hardware_id', 'subject_name', 'subject_birth' ):
+            assert header.get ( key ) == expect.get ( key ), key
+        for column in ( 'label', 'calibration', 'unit', 'reference' ):
+            assert list ( header [ 'channels' ] [ column ] ) == list ( expect [ 'channels' ] [ column ] ), column
+
+    assert header [ 'hardware_id' ] == 'Amplifier 1' and header [ 'channels' ] [ 'reference' ] [5] is None
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the memoized file index and information.
+
+"""
+
+import gc
+import os
+
+import numpy
+
+import synthetic
+from embrace_eep import eep
+
+
+# Function to list the leaf chunks of a RIFF tree.
+def list_leaves ( tree ):
+
+    if tree [ 'children' ]:
+        return [ leaf for child in tree [ 'children' ] for leaf in list_leaves ( child ) ]
+    return [ tree ]
+
+
+
+# The memoized index keeps no memory map (nor open file) alive.
+def test_index_holds_no_mapping ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 4, duration = 10 )
+    eep.clear_memo ()
+
+    # Reads the file, and drops the open file.
+    data     = eep.read_data ( filename )
+    gc.collect ()
+
+    index    = eep.read_index ( filename )
+    assert all ( leaf [ 'data' ] is None for leaf in list_leaves ( index ) )
+    assert not any ( isinstance ( value, numpy.memmap ) for value in eep.load_info ( filename ).values () )
+
+    # The mapped tree has the same chunks.
+    tree     = eep.read_tree ( filename )
+    assert [ len ( leaf [ 'data' ] ) for leaf in list_leaves ( tree ) ] == [ leaf [ 'length' ] for leaf in list_leaves ( index ) ]
+    assert data.shape == ( eep.read_info ( filename ) [ 'sample_count' ], 4 )
+
+
+
+# A file just read can be overwritten, and is read again afterwards.
+def test_overwrite_read_file ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 4, duration = 10 )
+    info     = eep.read_info ( filename )
+    data, _  = eep.read_data ( filename, raw_int32 = True )
+
+    # Overwrites the file with a shorter recording.
+    eep.write_cnt ( filename, data [ :2000 ], info )
+    assert eep.read_info ( filename ) [ 'sample_count' ] == 2000
+    numpy.testing.assert_array_equal ( eep.read_data ( filename, raw_int32 = True ) [0], data [ :2000 ] )
+
+    # Removes the file.
+    os.remove ( filename )
+    assert not os.path.exists ( filename )
+
+
+
+# A file modified on disk is read again.
+def test_invalidation_on_change ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 4, duration = 10, seed = 1 )
+    eep.clear_memo ()
+
+    # Reads the file twice: the second read is a hit.
+    first    = eep.read_data ( filename )
+    hits     = eep.read_index.cache_info () [ 'hits' ]
+    numpy.testing.assert_array_equal ( eep.read_data ( filename ), first )
+    assert eep.read_index.cache_info () [ 'hits' ] > hits
+
+    # Writes a different file with the same name and a new time stamp.
+    synthetic.make_cnt ( filename, nchan = 4, duration = 12, seed = 2 )
+    stat     = os.stat ( filename )
+    os.utime ( filename, ns = ( stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9 ) )
+
+    second   = eep.read_data ( filename )
+    assert second.shape [0] == eep.read_info ( filename ) [ 'sample_count' ]
+    assert second.shape != first.shape
+
+
+
+# The information returned to the caller does not share the memoized tables.
+def test_info_is_a_copy ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 4, duration = 10, event_rate = 2, seed = 1 )
+    eep.clear_memo ()
+
+    # Modifies every table of the returned information.
+    info     = eep.read_info ( filename )
+    labels   = list ( info [ 'channels' ] [ 'label' ] )
+    onsets   = info [ 'events' ] [ 'onset' ].copy ()
+    info [ 'channels' ].loc [ 0, 'label' ] = 'XX'
+    info [ 'segments' ].loc [ 0, 'start_time' ] = -1
+    info [ 'events' ] [ 'onset' ] += 100
+    info [ 'events' ] [0] [ 'type' ] = 'XX'
+    info [ 'sample_rate' ] = 1
+
+    # Reads the information again.
+    again    = eep.read_info ( filename )
+    assert list ( again [ 'channels' ] [ 'label' ] ) == labels
+    assert again [ 'segments' ] [ 'start_time' ] [0] != -1
+    numpy.testing.assert_array_equal ( again [ 'events' ] [ 'onset' ], onsets )
+    assert again [ 'events' ] [0] [ 'type' ] != 'XX'
+    assert again [ 'sample_rate' ] == 500
+    assert eep.open_cnt ( filename ).info [ 'channels' ] [ 'label' ] [0] == labels [0]
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the optional instrumentation of the reader.
+
+"""
+
+import threading
+
+import numpy
+
+import synthetic
+from embrace_eep import eep
+from embrace_eep.tools import profiling
+
+
+# The reader records its spans and counters under profile ().
+def test_reader ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 8, duration = 10, epoch_length = 500 )
+    eep.clear_memo ()
+    records  = []
+
+    # Reads the first three channels of the whole file.
+    with profiling.profile ( callback = records.append ) as profiler:
+        data     = eep.read_data ( filename, picks = [ 0, 1, 2 ] )
+    summary  = profiler.summary ()
+    counters = summary [ 'counters' ]
+    assert profiling.active is None
+
+    # Checks the spans, and that the callback got every record.
+    assert 'read_data' in summary [ 'spans' ]
+    assert any ( path.startswith ( 'read_data/' ) and path.endswith ( '/decode' ) for path in summary [ 'spans' ] )
+    assert sum ( record [ 'type' ] == 'span' for record in records ) == len ( profiler.spans )
+
+    # The decoded samples are those of the channels read.
+    rawdata  = eep.open_cnt ( filename ).rawdata
+    assert counters [ 'raw3.epochs_decoded' ] == 10
+    assert counters [ 'raw3.samples_decoded' ] == 5000 * 3
+
+    # The compression ratio uses all the channels of the whole epochs.
+    assert counters [ 'raw3.epoch_samples' ] == 5000 * 8
+    assert counters [ 'raw3.epoch_bits' ] == 8 * ( len ( rawdata [ 'data' ] ) - rawdata [ 'epoch_start' ] [0] )
+    assert counters [ 'raw3.bits_per_sample' ] == counters [ 'raw3.epoch_bits' ] / ( 5000 * 8 )
+    assert 0 < counters [ 'raw3.bits_per_sample' ] < 32
+
+    # Counts the allocation of the output.
+    assert counters [ 'allocations' ] >= 1
+    assert counters [ 'bytes_allocated' ] >= data.nbytes
+
+
+
+# Nested spans are recorded with their path, and each thread has its own stack.
+def test_nested_spans ():
+
+    barrier  = threading.Barrier ( 2 )
+
+    # Function to open two nested spans, waiting for the other thread inside.
+    def work ( profiler, name ):
+        with profiler.span ( name ):
+            with profiler.span ( 'inner' ):
+                barrier.wait ()
+
+    with profiling.profile () as profiler:
+        with profiler.span ( 'outer' ):
+            profiling.count ( 'items', 2 )
+            profiling.count ( 'items' )
+        threads  = [ threading.Thread ( target = work, args = ( profiler, name ) ) for name in ( 'first', 'second' ) ]
+        for thread in threads:
+            thread.start ()
+        for thread in threads:
+            thread.join ()
+
+    # The spans of each thread do not mix.
+    summary  = profiler.summary ()
+    assert set ( summary [ 'spans' ] ) == { 'outer', 'first', 'first/inner', 'second', 'second/inner' }
+    assert all ( entry [ 'calls' ] == 1 for entry in summary [ 'spans' ].values () )
+    assert summary [ 'counters' ] == { 'items': 3 }
+
+    threads  = { record [ 'path' ]: record [ 'thread' ] for record in profiler.spans }
+    assert threads [ 'first' ] == threads [ 'first/inner' ] != threads [ 'second' ] == threads [ 'second/inner' ]
+
+
+
+# Without an active profiler nothing is recorded.
+def test_disabled ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 4, duration = 5 )
+
+    # Enables and disables a profiler, and then reads the file.
+    profiler = profiling.enable ()
+    profiling.disable ()
+    assert profiling.get_profiler () is None
+    data     = eep.read_data ( filename )
+    profiling.count ( 'items' )
+    profiling.allocated ( data.nbytes )
+
+    assert profiler.spans == [] and profiler.summary () == { 'spans': {}, 'counters': {} }
+
+    # A profiler nested in another one is restored on exit.
+    with profiling.profile () as outer:
+        with profiling.profile () as inner:
+            eep.read_data ( filename, picks = [0] )
+        assert profiling.active is outer
+        numpy.testing.assert_array_equal ( eep.read_data ( filename, picks = [0] ), data [ :, :1 ] )
+    assert inner.counters [ 'raw3.epochs_decoded' ] > 0
+    assert outer.counters [ 'raw3.epochs_decoded' ] > 0
+    assert profiling.active is None
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the raw3 decoder, against the reference (original) decoder.
+
+"""
+
+import numpy
+import pytest
+
+import raw3_reference
+import synthetic
+from embrace_eep import raweep
+
+
+# Function to decode a block with the streaming decoder.
+def read_block ( byte, nsamp, nchan, offset = 0 ):
+
+    data, offset = raweep.read_block ( byte, nsamp, nchan, offset )
+    return numpy.frombuffer ( data, dtype = 'int32' ).reshape ( nchan, nsamp ), offset
+
+
+
+# Function to build a channel from its fields: method, nbit, xbit, first
+# sample and the residual fields, as ( value, length ) pairs.
+def build_channel ( method, nbit, xbit, first, residuals ):
+
+    # Gets the length of the data and metadata.
+    mbit     = 6 if method & 8 else 4
+    dbit     = 32 if method & 8 else 16
+
+    # Builds the fields, padded to a byte boundary.
+    values   = [ method, nbit, xbit, first ] + [ value for value, _ in residuals ]
+    lengths  = [ 4, mbit, mbit, dbit ] + [ length for _, length in residuals ]
+    values.append ( 0 )
+    lengths.append ( -sum ( lengths ) % 8 )
+
+    return values, lengths
+
+
+
+# Residuals equal to the escape value are plain residuals if xbit is zero
+# or equal to nbit (as in the original decoder).
+@pytest.mark.parametrize ( 'method, nbit, xbit', [ ( 1, 4, 0 ), ( 1, 4, 4 ), ( 2, 5, 0 ), ( 9, 6, 0 ), ( 10, 7, 7 ) ] )
+def test_escape_value_without_extended_residuals ( method, nbit, xbit ):
+
+    # Builds a channel with residuals equal to the escape value.
+    escape   = - 2 ** ( nbit - 1 )
+    residual = [ 3, escape, 1, escape, escape, 2 ]
+    values, lengths = build_channel ( method, nbit, xbit, 100, [ ( value, nbit ) for value in residual ] )
+    byte     = synthetic.pack_fields ( values, lengths ) + bytes ( 8 )
+
+    # Decodes the channel with both decoders.
+    data, offset = read_block ( byte, len ( residual ) + 1, 1 )
+    expect, eoffset = raw3_reference.read_block ( byte, len ( residual ) + 1, 1 )
+
+    numpy.testing.assert_array_equal ( data, expect )
+    assert offset == eoffset
+    if method & 7 == 1:
+        numpy.testing.assert_array_equal ( data [0], 100 + numpy.cumsum ( [ 0 ] + residual ) )
+
+
+
+# Residuals equal to the escape value are followed by xbit bits otherwise.
+def test_escape_value_with_extended_residuals ():
+
+    # Builds a channel with two extended residuals.
+    residuals = [ ( 3, 4 ), ( -8, 4 ), ( 1000, 12 ), ( -2, 4 ), ( -8, 4 ), ( -8, 12 ) ]
+    values, lengths = build_channel ( 1, 4, 12, -5, residuals )
+    byte     = synthetic.pack_fields ( values, lengths ) + bytes ( 8 )
+
+    # Decodes the channel with both decoders.
+    data, _  = read_block ( byte, 5, 1 )
+    expect, _ = raw3_reference.read_block ( byte, 5, 1 )
+
+    numpy.testing.assert_array_equal ( data, expect )
+    numpy.testing.assert_array_equal ( data [0], [ -5, -2, 998, 996, 988 ] )
+
+
+
+# Random blocks with any combination of residual lengths.
+def test_random_blocks ():
+
+    rng      = numpy.random.default_rng ( 7 )
+    for _ in range ( 200 ):
+
+        # Gets the dimensions of the block.
+        nsamp    = int ( rng.integers ( 1, 40 ) )
+        nchan    = int ( rng.integers ( 1, 5 ) )
+
+        # Builds each channel with random lengths, including xbit zero and
+        # equal to nbit, and residuals that may be the escape value.
+        values   = []
+        lengths  = []
+        for cindex in range ( nchan ):
+            method   = int ( rng.choice ( [ 1, 2, 3, 9, 10, 11 ] if cindex else [ 1, 2, 9, 10 ] ) )
+            nbit     = int ( rng.integers ( 1, 16 ) )
+            xbit     = int ( rng.choice ( [ 0, nbit, rng.integers ( nbit, 16 ) ] ) )
+            residuals = []
+            for _ in range ( nsamp - 1 ):
+                value    = int ( rng.integers ( - 2 ** ( nbit - 1 ), 2 ** ( nbit - 1 ) ) )
+                residuals.append ( ( value, nbit ) )
+                if xbit and xbit != nbit and value == - 2 ** ( nbit - 1 ):
+                    residuals.append ( ( int ( rng.integers ( - 2 ** ( xbit - 1 ), 2 ** ( xbit - 1 ) ) ), xbit ) )
+            fields   = build_channel ( method, nbit, xbit, int ( rng.integers ( -3000, 3000 ) ), residuals )
+            values  += fields [0]
+            lengths += fields [1]
+
+        byte     = synthetic.pack_fields ( values, lengths ) + bytes ( 8 )
+
+        # Decodes the block with both decoders.
+        data, offset = read_block ( byte, nsamp, nchan )
+        expect, eoffset = raw3_reference.read_block ( byte, nsamp, nchan )
+        numpy.testing.assert_array_equal ( data, expect )
+        assert offset == eoffset
+
+
+
+# Blocks from the synthetic generator, with all the methods.
+def test_synthetic_blocks ():
+
+    rng      = numpy.random.default_rng ( 3 )
+    for _ in range ( 20 ):
+        block    = numpy.cumsum ( rng.normal ( 0, 200, ( 6, 50 ) ), axis = 1 ).astype ( 'int32' )
+        byte     = synthetic.encode_epoch ( block, rng.choice ( [ 0, 1, 2, 3, 8, 9, 10, 11 ], 6 ) ) + bytes ( 8 )
+
+        data, _  = read_block ( byte, 50, 6 )
+        numpy.testing.assert_array_equal ( data, block )
+        numpy.testing.assert_array_equal ( raw3_reference.read_block ( byte, 50, 6 ) [0], block )
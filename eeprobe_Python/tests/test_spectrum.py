@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the power spectrum by condition.
+
+"""
+
+import numpy
+import pytest
+import scipy.signal
+
+import synthetic
+from embrace_eep import eep
+from embrace_eep import spectrum
+
+
+# Welch's estimate matches scipy.signal.welch, whatever the length of the chunks.
+@pytest.mark.parametrize ( 'chunk_samples', [ None, 1700, 100000 ] )
+def test_welch ( tmp_path, chunk_samples ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 4, duration = 30 )
+    data     = eep.read_data ( filename, units = 'uV' )
+
+    table, freqs, psds = spectrum.compute_psd ( filename, units = 'uV', chunk_samples = chunk_samples, return_psd = True )
+    efreqs, expect = scipy.signal.welch ( data, 500, nperseg = 1000, noverlap = 500, axis = 0 )
+    numpy.testing.assert_allclose ( freqs, efreqs )
+    numpy.testing.assert_allclose ( psds [ 'all' ], expect.T, rtol = 1e-10 )
+
+    # Checks the band power.
+    assert list ( table [ 'condition' ] ) == [ 'all' ] * 4 and list ( table [ 'nave' ] ) == [ 29 ] * 4
+    alpha    = ( freqs >= 8 ) & ( freqs < 13 )
+    numpy.testing.assert_allclose ( table [ 'alpha' ], expect [ alpha ].sum ( axis = 0 ) * 0.5, rtol = 1e-10 )
+
+
+
+# Each condition averages the segments of the windows of its events.
+def test_conditions ( tmp_path ):
+
+    filename = str ( tmp_path / 'rec.cnt' )
+    synthetic.make_cnt ( filename, nchan = 2, duration = 60, nsegment = 2, event_rate = 1 )
+    info     = eep.read_info ( filename )
+    data     = eep.read_data ( filename )
+
+    conditions = { 'odd': [ 'T1', 'T3' ], 'even': 'T2' }
+    _, _, psds = spectrum.compute_psd ( filename, conditions, 0, 1.5, window_seconds = 0.5, overlap = 0, return_psd = True )
+    windows  = spectrum.get_windows ( info, conditions, 0, 1.5 )
+    assert sorted ( psds ) == [ 'even', 'odd' ] and all ( 0 < stop - start <= 750 for _, start, stop in windows )
+
+    # Averages the spectra of the segments of the windows of each condition.
+    for condition in conditions:
+        segments = [ data [ first: first + 250 ] for cond, start, stop in windows if cond == condition for first in range ( start, stop - 249, 250 ) ]
+        expect   = numpy.mean ( [ scipy.signal.welch ( segment, 500, nperseg = 250, axis = 0 ) [1] for segment in segments ], axis = 0 )
+        numpy.testing.assert_allclose ( psds [ condition ], expect.T, rtol = 1e-10 )
+
+
+
+# The multitaper density integrates to the variance of white noise.
+def test_multitaper ():
+
+    rng      = numpy.random.default_rng ( 2 )
+    noise    = rng.normal ( 0, 3, ( 100000, 2 ) )
+
+    estimator = spectrum.Periodogram ( 250, 500, 'multitaper', overlap = 0 )
+    power, nseg = estimator.get_power ( noise )
+    assert nseg == 200 and len ( estimator.tapers ) >= 6
+    numpy.testing.assert_allclose ( power.sum ( axis = 1 ) / nseg * 0.5, 9, rtol = 0.02 )
+
+    with pytest.raises ( ValueError ):
+        spectrum.Periodogram ( 250, 500, 'periodogram' )
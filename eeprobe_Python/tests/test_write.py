@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the raw3 encoder and of write_cnt.
+
+"""
+
+import numpy
+import pytest
+
+import synthetic
+from embrace_eep import eep
+from embrace_eep import raweep
+
+
+# Encoded blocks decode back into the same data.
+def test_encoder_round_trip ():
+
+    rng      = numpy.random.default_rng ( 5 )
+    for _ in range ( 100 ):
+
+        # Gets random data, from smooth to full-range 32-bit values.
+        nsamp    = int ( rng.integers ( 1, 300 ) )
+        nchan    = int ( rng.integers ( 1, 8 ) )
+        width    = float ( rng.choice ( [ 10, 1e3, 1e6, 2e9 ] ) )
+        block    = numpy.cumsum ( rng.normal ( 0, width / 100, ( nchan, nsamp ) ), axis = 1 )
+        block    = numpy.clip ( block, -width, width ).astype ( 'int32' )
+
+        encoded  = raweep.write_block ( block.tobytes (), nsamp, nchan )
+        data, offset = raweep.read_block ( encoded + bytes ( 8 ), nsamp, nchan, 0 )
+        numpy.testing.assert_array_equal ( numpy.frombuffer ( data, dtype = 'int32' ).reshape ( nchan, nsamp ), block )
+        assert offset == 8 * len ( encoded )
+
+
+
+# Files written by write_cnt are read back with the same data and events.
+@pytest.mark.parametrize ( 'rf64', [ False, True ] )
+def test_write_cnt_round_trip ( tmp_path, rf64 ):
+
+    # Writes a synthetic file with three segments.
+    source   = str ( tmp_path / 'source.cnt' )
+    synthetic.make_cnt ( source, nchan = 8, duration = 30, nsegment = 3, event_rate = 2 )
+    info     = eep.read_info ( source )
+    data, _  = eep.read_data ( source, raw_int32 = True )
+
+    # Writes the integer data and reads it back.
+    target   = str ( tmp_path / 'target.cnt' )
+    eep.write_cnt ( target, data, info, epoch_length = 300, rf64 = rf64 )
+    numpy.testing.assert_array_equal ( eep.read_data ( target, raw_int32 = True ) [0], data )
+
+    # Checks the header, segments and events.
+    copy     = eep.read_info ( target )
+    assert copy [ 'sample_count' ] == info [ 'sample_count' ]
+    assert list ( copy [ 'channels' ] [ 'label' ] ) == list ( info [ 'channels' ] [ 'label' ] )
+    numpy.testing.assert_array_equal ( copy [ 'segments' ].sample_count, info [ 'segments' ].sample_count )
+    numpy.testing.assert_array_equal ( copy [ 'events' ] [ 'sample' ], info [ 'events' ] [ 'sample' ] )
+    assert list ( copy [ 'events' ] [ 'type' ] ) == list ( info [ 'events' ] [ 'type' ] )
+
+    # Writes the calibrated data and reads it back.
+    eep.write_cnt ( target, eep.read_data ( source, units = 'uV' ), info, units = 'uV', rf64 = rf64 )
+    numpy.testing.assert_array_equal ( eep.read_data ( target, raw_int32 = True ) [0], data )
+
+
+
+# The segments must cover exactly the data written.
+def test_write_cnt_segments_mismatch ( tmp_path ):
+
+    source   = str ( tmp_path / 'source.cnt' )
+    synthetic.make_cnt ( source, nchan = 4, duration = 20, nsegment = 2 )
+    info     = eep.read_info ( source )
+    data     = eep.read_data ( source )
+
+    with pytest.raises ( ValueError, match = 'segments' ):
+        eep.write_cnt ( str ( tmp_path / 'target.cnt' ), data [ :-100 ], info )
+
+
+
+# The events after the end of the (cropped) data are dropped.
+def test_write_cnt_crop_events ( tmp_path ):
+
+    source   = str ( tmp_path / 'source.cnt' )
+    synthetic.make_cnt ( source, nchan = 4, duration = 20, event_rate = 2 )
+    info     = eep.read_info ( source )
+    data     = eep.read_data ( source )
+
+    # Crops the data to the first half (a single segment is implicit).
+    target   = str ( tmp_path / 'target.cnt' )
+    eep.write_cnt ( target, data [ :5000 ], info )
+
+    events   = eep.read_info ( target ) [ 'events' ]
+    assert len ( events ) > 1
+    assert events [ 'sample' ].max () < 5000
+    numpy.testing.assert_allclose ( eep.read_data ( target ), data [ :5000 ], rtol = 1e-9 )
+
+
+
+# Invalid inputs raise a ValueError, not a memory error.
+def test_encoder_invalid_input ():
+
+    with pytest.raises ( ValueError ):
+        raweep.write_block ( bytes ( 10 ), 3, 1 )
+    with pytest.raises ( ValueError ):
+        raweep.write_blocks ( numpy.zeros ( ( 10, 2 ), dtype = 'float64' ), 5 )
+    with pytest.raises ( ValueError ):
+        raweep.write_blocks ( numpy.zeros ( ( 10, 2 ), dtype = 'int32' ), 0 )
+
+    # Strided inputs are encoded as their values.
+    data     = numpy.arange ( 40, dtype = 'int32' ).reshape ( 10, 4 ) [ :, ::2 ]
+    stream, offsets = raweep.write_blocks ( data, 4 )
+    assert len ( numpy.frombuffer ( offsets, dtype = 'uint64' ) ) == 3
+    first, _ = raweep.read_block ( stream + bytes ( 8 ), 4, 2, 0 )
+    numpy.testing.assert_array_equal ( numpy.frombuffer ( first, dtype = 'int32' ).reshape ( 2, 4 ), data [ :4 ].T )